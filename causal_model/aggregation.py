@@ -0,0 +1,182 @@
+from causal_model.causal_process_structure import CPM_Categorical_Attribute
+from utils.validators import validate_condition
+
+
+class AggregationSelection:
+
+    def __init__(self):
+        """
+        An aggregation selection specifies which observations of an attribute across cases
+        are taken into account by an aggregated dependency. Selections keep bounded state, that is,
+        observations that fall out of the selection are evicted when new observations are made.
+        """
+        pass
+
+    def to_string(self):
+        raise NotImplementedError()
+
+
+class LastKSelection(AggregationSelection):
+
+    def __validate(self):
+        validate_condition(isinstance(self.k, int) and self.k > 0,
+                           "The number of observations to be selected must be a positive integer.")
+
+    def __init__(self, k: int):
+        """
+        Select the last k observations of the attribute in the system (a ring buffer).
+
+        :param k: The number of observations to be selected
+        """
+        super().__init__()
+        self.k = k
+        self.__validate()
+
+    def to_string(self):
+        return "last {0}".format(self.k)
+
+
+class TimeWindowSelection(AggregationSelection):
+
+    def __init__(self, window):
+        """
+        Select all observations of the attribute in the system within a sliding time window.
+
+        :param window: The length of the window, looking back from the current time (a TimeInterval)
+        """
+        super().__init__()
+        self.window = window
+
+    def get_window_seconds(self) -> float:
+        return float(self.window.get_seconds())
+
+    def to_string(self):
+        return "within {0} seconds".format(self.get_window_seconds())
+
+
+class ExponentialDecaySelection(AggregationSelection):
+
+    def __validate(self):
+        validate_condition(self.get_half_life_seconds() > 0,
+                           "The half-life of an exponential decay must be positive.")
+
+    def __init__(self, half_life):
+        """
+        Select all observations of the attribute in the system, weighting each of them by
+        0.5^(age / half_life). Since the weights of all observations decay at the same rate,
+        only the weighted label counts need to be kept.
+        This selection is only supported by the Python simulation.
+
+        :param half_life: The age at which an observation has half its original weight (a TimeInterval)
+        """
+        super().__init__()
+        self.half_life = half_life
+        self.__validate()
+
+    def get_half_life_seconds(self) -> float:
+        return float(self.half_life.get_seconds())
+
+    def to_string(self):
+        return "decaying with half-life {0} seconds".format(self.get_half_life_seconds())
+
+
+class AggregationFunction:
+
+    def __init__(self):
+        """
+        An aggregation function maps the label counts of the selected observations of an attribute
+        to a label of that same attribute, which then parametrizes the valuation of the dependent attribute.
+        """
+        pass
+
+    def validate(self, attribute: CPM_Categorical_Attribute):
+        """
+        Make sure that the aggregation function is well-defined for an attribute.
+
+        :param attribute: The aggregated attribute
+        :raises ValueError: if otherwise
+        """
+        pass
+
+    def aggregate(self, counts: list[float], total: float, attribute: CPM_Categorical_Attribute) -> str:
+        """
+        Compute the aggregated label (the Python counterpart of the SML expression in the CPN).
+
+        :param counts: The (possibly weighted) label counts, ordered as the attribute labels
+        :param total: The total count
+        :param attribute: The aggregated attribute
+        :return: The aggregated label
+        """
+        raise NotImplementedError()
+
+    def to_string(self):
+        raise NotImplementedError()
+
+
+class MajorityAggregation(AggregationFunction):
+
+    def __init__(self, default_label: str = None):
+        """
+        Aggregate to the most frequent label among the selected observations.
+        Ties are resolved in favor of the label listed first.
+
+        :param default_label: The label if nothing is selected. If this is None, the first label is taken.
+        """
+        super().__init__()
+        self.default_label = default_label
+
+    def validate(self, attribute: CPM_Categorical_Attribute):
+        validate_condition(
+            self.default_label is None or self.default_label in attribute.get_labels(),
+            'Default label "{0}" is not a label of attribute "{1}".'.format(self.default_label, attribute.get_id()))
+
+    def get_default_label(self, attribute: CPM_Categorical_Attribute):
+        if self.default_label is None:
+            return attribute.get_labels()[0]
+        return self.default_label
+
+    def aggregate(self, counts: list[float], total: float, attribute: CPM_Categorical_Attribute) -> str:
+        if total <= 0:
+            return self.get_default_label(attribute)
+        return attribute.get_labels()[counts.index(max(counts))]
+
+    def to_string(self):
+        return "majority"
+
+
+class LabelShareAggregation(AggregationFunction):
+
+    def __validate(self):
+        validate_condition(0.0 <= self.threshold <= 1.0,
+                           "The share threshold must be between 0 and 1.")
+
+    def __init__(self, label: str, threshold: float, label_otherwise: str):
+        """
+        Aggregate to some label if its share among the selected observations reaches a threshold,
+        and to another label otherwise (e.g., "High_Delay" if at least half of the selected events
+        were delayed highly, else "No_Delay").
+
+        :param label: The label whose share is computed, and which is the result if the share is high enough
+        :param threshold: The share (between 0 and 1) that needs to be reached
+        :param label_otherwise: The result if the share is below the threshold or nothing is selected
+        """
+        super().__init__()
+        self.label = label
+        self.threshold = threshold
+        self.label_otherwise = label_otherwise
+        self.__validate()
+
+    def validate(self, attribute: CPM_Categorical_Attribute):
+        for label in [self.label, self.label_otherwise]:
+            validate_condition(
+                label in attribute.get_labels(),
+                'Label "{0}" is not a label of attribute "{1}".'.format(label, attribute.get_id()))
+
+    def aggregate(self, counts: list[float], total: float, attribute: CPM_Categorical_Attribute) -> str:
+        label_index = attribute.get_labels().index(self.label)
+        if total > 0 and counts[label_index] >= self.threshold * total:
+            return self.label
+        return self.label_otherwise
+
+    def to_string(self):
+        return "share of {0} >= {1}".format(self.label, self.threshold)
@@ -1,3 +1,4 @@
+from causal_model.aggregation import AggregationSelection, AggregationFunction
 from causal_model.causal_process_structure import CausalProcessStructure, AttributeRelation, CPM_Attribute
 from causal_model.valuation import AttributeValuation
 from utils.validators import validate_condition
@@ -18,16 +19,24 @@ class AggregationSelections:
         validate_condition(
             all(isinstance(r, AttributeRelation) for r in self.__relations))
         validate_condition(
-            all(isinstance(r, StandardMLCode) for r in self.__selections))
+            all(isinstance(s, AggregationSelection) for s in self.__selections))
 
-    def __init__(self, relationsToSelection: dict):
+    def __init__(self, relationsToSelection: dict[AttributeRelation, AggregationSelection]):
+        """
+        This class prescribes an aggregation selection for each aggregated dependency in a causal model.
+        :param relationsToSelection: a map from aggregated relation to an AggregationSelection
+        """
         self.__relations = list(relationsToSelection.keys())
         self.__selections = list(relationsToSelection.values())
         self.relationsToSelection = relationsToSelection
+        self.__validate()
 
     def get_relations(self):
         return self.__relations
 
+    def get_selection(self, relation: AttributeRelation) -> AggregationSelection:
+        return self.relationsToSelection[relation]
+
 
 class AggregationFunctions:
 
@@ -35,16 +44,24 @@ class AggregationFunctions:
         validate_condition(
             all(isinstance(r, AttributeRelation) for r in self.__relations))
         validate_condition(
-            all(isinstance(r, StandardMLCode) for r in self.__aggregations))
+            all(isinstance(f, AggregationFunction) for f in self.__aggregations))
 
-    def __init__(self, relationsToAggregation: dict):
+    def __init__(self, relationsToAggregation: dict[AttributeRelation, AggregationFunction]):
+        """
+        This class prescribes an aggregation function for each aggregated dependency in a causal model.
+        :param relationsToAggregation: a map from aggregated relation to an AggregationFunction
+        """
         self.__relations = list(relationsToAggregation.keys())
         self.__aggregations = list(relationsToAggregation.values())
-        self.relationsToSelection = relationsToAggregation
+        self.relationsToAggregation = relationsToAggregation
+        self.__validate()
 
     def get_relations(self):
         return self.__relations
 
+    def get_function(self, relation: AttributeRelation) -> AggregationFunction:
+        return self.relationsToAggregation[relation]
+
 
 class AttributeValuations:
 
@@ -114,6 +131,11 @@ class CausalProcessModel:
             all(r in sagg_relations for r in fagg_relations))
         validate_condition(
             all(r in fagg_relations for r in sagg_relations))
+        validate_condition(
+            all(r in sagg_relations for r in cs_aggregated_relations),
+            "There are aggregated relations without aggregation selection and function.")
+        for r in fagg_relations:
+            self.__Fagg.get_function(r).validate(r.get_in())
         relations_in_causal_structure = self.__CS.get_relations()
         for attribute_id in self.__V.get_attribute_ids():
             valuation = self.__V.get_attribute_valuation(attribute_id)
@@ -151,6 +173,9 @@ class CausalProcessModel:
         self.__V = V
         self.__validate()
 
+    def get_causal_structure(self):
+        return self.__CS
+
     def get_aggregation_selection(self):
         return self.__Sagg
 
@@ -206,6 +231,12 @@ class CausalProcessModel:
     def get_preset(self, attribute_id) -> list[AttributeRelation]:
         return self.__CS.get_preset(attribute_id)
 
+    def get_aggregated_preset(self, attribute_id) -> list[AttributeRelation]:
+        return self.__CS.get_aggregated_preset(attribute_id)
+
+    def get_aggregated_relations(self) -> list[AttributeRelation]:
+        return self.__CS.get_aggregated_relations()
+
     def get_attributes_for_activity_id(self, act_id):
         return self.__CS.get_attributes_for_activity_id(act_id)
 
@@ -213,6 +213,11 @@ class CausalProcessStructure:
                     self.__attributeActivities.get_activity_for_attribute_id(r.get_out().get_id())
             ) for r in non_aggregated_relations),
             "There are non-aggregated causality between attributes at the same events.")
+        # an attribute is either aggregated or not when valuating another attribute
+        validate_condition(
+            all(not self.has_relation(r.get_in().get_id(), r.get_out().get_id(), is_aggregated=True)
+                for r in non_aggregated_relations),
+            "There are attributes that have both an aggregated and a non-aggregated dependency to the same attribute.")
 
     def __validate(self):
         self.__validate_attributes()
@@ -319,6 +324,12 @@ class CausalProcessStructure:
         preset = filter(lambda r: r.get_out().get_id() == attribute_id, relations)
         return list(preset)
 
+    def get_aggregated_preset(self, attribute_id):
+        relations = self.get_aggregated_relations()
+        r: AttributeRelation
+        preset = filter(lambda r: r.get_out().get_id() == attribute_id, relations)
+        return list(preset)
+
     def get_attributes_for_activity_id(self, act_id):
         attr_ids = self.__attributeActivities.get_attribute_ids_for_activity_id(act_id)
         attributes = [attr for attr in self.__attributes if attr.get_id() in attr_ids]
@@ -0,0 +1,178 @@
+from itertools import combinations
+
+import numpy
+
+from causal_model.causal_process_structure import CausalProcessStructure, CPM_Categorical_Attribute, \
+    CPM_Activity, AttributeActivities, AttributeRelation
+from causal_model.estimation import get_counts
+from utils.math import chi2_survival
+from utils.validators import validate_condition
+
+G_TEST = "g"
+CHI_SQUARE_TEST = "chi2"
+
+
+class ContingencyTableCache:
+
+    def __init__(self, attributes: list[CPM_Categorical_Attribute], case_table: dict[str, numpy.ndarray]):
+        """
+        Memoized contingency tables over the attributes of a case table. A table over a set of attributes
+        is counted once (with one np.bincount), whatever the order in which the attributes are asked for,
+        so that independence tests of the same pair and conditioning set (e.g., from both endpoints of an
+        edge, or at several levels of a search) share it.
+
+        :param attributes: The attributes
+        :param case_table: The codes of each attribute, by attribute id (see estimation.fit_valuations).
+            Cases in which an attribute of a table is missing do not count for that table.
+        """
+        self.__radices = {attr.get_id(): len(attr.get_labels()) for attr in attributes}
+        self.__case_table = case_table
+        self.__tables: dict[tuple, numpy.ndarray] = dict()
+
+    def get_number_of_tables(self) -> int:
+        """
+        :return: How many tables have been counted
+        """
+        return len(self.__tables)
+
+    def get_table(self, attribute_ids: tuple) -> numpy.ndarray:
+        """
+        Get the contingency table of some attributes.
+
+        :param attribute_ids: The attributes (at least one)
+        :return: The counts, with one axis per attribute, in the given order
+        """
+        key = tuple(sorted(attribute_ids))
+        if key not in self.__tables:
+            radices = [self.__radices[attr_id] for attr_id in key]
+            columns = [self.__case_table[attr_id] for attr_id in key]
+            self.__tables[key] = get_counts(columns[-1], columns[:-1], radices).reshape(radices)
+        return numpy.transpose(self.__tables[key], [key.index(attr_id) for attr_id in attribute_ids])
+
+
+def test_independence(cache: ContingencyTableCache, x_id: str, y_id: str, conditioning_ids: tuple,
+                      statistic: str = G_TEST) -> float:
+    """
+    Test whether two attributes are independent given a set of attributes, by a G-test or a chi-square test
+    over the strata of the conditioning set. The degrees of freedom only count the rows and columns that are
+    observed within each stratum.
+
+    :param cache: The contingency tables
+    :param x_id: The first attribute
+    :param y_id: The second attribute
+    :param conditioning_ids: The conditioning set
+    :param statistic: G_TEST or CHI_SQUARE_TEST
+    :return: The p-value (1 if no case is observed)
+    """
+    counts = cache.get_table((*conditioning_ids, x_id, y_id)).astype(float)
+    counts = counts.reshape(-1, counts.shape[-2], counts.shape[-1])
+    x_totals = counts.sum(axis=2, keepdims=True)
+    y_totals = counts.sum(axis=1, keepdims=True)
+    totals = counts.sum(axis=(1, 2), keepdims=True)
+    expected = numpy.divide(x_totals * y_totals, totals, out=numpy.zeros_like(counts), where=totals > 0)
+    observed = counts > 0
+    if statistic == G_TEST:
+        value = 2 * numpy.sum(counts[observed] * numpy.log(counts[observed] / expected[observed]))
+    else:
+        nonzero = expected > 0
+        value = numpy.sum((counts[nonzero] - expected[nonzero]) ** 2 / expected[nonzero])
+    degrees_of_freedom = numpy.sum(
+        numpy.maximum(numpy.count_nonzero(x_totals[:, :, 0], axis=1) - 1, 0)
+        * numpy.maximum(numpy.count_nonzero(y_totals[:, 0, :], axis=1) - 1, 0))
+    if degrees_of_freedom == 0:
+        return 1.0
+    return chi2_survival(max(value, 0.0), degrees_of_freedom)
+
+
+def get_tiers(attributes: list[CPM_Categorical_Attribute], activities: list[CPM_Activity],
+              attribute_activities: AttributeActivities) -> dict[str, int]:
+    """
+    Get the position of the activity of each attribute in the temporal order of the activities.
+
+    :param attributes: The attributes
+    :param activities: The activities, earliest first
+    :param attribute_activities: The activity of each attribute
+    :return: The tier of each attribute id
+    """
+    activity_ids = [act.get_id() for act in activities]
+    return {attr.get_id(): activity_ids.index(attribute_activities.get_activity_for_attribute_id(attr.get_id()).get_id())
+            for attr in attributes}
+
+
+def discover_relations(attributes: list[CPM_Categorical_Attribute], activities: list[CPM_Activity],
+                       attribute_activities: AttributeActivities, case_table: dict[str, numpy.ndarray],
+                       significance_level: float = 0.05, max_conditioning_size: int = None,
+                       statistic: str = G_TEST, cache: ContingencyTableCache = None) -> list[AttributeRelation]:
+    """
+    Propose the (non-aggregated) relations between attributes from observed cases, by the order-independent
+    (stable) PC algorithm with temporal background knowledge. An attribute can only depend on attributes of
+    earlier activities, so that only those pairs are candidate relations, each relation is oriented from the
+    earlier to the later attribute, and the conditioning sets of a pair only hold attributes of activities
+    before the later one (which cannot be its effects).
+
+    :param attributes: The attributes
+    :param activities: The activities, in temporal order (earliest first)
+    :param attribute_activities: The activity of each attribute
+    :param case_table: The codes of each attribute, by attribute id (see estimation.fit_valuations)
+    :param significance_level: Two attributes are independent if the p-value of their test is above this level
+    :param max_conditioning_size: The largest conditioning set to test. If this is None, there is no limit.
+    :param statistic: G_TEST or CHI_SQUARE_TEST
+    :param cache: The contingency tables. If this is None, a new cache is made.
+        Passing a cache allows to share counts between searches, e.g., with different significance levels.
+    :return: The relations
+    """
+    validate_condition(statistic in [G_TEST, CHI_SQUARE_TEST], 'Unknown statistic "{0}".'.format(statistic))
+    validate_condition(0 < significance_level < 1, "The significance level must be in (0, 1).")
+    validate_condition(all(isinstance(attr, CPM_Categorical_Attribute) for attr in attributes),
+                       "Relations can only be discovered between categorical attributes.")
+    missing_columns = [attr.get_id() for attr in attributes if attr.get_id() not in case_table]
+    validate_condition(not missing_columns, "The case table has no columns for {0}.".format(missing_columns))
+    if cache is None:
+        cache = ContingencyTableCache(attributes, case_table)
+    tiers = get_tiers(attributes, activities, attribute_activities)
+    attribute_ids = [attr.get_id() for attr in attributes]
+    # each adjacency is a pair (earlier, later)
+    adjacencies = {(x_id, y_id) for x_id in attribute_ids for y_id in attribute_ids if tiers[x_id] < tiers[y_id]}
+    size = 0
+    while max_conditioning_size is None or size <= max_conditioning_size:
+        neighbours = {attr_id: set() for attr_id in attribute_ids}
+        for x_id, y_id in adjacencies:
+            neighbours[x_id].add(y_id)
+            neighbours[y_id].add(x_id)
+        has_candidates = False
+        removed = set()
+        for x_id, y_id in sorted(adjacencies):
+            candidates = sorted(attr_id for attr_id in (neighbours[x_id] | neighbours[y_id]) - {x_id, y_id}
+                                if tiers[attr_id] < tiers[y_id])
+            if len(candidates) < size:
+                continue
+            has_candidates = True
+            for conditioning_ids in combinations(candidates, size):
+                if test_independence(cache, x_id, y_id, conditioning_ids, statistic) > significance_level:
+                    removed.add((x_id, y_id))
+                    break
+        adjacencies -= removed
+        if not has_candidates:
+            break
+        size += 1
+    attributes_by_id = {attr.get_id(): attr for attr in attributes}
+    return [AttributeRelation(attributes_by_id[x_id], attributes_by_id[y_id], is_aggregated=False)
+            for x_id, y_id in sorted(adjacencies, key=lambda pair: (attribute_ids.index(pair[1]),
+                                                                     attribute_ids.index(pair[0])))]
+
+
+def discover_causal_structure(attributes: list[CPM_Categorical_Attribute], activities: list[CPM_Activity],
+                              attribute_activities: AttributeActivities, case_table: dict[str, numpy.ndarray],
+                              **kwargs) -> CausalProcessStructure:
+    """
+    Propose a causal structure with the relations that discover_relations finds.
+
+    :param attributes: The attributes
+    :param activities: The activities, in temporal order (earliest first)
+    :param attribute_activities: The activity of each attribute
+    :param case_table: The codes of each attribute, by attribute id (see estimation.fit_valuations)
+    :param kwargs: The options of discover_relations
+    :return: The causal structure
+    """
+    relations = discover_relations(attributes, activities, attribute_activities, case_table, **kwargs)
+    return CausalProcessStructure(attributes, activities, attribute_activities, relations)
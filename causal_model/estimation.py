@@ -0,0 +1,347 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product, groupby
+
+import numpy
+
+from causal_model.causal_process_model import AttributeValuations, CausalProcessModel
+from causal_model.causal_process_structure import CausalProcessStructure, CPM_Categorical_Attribute, \
+    AttributeRelation
+from causal_model.valuation import BayesianValuation, ValuationParameters, ValuationParameter
+from utils.validators import validate_condition
+
+# the largest number of cells (parent configurations times outcomes) of a conditional probability table
+MAX_TABLE_SIZE = 2 ** 26
+# the largest weight of a case in an online learner, before all counts are rescaled
+MAX_CASE_WEIGHT = 1e100
+
+
+def get_parents(causal_structure: CausalProcessStructure, attribute_id: str) -> list[CPM_Categorical_Attribute]:
+    """
+    Get the attributes that valuate an attribute, in the order of the attributes in the causal structure
+    (which is the order a causal model sorts valuation parameters in).
+
+    :param causal_structure: The causal structure
+    :param attribute_id: The attribute
+    :return: The parents
+    """
+    r: AttributeRelation
+    parent_ids = [r.get_in().get_id() for r in causal_structure.get_preset(attribute_id)]
+    return [attr for attr in causal_structure.get_attributes() if attr.get_id() in parent_ids]
+
+
+def validate_estimable(causal_structure: CausalProcessStructure, attribute_id: str):
+    """
+    Make sure that the valuation of an attribute can be estimated from case-level data: the attribute and its
+    parents are categorical, it has no aggregated dependencies (whose values depend on other cases),
+    and its probability table is not too large.
+
+    :param causal_structure: The causal structure
+    :param attribute_id: The attribute
+    :raises ValueError if otherwise
+    """
+    attributes = {attr.get_id(): attr for attr in causal_structure.get_attributes()}
+    validate_condition(attribute_id in attributes,
+                       'Attribute "{0}" is not in the causal structure.'.format(attribute_id))
+    validate_condition(not causal_structure.get_aggregated_preset(attribute_id),
+                       'Attribute "{0}" has aggregated dependencies, which cannot be estimated from a case table.'
+                       .format(attribute_id))
+    table_attributes = get_parents(causal_structure, attribute_id) + [attributes[attribute_id]]
+    validate_condition(all(isinstance(attr, CPM_Categorical_Attribute) for attr in table_attributes),
+                       'Attribute "{0}" and its parents must be categorical.'.format(attribute_id))
+    table_size = numpy.prod([len(attr.get_labels()) for attr in table_attributes], dtype=float)
+    validate_condition(table_size <= MAX_TABLE_SIZE,
+                       'The probability table of attribute "{0}" has too many cells ({1}).'
+                       .format(attribute_id, int(table_size)))
+
+
+def get_counts(outcome_codes: numpy.ndarray, parent_codes: list[numpy.ndarray],
+               radices: list[int], weights: numpy.ndarray = None) -> numpy.ndarray:
+    """
+    Count the cases per parent configuration and outcome, in one pass over a mixed-radix index.
+    The first parent is the most significant digit, the outcome the least significant one.
+    Cases with a missing (negative) code in any of the columns are not counted.
+
+    :param outcome_codes: The codes of the outcome attribute, one per case
+    :param parent_codes: The codes of each parent, one per case
+    :param radices: The number of labels of each parent, followed by the number of outcome labels
+    :param weights: The weight of each case. If this is None, each case counts once.
+    :return: The counts, with one row per parent configuration and one column per outcome
+    """
+    columns = parent_codes + [outcome_codes]
+    size = int(numpy.prod(radices))
+    # the narrowest index type halves the memory traffic of the pass for all but huge tables
+    index_dtype = numpy.int32 if size < numpy.iinfo(numpy.int32).max else numpy.int64
+    index = numpy.zeros(len(outcome_codes), dtype=index_dtype)
+    for codes, radix in zip(columns, radices):
+        index *= radix
+        index += codes
+    columns_with_missing = [codes for codes in columns if len(codes) and codes.min() < 0]
+    if columns_with_missing:
+        is_missing = numpy.zeros(len(outcome_codes), dtype=bool)
+        for codes in columns_with_missing:
+            is_missing |= codes < 0
+        # missing cases are counted in an extra cell that is dropped
+        index[is_missing] = size
+    counts = numpy.bincount(index, weights=weights, minlength=size + 1)[:size]
+    return counts.reshape(-1, radices[-1])
+
+
+def get_valuation(attribute: CPM_Categorical_Attribute, parents: list[CPM_Categorical_Attribute],
+                  counts: numpy.ndarray, smoothing: float) -> BayesianValuation:
+    """
+    Turn the counts of an attribute into a BayesianValuation, by Dirichlet smoothing with a symmetric prior.
+    Parent configurations without any (smoothed) count get a uniform distribution.
+
+    :param attribute: The outcome attribute
+    :param parents: The parents, in the order of the rows of the counts
+    :param counts: The counts, with one row per parent configuration and one column per outcome
+    :param smoothing: The pseudo-count added to each cell
+    :return: The valuation
+    """
+    labels = attribute.get_labels()
+    smoothed = counts + smoothing
+    totals = smoothed.sum(axis=1, keepdims=True)
+    probabilities = numpy.divide(smoothed, totals,
+                                 out=numpy.full(smoothed.shape, 1 / len(labels)), where=totals > 0)
+    configurations = product(*[parent.get_labels() for parent in parents])
+    probability_mappings = {
+        configuration: dict(zip(labels, row))
+        for configuration, row in zip(configurations, probabilities.tolist())
+    }
+    return BayesianValuation(
+        ValuationParameters([ValuationParameter(parent) for parent in parents]),
+        attribute,
+        probability_mappings=probability_mappings)
+
+
+def fit_valuation(causal_structure: CausalProcessStructure, attribute_id: str,
+                  case_table: dict[str, numpy.ndarray], smoothing: float = 1.0) -> BayesianValuation:
+    """
+    Estimate the conditional probability table of one attribute given its parents.
+
+    :param causal_structure: The causal structure
+    :param attribute_id: The attribute
+    :param case_table: The codes of each attribute, by attribute id (see fit_valuations)
+    :param smoothing: The pseudo-count added to each cell
+    :return: The valuation
+    """
+    attribute = [attr for attr in causal_structure.get_attributes() if attr.get_id() == attribute_id][0]
+    parents = get_parents(causal_structure, attribute_id)
+    radices = [len(parent.get_labels()) for parent in parents] + [len(attribute.get_labels())]
+    counts = get_counts(case_table[attribute_id], [case_table[parent.get_id()] for parent in parents], radices)
+    return get_valuation(attribute, parents, counts, smoothing)
+
+
+def fit_valuations(causal_structure: CausalProcessStructure, case_table: dict[str, numpy.ndarray],
+                   smoothing: float = 1.0, attribute_ids: list[str] = None,
+                   workers: int = None) -> AttributeValuations:
+    """
+    Estimate a BayesianValuation for attributes of a causal structure from observed cases: for every
+    configuration of the parents of an attribute, the probability of each outcome is its relative frequency,
+    smoothed by a symmetric Dirichlet prior (Laplace smoothing for a smoothing of 1).
+    All tables are counted with one np.bincount per attribute; attributes are fitted in parallel threads,
+    which share the case table instead of copying it.
+
+    Only non-aggregated dependencies can be estimated from a case-level table, because the values of
+    aggregated dependencies depend on other cases.
+
+    :param causal_structure: The causal structure
+    :param case_table: For each attribute id, an integer array with one code per case, that is, the index of
+        the observed label in get_labels() of the attribute, or a negative code if the attribute is not
+        observed in the case (e.g., see ColumnarEventLog.get_case_table). All arrays have the same length.
+        Cases in which an attribute or one of its parents is missing do not count for that attribute.
+    :param smoothing: The pseudo-count added to each outcome of each parent configuration. If this is 0,
+        unobserved parent configurations get a uniform distribution.
+    :param attribute_ids: The attributes to fit. If this is None, all attributes of the causal structure are fit.
+    :param workers: The number of threads. If this is None, the default of ThreadPoolExecutor is taken.
+    :return: The valuations, by attribute id
+    """
+    if attribute_ids is None:
+        attribute_ids = causal_structure.get_attribute_ids()
+    validate_condition(smoothing >= 0, "The smoothing must not be negative.")
+    validate_condition(len(set(len(codes) for codes in case_table.values())) <= 1,
+                       "All columns of the case table must have the same length.")
+    for attribute_id in attribute_ids:
+        validate_estimable(causal_structure, attribute_id)
+        missing_columns = [attr_id for attr_id in [attribute_id] + [
+            parent.get_id() for parent in get_parents(causal_structure, attribute_id)]
+                           if attr_id not in case_table]
+        validate_condition(not missing_columns,
+                           'The case table has no columns for {0}, which are needed for attribute "{1}".'
+                           .format(missing_columns, attribute_id))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        valuations = list(executor.map(
+            lambda attribute_id: fit_valuation(causal_structure, attribute_id, case_table, smoothing),
+            attribute_ids))
+    return AttributeValuations(dict(zip(attribute_ids, valuations)))
+
+
+class OnlineValuationLearner:
+
+    def __validate(self):
+        validate_condition(0 < self.__decay <= 1, "The decay must be in (0, 1].")
+        validate_condition(self.__smoothing >= 0, "The smoothing must not be negative.")
+        for attribute_id in self.__attribute_ids:
+            validate_estimable(self.__causal_model.get_causal_structure(), attribute_id)
+
+    def __init__(self, causal_model: CausalProcessModel, decay: float = 1.0, smoothing: float = 1.0,
+                 attribute_ids: list[str] = None):
+        """
+        Learn the valuations of a causal model incrementally from a stream of cases, by keeping a count
+        for each attribute, parent configuration and label. Older cases can be forgotten exponentially:
+        after n more cases, a case counts decay^n times.
+
+        Decay is lazy. Instead of multiplying all counts for each case, each case is added with a weight
+        that grows by 1/decay, and the weights are only rescaled when they grow large. An update thus costs
+        as much as the attributes of the case, and a snapshot as much as the probability tables,
+        independent of how many cases have been seen.
+
+        :param causal_model: The model whose causal structure and aggregations the snapshots share
+        :param decay: The factor by which the counts of the cases seen so far shrink with each new case.
+            If this is 1, all cases count equally.
+        :param smoothing: The pseudo-count added to each cell when a snapshot is taken (see fit_valuations)
+        :param attribute_ids: The attributes to learn. If this is None, all attributes without aggregated
+            dependencies are learned. The other attributes keep the valuations of the causal model.
+        """
+        causal_structure = causal_model.get_causal_structure()
+        if attribute_ids is None:
+            attribute_ids = [attr_id for attr_id in causal_structure.get_attribute_ids()
+                             if not causal_structure.get_aggregated_preset(attr_id)]
+        self.__causal_model = causal_model
+        self.__decay = decay
+        self.__smoothing = smoothing
+        self.__attribute_ids = list(attribute_ids)
+        self.__validate()
+        attributes = {attr.get_id(): attr for attr in causal_structure.get_attributes()}
+        self.__outcomes = {attr_id: attributes[attr_id] for attr_id in self.__attribute_ids}
+        self.__parents = {attr_id: get_parents(causal_structure, attr_id) for attr_id in self.__attribute_ids}
+        self.__radices = {
+            attr_id: [len(parent.get_labels()) for parent in self.__parents[attr_id]]
+            + [len(self.__outcomes[attr_id].get_labels())]
+            for attr_id in self.__attribute_ids
+        }
+        self.__label_codes = {
+            attr.get_id(): {label: code for code, label in enumerate(attr.get_labels())}
+            for attr in causal_structure.get_attributes() if isinstance(attr, CPM_Categorical_Attribute)
+        }
+        self.__counts = {
+            attr_id: numpy.zeros((int(numpy.prod(radices[:-1])), radices[-1]))
+            for attr_id, radices in self.__radices.items()
+        }
+        # the weight of the next case; the latest case has weight __next_weight * decay
+        self.__next_weight = 1.0
+        self.__number_of_cases = 0
+
+    def get_number_of_cases(self) -> int:
+        return self.__number_of_cases
+
+    def get_attribute_ids(self) -> list[str]:
+        return self.__attribute_ids
+
+    def __rescale(self):
+        for counts in self.__counts.values():
+            counts /= self.__next_weight
+        self.__next_weight = 1.0
+
+    def update(self, attribute_values: dict[str, str]):
+        """
+        Add one case.
+
+        :param attribute_values: The label of each attribute observed in the case, by attribute id.
+            An attribute that is not observed (or whose parents are not) does not count.
+        """
+        if self.__next_weight > MAX_CASE_WEIGHT:
+            self.__rescale()
+        for attr_id in self.__attribute_ids:
+            table_attributes = self.__parents[attr_id] + [self.__outcomes[attr_id]]
+            if not all(attr.get_id() in attribute_values for attr in table_attributes):
+                continue
+            cell = 0
+            for attr, radix in zip(table_attributes, self.__radices[attr_id]):
+                cell = cell * radix + self.__label_codes[attr.get_id()][attribute_values[attr.get_id()]]
+            self.__counts[attr_id].flat[cell] += self.__next_weight
+        self.__next_weight /= self.__decay
+        self.__number_of_cases += 1
+
+    def update_events(self, events):
+        """
+        Add the cases of a stream of events, in which the events of a case are consecutive
+        (e.g., read case by case from a trace index). Each case is added after its last event.
+
+        :param events: An iterable of SimulatedEvent (or anything with a case_id and attribute_values)
+        """
+        for _, case_events in groupby(events, key=lambda event: event.case_id):
+            attribute_values = dict()
+            for event in case_events:
+                attribute_values.update(event.attribute_values)
+            self.update(attribute_values)
+
+    def update_table(self, case_table: dict[str, numpy.ndarray]):
+        """
+        Add a batch of cases at once, in the order of the rows, with one np.bincount per attribute.
+
+        :param case_table: The codes of each attribute, by attribute id (see fit_valuations).
+            Attributes without a column are missing in all cases.
+        """
+        lengths = set(len(codes) for codes in case_table.values())
+        validate_condition(len(lengths) <= 1, "All columns of the case table must have the same length.")
+        number_of_cases = lengths.pop() if lengths else 0
+        # the weights within a piece grow by at most MAX_CASE_WEIGHT
+        piece_size = max(1, number_of_cases) if self.__decay == 1 \
+            else max(1, int(math.log(MAX_CASE_WEIGHT) / -math.log(self.__decay)))
+        for start in range(0, number_of_cases, piece_size):
+            end = min(start + piece_size, number_of_cases)
+            if self.__next_weight > MAX_CASE_WEIGHT:
+                self.__rescale()
+            weights = None if self.__decay == 1 \
+                else self.__next_weight * (1 / self.__decay) ** numpy.arange(end - start)
+            for attr_id in self.__attribute_ids:
+                columns = [case_table.get(attr.get_id())
+                           for attr in self.__parents[attr_id] + [self.__outcomes[attr_id]]]
+                if any(codes is None for codes in columns):
+                    continue
+                counts = get_counts(columns[-1][start:end], [codes[start:end] for codes in columns[:-1]],
+                                    self.__radices[attr_id], weights)
+                self.__counts[attr_id] += counts if weights is not None else counts * self.__next_weight
+            self.__next_weight = self.__next_weight if self.__decay == 1 \
+                else self.__next_weight * (1 / self.__decay) ** (end - start)
+            self.__number_of_cases += end - start
+
+    def get_counts(self, attribute_id: str) -> numpy.ndarray:
+        """
+        Get the decayed counts of an attribute, in which the latest case counts once.
+
+        :param attribute_id: The attribute
+        :return: The counts, with one row per parent configuration and one column per outcome
+        """
+        return self.__counts[attribute_id] / (self.__next_weight * self.__decay)
+
+    def get_attribute_valuations(self) -> AttributeValuations:
+        """
+        :return: The valuations of the learned attributes, estimated from the current counts
+        """
+        return AttributeValuations({
+            attr_id: get_valuation(self.__outcomes[attr_id], self.__parents[attr_id],
+                                   self.get_counts(attr_id), self.__smoothing)
+            for attr_id in self.__attribute_ids
+        })
+
+    def get_causal_model(self) -> CausalProcessModel:
+        """
+        Take a snapshot of the learned model: the causal model with the current estimates of the learned
+        valuations. The snapshot does not change with later updates.
+
+        :return: The causal model
+        """
+        learned_valuations = self.get_attribute_valuations()
+        valuations = self.__causal_model.get_attribute_valuations()
+        return CausalProcessModel(
+            CS=self.__causal_model.get_causal_structure(),
+            Sagg=self.__causal_model.get_aggregation_selection(),
+            Fagg=self.__causal_model.get_aggregation_function(),
+            V=AttributeValuations({
+                attr_id: learned_valuations.get_attribute_valuation(attr_id)
+                if attr_id in self.__attribute_ids else valuations.get_attribute_valuation(attr_id)
+                for attr_id in valuations.get_attribute_ids()
+            }))
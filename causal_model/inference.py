@@ -0,0 +1,246 @@
+import numpy
+
+from causal_model.causal_process_model import CausalProcessModel
+from causal_model.valuation import BayesianValuation, ValuationParameter
+from utils.validators import validate_condition
+
+
+class Factor:
+
+    def __init__(self, attribute_ids: tuple, values: numpy.ndarray):
+        """
+        A function from the labels of some attributes to non-negative numbers, stored as an array with
+        one axis per attribute (indexed by the codes of the labels).
+
+        :param attribute_ids: The attributes, in the order of the axes
+        :param values: The array
+        """
+        self.attribute_ids = attribute_ids
+        self.values = values
+
+    def reduce(self, attribute_id: str, code: int):
+        """
+        Fix the label of an attribute, dropping its axis.
+
+        :param attribute_id: The attribute
+        :param code: The code of the label
+        :return: The reduced factor
+        """
+        if attribute_id not in self.attribute_ids:
+            return self
+        axis = self.attribute_ids.index(attribute_id)
+        return Factor(self.attribute_ids[:axis] + self.attribute_ids[axis + 1:],
+                      numpy.take(self.values, code, axis=axis))
+
+
+def multiply_and_sum_out(factors: list[Factor], remaining_ids: tuple) -> Factor:
+    """
+    Multiply factors and sum out all of their attributes that are not kept, with one einsum.
+
+    :param factors: The factors
+    :param remaining_ids: The attributes to keep, in the order of the axes of the result
+    :return: The factor
+    """
+    all_ids = sorted(set(attr_id for factor in factors for attr_id in factor.attribute_ids) | set(remaining_ids))
+    axis_numbers = {attr_id: n for n, attr_id in enumerate(all_ids)}
+    operands = []
+    for factor in factors:
+        operands += [factor.values, [axis_numbers[attr_id] for attr_id in factor.attribute_ids]]
+    values = numpy.einsum(*operands, [axis_numbers[attr_id] for attr_id in remaining_ids], optimize=True)
+    return Factor(tuple(remaining_ids), values)
+
+
+def get_min_fill_order(factors: list[Factor], eliminated_ids: set, radices: dict[str, int]) -> list[str]:
+    """
+    Greedily order the attributes to eliminate, each time taking the one whose elimination adds the fewest
+    edges between its neighbours in the interaction graph of the factors (ties are broken by the size of
+    the factor it creates).
+
+    :param factors: The factors
+    :param eliminated_ids: The attributes to eliminate
+    :param radices: The number of labels of each attribute
+    :return: The order
+    """
+    neighbours = {attr_id: set() for factor in factors for attr_id in factor.attribute_ids}
+    for factor in factors:
+        for attr_id in factor.attribute_ids:
+            neighbours[attr_id] |= set(factor.attribute_ids) - {attr_id}
+    order = []
+    remaining = set(eliminated_ids)
+    while remaining:
+        def cost(attr_id):
+            adjacent = list(neighbours[attr_id])
+            fill = sum(1 for i, a in enumerate(adjacent) for b in adjacent[i + 1:] if b not in neighbours[a])
+            return fill, numpy.prod([radices[a] for a in adjacent], dtype=float), attr_id
+        attr_id = min(remaining, key=cost)
+        adjacent = neighbours.pop(attr_id)
+        for a in adjacent:
+            neighbours[a] |= adjacent - {a}
+            neighbours[a].discard(attr_id)
+        remaining.remove(attr_id)
+        order.append(attr_id)
+    return order
+
+
+class ExactInference:
+
+    def __validate(self):
+        av: BayesianValuation
+        validate_condition(
+            all(isinstance(av, BayesianValuation)
+                for av in self.__causal_model.get_attribute_valuations().get_attribute_valuation_list()),
+            "Exact inference needs a BayesianValuation for each attribute.")
+
+    def __init__(self, causal_model: CausalProcessModel):
+        """
+        Exact probabilities of the attributes of a causal model, computed from the valuations by variable
+        elimination instead of simulation. Queries can condition on observed labels and intervene on
+        attributes (the do-operator, which replaces the valuation of an attribute by a fixed label).
+        Answers are cached per query.
+
+        Attributes with aggregated dependencies depend on other cases (and on time), so that queries
+        that involve them (or their descendants) are not supported.
+
+        :param causal_model: The causal model
+        """
+        self.__causal_model = causal_model
+        self.__validate()
+        self.__attributes = {attr.get_id(): attr for attr in causal_model.get_attributes()}
+        self.__radices = {attr_id: len(attr.get_labels()) for attr_id, attr in self.__attributes.items()}
+        self.__parents = dict()
+        self.__cpts = dict()
+        self.__cache = dict()
+
+    def __get_parent_ids(self, attribute_id: str) -> list[str]:
+        if attribute_id not in self.__parents:
+            vp: ValuationParameter
+            valuation = self.__causal_model.get_attribute_valuations().get_attribute_valuation(attribute_id)
+            self.__parents[attribute_id] = [
+                vp.get_attribute().get_id() for vp in valuation.valuation_parameters.get_valuation_parameters_list()]
+        return self.__parents[attribute_id]
+
+    def __get_cpt(self, attribute_id: str) -> Factor:
+        """
+        The valuation of an attribute as a factor over its parameters and itself. Parameter configurations
+        without a mapping valuate to the first label, as the valuation functions do.
+        """
+        if attribute_id not in self.__cpts:
+            valuation = self.__causal_model.get_attribute_valuations().get_attribute_valuation(attribute_id)
+            parent_ids = self.__get_parent_ids(attribute_id)
+            attribute_ids = tuple(parent_ids) + (attribute_id,)
+            values = numpy.zeros([self.__radices[attr_id] for attr_id in attribute_ids])
+            values[..., 0] = 1
+            labels = self.__attributes[attribute_id].get_labels()
+            for key, dist in valuation.get_probability_mappings().items():
+                index = tuple(self.__attributes[attr_id].get_labels().index(label)
+                              for attr_id, label in zip(parent_ids, key))
+                values[index] = [dist.get(label, 0.0) for label in labels]
+            self.__cpts[attribute_id] = Factor(attribute_ids, values)
+        return self.__cpts[attribute_id]
+
+    def __get_code(self, attribute_id: str, label: str) -> int:
+        validate_condition(attribute_id in self.__attributes, 'Unknown attribute "{0}".'.format(attribute_id))
+        labels = self.__attributes[attribute_id].get_labels()
+        validate_condition(label in labels, 'Attribute "{0}" has no label "{1}".'.format(attribute_id, label))
+        return labels.index(label)
+
+    def __get_relevant_ids(self, attribute_ids: set, interventions: dict) -> set:
+        """
+        The attributes whose valuations matter for a query: the ancestors of the query and evidence attributes,
+        where intervened attributes have no parents. The other attributes sum out to 1.
+        """
+        relevant_ids = set()
+        frontier = list(attribute_ids)
+        while frontier:
+            attr_id = frontier.pop()
+            if attr_id in relevant_ids:
+                continue
+            relevant_ids.add(attr_id)
+            if attr_id not in interventions:
+                frontier += self.__get_parent_ids(attr_id)
+        return relevant_ids
+
+    def __infer(self, query_ids: tuple, evidence: dict, interventions: dict) -> numpy.ndarray:
+        relevant_ids = self.__get_relevant_ids(set(query_ids) | set(evidence), interventions)
+        aggregated_ids = [attr_id for attr_id in relevant_ids if attr_id not in interventions
+                          and self.__causal_model.get_aggregated_preset(attr_id)]
+        validate_condition(not aggregated_ids,
+                           "The query depends on attributes with aggregated dependencies ({0}).".format(aggregated_ids))
+        fixed = {attr_id: self.__get_code(attr_id, label) for attr_id, label in {**evidence, **interventions}.items()}
+        factors = []
+        for attr_id in sorted(relevant_ids - set(interventions)):
+            factor = self.__get_cpt(attr_id)
+            for fixed_id, code in fixed.items():
+                factor = factor.reduce(fixed_id, code)
+            factors.append(factor)
+        eliminated_ids = relevant_ids - set(query_ids) - set(fixed)
+        for attr_id in get_min_fill_order(factors, eliminated_ids, self.__radices):
+            involved = [factor for factor in factors if attr_id in factor.attribute_ids]
+            remaining_ids = tuple(sorted(set(a for factor in involved for a in factor.attribute_ids) - {attr_id}))
+            factors = [factor for factor in factors if attr_id not in factor.attribute_ids]
+            factors.append(multiply_and_sum_out(involved, remaining_ids))
+        free_query_ids = tuple(attr_id for attr_id in query_ids if attr_id not in fixed)
+        values = multiply_and_sum_out(factors, free_query_ids).values if factors \
+            else numpy.ones([self.__radices[attr_id] for attr_id in free_query_ids])
+        total = values.sum()
+        validate_condition(total > 0, "The evidence has probability 0.")
+        values = values / total
+        # fixed query attributes have their label with probability 1
+        for axis, attr_id in enumerate(query_ids):
+            if attr_id in fixed:
+                point_mass = numpy.zeros(self.__radices[attr_id])
+                point_mass[fixed[attr_id]] = 1
+                values = numpy.multiply.outer(values, point_mass)
+                values = numpy.moveaxis(values, -1, axis)
+        return values
+
+    def get_joint_distribution(self, attribute_ids: list[str], evidence: dict[str, str] = None,
+                               interventions: dict[str, str] = None) -> dict[tuple, float]:
+        """
+        Get the joint distribution of some attributes.
+
+        :param attribute_ids: The attributes
+        :param evidence: The observed label of some attributes, by attribute id
+        :param interventions: The label that some attributes are set to, by attribute id
+        :return: The probability of each combination of labels, in the order of the attributes
+        """
+        evidence = dict() if evidence is None else evidence
+        interventions = dict() if interventions is None else interventions
+        validate_condition(all(attr_id in self.__attributes for attr_id in attribute_ids),
+                           "Unknown attributes {0}.".format([a for a in attribute_ids if a not in self.__attributes]))
+        validate_condition(len(set(attribute_ids)) == len(attribute_ids), "The query attributes must be unique.")
+        key = (tuple(attribute_ids), tuple(sorted(evidence.items())), tuple(sorted(interventions.items())))
+        if key not in self.__cache:
+            self.__cache[key] = self.__infer(tuple(attribute_ids), evidence, interventions)
+        values = self.__cache[key]
+        label_lists = [self.__attributes[attr_id].get_labels() for attr_id in attribute_ids]
+        return {tuple(label_lists[i][code] for i, code in enumerate(index)): float(values[index])
+                for index in numpy.ndindex(values.shape)}
+
+    def get_distribution(self, attribute_id: str, evidence: dict[str, str] = None,
+                         interventions: dict[str, str] = None) -> dict[str, float]:
+        """
+        Get the distribution of an attribute, e.g., P(patient_satisfaction | do(doctor=Dr_Yuan)) by
+        get_distribution("patient_satisfaction", interventions={"doctor": "Dr_Yuan"}).
+
+        :param attribute_id: The attribute
+        :param evidence: The observed label of some attributes, by attribute id
+        :param interventions: The label that some attributes are set to, by attribute id
+        :return: The probability of each label
+        """
+        joint_distribution = self.get_joint_distribution([attribute_id], evidence, interventions)
+        return {key[0]: p for key, p in joint_distribution.items()}
+
+    def get_probability(self, attribute_id: str, label: str, evidence: dict[str, str] = None,
+                        interventions: dict[str, str] = None) -> float:
+        """
+        Get the probability that an attribute has some label.
+
+        :param attribute_id: The attribute
+        :param label: The label
+        :param evidence: The observed label of some attributes, by attribute id
+        :param interventions: The label that some attributes are set to, by attribute id
+        :return: The probability
+        """
+        self.__get_code(attribute_id, label)
+        return self.get_distribution(attribute_id, evidence, interventions)[label]
@@ -54,6 +54,16 @@ class AttributeValuation:
     def get_call(self):
         raise NotImplementedError()
 
+    def sample(self, parameter_labels: tuple, rng):
+        """
+        Draw a value of the outcome attribute, as the SML valuation function does in the CPN.
+
+        :param parameter_labels: The values of the valuation parameters, in the parameter ordering
+        :param rng: The random generator (a numpy.random.Generator)
+        :return: The value
+        """
+        raise NotImplementedError()
+
 
 def define_uniform_probability_mapping(valuation_parameters: ValuationParameters,
                                        outcome: CPM_Categorical_Attribute) \
@@ -150,6 +160,39 @@ class BayesianValuation(AttributeValuation):
     def __get_function_name(self):
         return super(BayesianValuation, self).get_function_name()
 
+    def get_probability_mappings(self):
+        return self.__probability_mappings
+
+    def get_probability(self, parameter_labels: tuple, label: str) -> float:
+        """
+        Get the probability that sample yields a value.
+
+        :param parameter_labels: The values of the valuation parameters, in the parameter ordering
+        :param label: The value of the outcome attribute
+        :return: The probability
+        """
+        if parameter_labels not in self.__probability_mappings:
+            return 1.0 if label == self.outcome_attribute.get_labels()[0] else 0.0
+        dist = self.__probability_mappings[parameter_labels]
+        if len(dist) == 1:
+            return 1.0 if label in dist else 0.0
+        return dist.get(label, 0.0)
+
+    def sample(self, parameter_labels: tuple, rng):
+        if parameter_labels not in self.__probability_mappings:
+            # as the unreachable branch of the SML function
+            return self.outcome_attribute.get_labels()[0]
+        dist = self.__probability_mappings[parameter_labels]
+        if len(dist) == 1:
+            return list(dist.keys())[0]
+        cum_dist_items = list(cumulative_distribution(dist).items())
+        p = rng.random()
+        for v, cum_p in cum_dist_items[:-1]:
+            if p < cum_p:
+                return v
+        lastv, _ = cum_dist_items[-1]
+        return lastv
+
     def to_SML(self):
         function_name = self.__get_function_name()
         parameter_string = self.__get_parameter_string()
@@ -0,0 +1,206 @@
+import numpy
+
+from causal_model.causal_process_structure import CPM_Categorical_Attribute
+from simulation_model.simulator import SimulatedEvent
+from utils.validators import validate_condition
+
+# the code of a categorical value that is missing, e.g., an attribute that is not observed at the activity of an event
+MISSING_CODE = -1
+
+
+def get_code_dtype(number_of_labels: int):
+    """
+    Get the narrowest signed integer type for the codes of a categorical column. This is the type pandas uses
+    for the codes of a categorical with that many categories, so that the codes can be shared with pandas.
+
+    :param number_of_labels: The number of labels
+    :return: The numpy type
+    """
+    for dtype in [numpy.int8, numpy.int16, numpy.int32]:
+        if number_of_labels < numpy.iinfo(dtype).max:
+            return dtype
+    return numpy.int64
+
+
+class ColumnarEventLog:
+
+    def __validate(self):
+        validate_condition(len(set(self.__activity_names)) == len(self.__activity_names),
+                           "Activity names must be unique.")
+        validate_condition(all(isinstance(attr, CPM_Categorical_Attribute) for attr in self.__attributes),
+                           "Only categorical attributes can be stored in a columnar event log.")
+        validate_condition(self.__chunk_size > 0, "The chunk size must be positive.")
+
+    def __init__(self, activity_names: list[str], attributes: list[CPM_Categorical_Attribute],
+                 chunk_size: int = 2 ** 16):
+        """
+        An in-memory event log that stores each column as a numpy array: event ids and case ids as int64,
+        timestamps as float64 (seconds of model time), and the activity and each categorical attribute
+        as integer codes into its labels (in the order of get_labels()). Events are appended in chunks,
+        which are concatenated once when a column is read.
+
+        :param activity_names: The activities, in the order of their codes
+        :param attributes: The categorical attributes
+        :param chunk_size: How many appended events are buffered before they are stored as a chunk
+        """
+        self.__activity_names = list(activity_names)
+        self.__attributes = list(attributes)
+        self.__chunk_size = chunk_size
+        self.__validate()
+        self.__activity_codes = {name: code for code, name in enumerate(self.__activity_names)}
+        self.__label_codes = {
+            attr.get_id(): {label: code for code, label in enumerate(attr.get_labels())}
+            for attr in self.__attributes
+        }
+        self.__dtypes = {
+            "event_id": numpy.int64,
+            "case_id": numpy.int64,
+            "activity": get_code_dtype(len(self.__activity_names)),
+            "timestamp": numpy.float64,
+        }
+        for attr in self.__attributes:
+            self.__dtypes[attr.get_id()] = get_code_dtype(len(attr.get_labels()))
+        self.__chunks: dict[str, list[numpy.ndarray]] = {column: [] for column in self.__dtypes}
+        self.__buffer: dict[str, list] = {column: [] for column in self.__dtypes}
+        self.__number_of_events = 0
+
+    def get_column_names(self) -> list[str]:
+        """
+        :return: The columns: event_id, case_id, activity, timestamp, and the attribute ids
+        """
+        return list(self.__dtypes.keys())
+
+    def get_activity_names(self):
+        return self.__activity_names
+
+    def get_attributes(self):
+        return self.__attributes
+
+    def __len__(self):
+        return self.__number_of_events + len(self.__buffer["event_id"])
+
+    def append(self, event_id: int, case_id: int, activity_name: str, timestamp: float,
+               attribute_values: dict[str, str]):
+        """
+        Append one event. Attributes that are not among the attribute values are missing.
+
+        :param event_id: The event id
+        :param case_id: The case id
+        :param activity_name: The activity
+        :param timestamp: The timestamp (seconds of model time)
+        :param attribute_values: The observed label of each attribute, by attribute id
+        """
+        self.__buffer["event_id"].append(event_id)
+        self.__buffer["case_id"].append(case_id)
+        self.__buffer["activity"].append(self.__activity_codes[activity_name])
+        self.__buffer["timestamp"].append(timestamp)
+        for attr_id, label_codes in self.__label_codes.items():
+            label = attribute_values.get(attr_id)
+            self.__buffer[attr_id].append(MISSING_CODE if label is None else label_codes[label])
+        if len(self.__buffer["event_id"]) >= self.__chunk_size:
+            self.__flush()
+
+    def extend(self, events):
+        """
+        Append the events of some source, e.g., a simulator.
+
+        :param events: An iterable of SimulatedEvent
+        """
+        event: SimulatedEvent
+        for event in events:
+            self.append(event.event_id, event.case_id, event.activity_name, event.timestamp, event.attribute_values)
+
+    def append_chunk(self, columns: dict[str, numpy.ndarray]):
+        """
+        Append a chunk of already encoded events, e.g., parsed from a file.
+
+        :param columns: An array for each column, of equal lengths. Missing attribute columns are missing values.
+        """
+        validate_condition(all(column in self.__dtypes for column in columns),
+                           "Unknown columns {0}.".format([c for c in columns if c not in self.__dtypes]))
+        lengths = set(len(values) for values in columns.values())
+        validate_condition(len(lengths) == 1, "All columns of a chunk must have the same length.")
+        length = lengths.pop()
+        for column in ["event_id", "case_id", "activity", "timestamp"]:
+            validate_condition(column in columns, 'A chunk needs a column "{0}".'.format(column))
+        self.__flush()
+        for column, dtype in self.__dtypes.items():
+            if column in columns:
+                self.__chunks[column].append(numpy.asarray(columns[column], dtype=dtype))
+            else:
+                self.__chunks[column].append(numpy.full(length, MISSING_CODE, dtype=dtype))
+        self.__number_of_events += length
+
+    def __flush(self):
+        if not self.__buffer["event_id"]:
+            return
+        for column, dtype in self.__dtypes.items():
+            self.__chunks[column].append(numpy.array(self.__buffer[column], dtype=dtype))
+            self.__buffer[column] = []
+        self.__number_of_events = sum(len(chunk) for chunk in self.__chunks["event_id"])
+
+    def get_column(self, column: str) -> numpy.ndarray:
+        """
+        Get a column as one array. Chunks are concatenated once, so that later calls do not copy.
+
+        :param column: The column name
+        :return: The array
+        """
+        self.__flush()
+        chunks = self.__chunks[column]
+        if len(chunks) != 1:
+            self.__chunks[column] = [numpy.concatenate(chunks) if chunks
+                                     else numpy.empty(0, dtype=self.__dtypes[column])]
+        return self.__chunks[column][0]
+
+    def get_labels(self, column: str) -> list[str]:
+        """
+        Get the labels that the codes of a categorical column refer to.
+
+        :param column: The column name ("activity" or an attribute id)
+        :return: The labels
+        """
+        if column == "activity":
+            return self.__activity_names
+        return [attr for attr in self.__attributes if attr.get_id() == column][0].get_labels()
+
+    def get_case_table(self) -> tuple[numpy.ndarray, dict[str, numpy.ndarray]]:
+        """
+        Get the attribute values per case, e.g., to estimate valuations from (see causal_model.estimation).
+        If an attribute is observed more than once in a case, its latest observation is taken.
+
+        :return: The sorted case ids, and for each attribute id the code of its value in each case
+            (MISSING_CODE if the attribute is not observed in the case)
+        """
+        case_ids, case_positions = numpy.unique(self.get_column("case_id"), return_inverse=True)
+        order = numpy.argsort(self.get_column("timestamp"), kind="stable")
+        case_table = dict()
+        for attr in self.__attributes:
+            codes = self.get_column(attr.get_id())[order]
+            observed = codes != MISSING_CODE
+            column = numpy.full(len(case_ids), MISSING_CODE, dtype=codes.dtype)
+            # of repeated positions, the last assignment takes effect
+            column[case_positions[order][observed]] = codes[observed]
+            case_table[attr.get_id()] = column
+        return case_ids, case_table
+
+    def to_pandas(self):
+        """
+        Get the log as a pandas DataFrame, with categorical dtypes for the activity and the attributes.
+        The DataFrame shares the memory of the columns instead of copying them.
+
+        :return: The DataFrame
+        """
+        # pandas is only needed for this conversion
+        import pandas
+        data = {
+            "event_id": self.get_column("event_id"),
+            "case_id": self.get_column("case_id"),
+            "activity": pandas.Categorical.from_codes(
+                self.get_column("activity"), dtype=pandas.CategoricalDtype(self.__activity_names)),
+            "timestamp": self.get_column("timestamp"),
+        }
+        for attr in self.__attributes:
+            data[attr.get_name()] = pandas.Categorical.from_codes(
+                self.get_column(attr.get_id()), dtype=pandas.CategoricalDtype(attr.get_labels()))
+        return pandas.DataFrame(data, copy=False)
@@ -0,0 +1,260 @@
+import numpy
+
+from causal_model.causal_process_model import CausalProcessModel
+from causal_model.valuation import BayesianValuation, ValuationParameter
+from event_log.columnar import ColumnarEventLog, MISSING_CODE
+from utils.validators import validate_condition
+
+
+def get_descendant_ids(causal_model: CausalProcessModel, attribute_ids: set) -> set:
+    """
+    Get the attributes that depend on some attributes, directly or indirectly, including those attributes.
+
+    :param causal_model: The causal model
+    :param attribute_ids: The attributes
+    :return: The descendants
+    """
+    descendant_ids = set()
+    frontier = list(attribute_ids)
+    while frontier:
+        attr_id = frontier.pop()
+        if attr_id in descendant_ids:
+            continue
+        descendant_ids.add(attr_id)
+        frontier += [r.get_out().get_id() for r in causal_model.get_relations() if r.get_in().get_id() == attr_id]
+    return descendant_ids
+
+
+def get_topological_order(causal_model: CausalProcessModel, attribute_ids: set) -> list[str]:
+    """
+    Order attributes such that each attribute comes after the attributes it depends on.
+
+    :param causal_model: The causal model
+    :param attribute_ids: The attributes
+    :return: The attributes, ordered
+    """
+    order = []
+    remaining = [attr_id for attr_id in causal_model.get_causal_structure().get_attribute_ids()
+                 if attr_id in attribute_ids]
+    while remaining:
+        ready = [attr_id for attr_id in remaining
+                 if not any(r.get_in().get_id() in remaining for r in causal_model.get_preset(attr_id))]
+        validate_condition(ready, "The dependencies between {0} are cyclic.".format(remaining))
+        order += ready
+        remaining = [attr_id for attr_id in remaining if attr_id not in ready]
+    return order
+
+
+def get_inverse_cdf_table(valuation: BayesianValuation, parameter_labels: list[list[str]]) -> numpy.ndarray:
+    """
+    Get the cumulative distributions of a valuation as an array, with one row per parameter configuration
+    (by mixed-radix index of the label codes, the first parameter most significant) and one column per
+    outcome, in the order in which BayesianValuation.sample accumulates them (sorted labels).
+    Configurations without a mapping valuate to the first label, as in sample.
+
+    :param valuation: The valuation
+    :param parameter_labels: The labels of each parameter
+    :return: The cumulative distributions
+    """
+    outcome_labels = valuation.outcome_attribute.get_labels()
+    sorted_labels = sorted(outcome_labels)
+    shape = [len(labels) for labels in parameter_labels]
+    probabilities = numpy.zeros((int(numpy.prod(shape)), len(sorted_labels)))
+    probabilities[:, sorted_labels.index(outcome_labels[0])] = 1
+    for key, dist in valuation.get_probability_mappings().items():
+        configuration = numpy.ravel_multi_index(
+            [labels.index(label) for labels, label in zip(parameter_labels, key)], shape) if shape else 0
+        probabilities[configuration] = [dist.get(label, 0.0) for label in sorted_labels]
+    return numpy.cumsum(probabilities, axis=1)
+
+
+class CounterfactualEngine:
+
+    def __validate(self):
+        av: BayesianValuation
+        validate_condition(
+            all(isinstance(av, BayesianValuation)
+                for av in self.__causal_model.get_attribute_valuations().get_attribute_valuation_list()),
+            "Counterfactuals need a BayesianValuation for each attribute.")
+
+    def __init__(self, causal_model: CausalProcessModel):
+        """
+        Counterfactual versions of a log that was simulated from a causal model: what the attributes
+        of the same cases would have been under other valuations, or under interventions. Timestamps and
+        control flow do not depend on attribute values, so that only the columns of the changed attributes
+        and their descendants are rewritten; all other columns are shared with the factual log.
+
+        The randomness of each valuation is abducted from the factual log: the uniform number that
+        BayesianValuation.sample drew is either given, or resampled consistently with the factual outcome,
+        i.e., uniformly within the interval of the cumulative distribution that yields that outcome.
+        The counterfactual outcome is then the outcome of the new parameters (and valuation) at that number,
+        so that an event keeps its factual outcome if its parameters and valuation do not change.
+
+        :param causal_model: The causal model that the log was simulated from
+        """
+        self.__causal_model = causal_model
+        self.__validate()
+        self.__attributes = {attr.get_id(): attr for attr in causal_model.get_attributes()}
+
+    def __get_parameter_ids(self, valuation: BayesianValuation) -> list[str]:
+        vp: ValuationParameter
+        return [vp.get_attribute().get_id() for vp in valuation.valuation_parameters.get_valuation_parameters_list()]
+
+    def __get_configurations(self, valuation: BayesianValuation, parameter_columns: dict[str, numpy.ndarray],
+                             rows: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Get the mixed-radix index of the parameter configuration of a valuation at some rows,
+        and whether all parameters are observed there.
+        """
+        configurations = numpy.zeros(len(rows), dtype=numpy.int64)
+        is_observed = numpy.ones(len(rows), dtype=bool)
+        for parameter_id in self.__get_parameter_ids(valuation):
+            codes = parameter_columns[parameter_id][rows]
+            configurations = configurations * len(self.__attributes[parameter_id].get_labels()) + codes
+            is_observed &= codes != MISSING_CODE
+        return configurations, is_observed
+
+    def get_affected_attribute_ids(self, valuations: dict[str, BayesianValuation] = None,
+                                   interventions: dict[str, str] = None) -> list[str]:
+        """
+        Get the attributes whose columns a change rewrites, in topological order.
+
+        :param valuations: New valuations of some attributes, by attribute id
+        :param interventions: The labels that some attributes are set to, by attribute id
+        :return: The attributes
+        """
+        changed_ids = set(valuations or dict()) | set(interventions or dict())
+        return get_topological_order(self.__causal_model, get_descendant_ids(self.__causal_model, changed_ids))
+
+    def run(self, log: ColumnarEventLog, valuations: dict[str, BayesianValuation] = None,
+            interventions: dict[str, str] = None, rng=None,
+            uniforms: dict[str, numpy.ndarray] = None) -> ColumnarEventLog:
+        """
+        Compute the counterfactual log under new valuations and/or interventions.
+
+        :param log: The factual log
+        :param valuations: New valuations of some attributes, by attribute id
+        :param interventions: The labels that some attributes are set to, by attribute id (do-operator)
+        :param rng: The random generator for the abduction (a numpy.random.Generator).
+            If this is None, a generator with fresh entropy is made.
+        :param uniforms: The uniform numbers that the valuations of the factual log drew, for some attributes,
+            by attribute id, as an array with one number per row of the log. Attributes without stored uniforms
+            are resampled.
+        :return: The counterfactual log, which shares the unaffected columns with the factual log
+        """
+        valuations = dict() if valuations is None else valuations
+        interventions = dict() if interventions is None else interventions
+        uniforms = dict() if uniforms is None else uniforms
+        if rng is None:
+            rng = numpy.random.default_rng()
+        for attr_id, label in interventions.items():
+            validate_condition(attr_id in self.__attributes, 'Unknown attribute "{0}".'.format(attr_id))
+            validate_condition(label in self.__attributes[attr_id].get_labels(),
+                               'Attribute "{0}" has no label "{1}".'.format(attr_id, label))
+        affected_ids = self.get_affected_attribute_ids(valuations, interventions)
+        aggregated_ids = [attr_id for attr_id in affected_ids if self.__causal_model.get_aggregated_preset(attr_id)]
+        validate_condition(not aggregated_ids,
+                           "Attributes with aggregated dependencies ({0}) cannot be rewritten case by case."
+                           .format(aggregated_ids))
+        log_attribute_ids = [attr.get_id() for attr in log.get_attributes()]
+        validate_condition(all(attr_id in log_attribute_ids for attr_id in affected_ids),
+                           "The log has no columns for {0}.".format(
+                               [attr_id for attr_id in affected_ids if attr_id not in log_attribute_ids]))
+        case_ids = log.get_column("case_id")
+        # attributes are observed when an activity starts, which is when the simulation assigns the event id,
+        # while the timestamp is the completion, so that concurrent events may complete in another order
+        order = numpy.lexsort((log.get_column("event_id"), case_ids))
+        is_case_start = numpy.ones(len(order), dtype=bool)
+        is_case_start[1:] = case_ids[order][1:] != case_ids[order][:-1]
+        case_starts = numpy.maximum.accumulate(numpy.where(is_case_start, numpy.arange(len(order)), 0))
+        factual_columns = {attr_id: log.get_column(attr_id) for attr_id in log_attribute_ids}
+        counterfactual_columns = dict(factual_columns)
+        # the latest observation of each attribute in the case, at each row, by attribute id
+        factual_states = dict()
+        counterfactual_states = dict()
+        for attr_id in affected_ids:
+            factual_valuation = self.__causal_model.get_attribute_valuations().get_attribute_valuation(attr_id)
+            valuation = valuations.get(attr_id, factual_valuation)
+            for parameter_id in self.__get_parameter_ids(factual_valuation) + self.__get_parameter_ids(valuation):
+                if parameter_id not in factual_states:
+                    factual_states[parameter_id] = self.__get_states(
+                        factual_columns[parameter_id], order, case_starts)
+                if parameter_id not in counterfactual_states:
+                    counterfactual_states[parameter_id] = factual_states[parameter_id] \
+                        if counterfactual_columns[parameter_id] is factual_columns[parameter_id] \
+                        else self.__get_states(counterfactual_columns[parameter_id], order, case_starts)
+            codes = factual_columns[attr_id]
+            rows = numpy.flatnonzero(codes != MISSING_CODE)
+            new_codes = codes.copy()
+            if attr_id in interventions:
+                new_codes[rows] = self.__attributes[attr_id].get_labels().index(interventions[attr_id])
+            else:
+                factual_configurations, is_factual_observed = self.__get_configurations(
+                    factual_valuation, factual_states, rows)
+                configurations, is_observed = self.__get_configurations(valuation, counterfactual_states, rows)
+                # events whose parameters and valuation do not change keep their outcome
+                if valuation is factual_valuation:
+                    changed = is_observed & (configurations != factual_configurations)
+                else:
+                    changed = is_observed
+                changed &= is_factual_observed
+                rows, factual_configurations, configurations = \
+                    rows[changed], factual_configurations[changed], configurations[changed]
+                u = self.__get_uniforms(attr_id, factual_valuation, codes[rows], factual_configurations,
+                                        uniforms.get(attr_id), rows, rng)
+                new_codes[rows] = self.__get_outcomes(valuation, configurations, u)
+            counterfactual_columns[attr_id] = new_codes
+        columns = {column: log.get_column(column) for column in ["event_id", "case_id", "activity", "timestamp"]}
+        columns.update(counterfactual_columns)
+        counterfactual_log = ColumnarEventLog(log.get_activity_names(), log.get_attributes())
+        if len(order):
+            counterfactual_log.append_chunk(columns)
+        return counterfactual_log
+
+    def __get_states(self, codes: numpy.ndarray, order: numpy.ndarray, case_starts: numpy.ndarray) -> numpy.ndarray:
+        """
+        Forward-fill a column within each case: at each row, the latest observed code of the case so far
+        (in the order of event ids, that is, in the order in which the events started), or MISSING_CODE.
+        """
+        ordered_codes = codes[order]
+        positions = numpy.arange(len(order))
+        latest = numpy.maximum.accumulate(numpy.where(ordered_codes != MISSING_CODE, positions, -1))
+        ordered_states = numpy.where(latest >= case_starts, ordered_codes[numpy.maximum(latest, 0)], MISSING_CODE)
+        states = numpy.empty_like(ordered_states)
+        states[order] = ordered_states
+        return states
+
+    def __get_uniforms(self, attr_id: str, valuation: BayesianValuation, codes: numpy.ndarray,
+                       configurations: numpy.ndarray, stored_uniforms, rows: numpy.ndarray, rng) -> numpy.ndarray:
+        """
+        Abduct the uniform numbers that the factual valuation drew for some outcomes.
+        """
+        if stored_uniforms is not None:
+            return numpy.asarray(stored_uniforms)[rows]
+        parameter_labels = [self.__attributes[parameter_id].get_labels()
+                            for parameter_id in self.__get_parameter_ids(valuation)]
+        cdf = get_inverse_cdf_table(valuation, parameter_labels)
+        labels = self.__attributes[attr_id].get_labels()
+        sorted_positions = numpy.argsort(numpy.argsort(labels))
+        outcome_positions = sorted_positions[codes]
+        upper = cdf[configurations, outcome_positions]
+        lower = numpy.where(outcome_positions > 0,
+                            cdf[configurations, numpy.maximum(outcome_positions - 1, 0)], 0.0)
+        # an outcome that the valuation cannot yield carries no information on the number
+        impossible = upper <= lower
+        lower = numpy.where(impossible, 0.0, lower)
+        upper = numpy.where(impossible, 1.0, upper)
+        return lower + (upper - lower) * rng.random(len(rows))
+
+    def __get_outcomes(self, valuation: BayesianValuation, configurations: numpy.ndarray,
+                       u: numpy.ndarray) -> numpy.ndarray:
+        """
+        Apply a valuation to uniform numbers by inverse transform sampling, as BayesianValuation.sample does.
+        """
+        parameter_labels = [self.__attributes[parameter_id].get_labels()
+                            for parameter_id in self.__get_parameter_ids(valuation)]
+        cdf = get_inverse_cdf_table(valuation, parameter_labels)[configurations]
+        sorted_positions = numpy.minimum(numpy.sum(u[:, None] >= cdf, axis=1), cdf.shape[1] - 1)
+        labels = valuation.outcome_attribute.get_labels()
+        codes_by_sorted_position = numpy.argsort(labels)
+        return codes_by_sorted_position[sorted_positions]
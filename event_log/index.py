@@ -0,0 +1,41 @@
+import numpy
+
+
+class GroupIndex:
+
+    def __init__(self, keys: numpy.ndarray, sort_keys: list[numpy.ndarray] = None):
+        """
+        An index from the values of a column (e.g., case ids) to the rows that have them, stored as one
+        permutation of the rows grouped by key, plus the start of each group. Looking up a key is a binary search.
+
+        :param keys: The column to group by
+        :param sort_keys: Columns to order the rows within a group by, most significant first (e.g., timestamps)
+        """
+        if sort_keys is None:
+            sort_keys = []
+        # lexsort sorts by the last key first
+        self.__order = numpy.lexsort(tuple(reversed([keys] + list(sort_keys))))
+        self.__keys, self.__starts = numpy.unique(keys[self.__order], return_index=True)
+        self.__ends = numpy.append(self.__starts[1:], len(self.__order))
+
+    def get_keys(self) -> numpy.ndarray:
+        return self.__keys
+
+    def get_group_sizes(self) -> numpy.ndarray:
+        return self.__ends - self.__starts
+
+    def has_key(self, key) -> bool:
+        i = numpy.searchsorted(self.__keys, key)
+        return i < len(self.__keys) and self.__keys[i] == key
+
+    def get_rows(self, key) -> numpy.ndarray:
+        """
+        Get the rows with some key, ordered by the sort keys.
+
+        :param key: The key
+        :return: The row indices (empty if no row has the key)
+        """
+        i = numpy.searchsorted(self.__keys, key)
+        if i == len(self.__keys) or self.__keys[i] != key:
+            return self.__order[0:0]
+        return self.__order[self.__starts[i]:self.__ends[i]]
@@ -0,0 +1,254 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from causal_model.causal_process_model import CausalProcessModel
+from causal_model.causal_process_structure import CPM_Categorical_Attribute
+from event_log.columnar import ColumnarEventLog
+from event_log.index import GroupIndex
+from simulation_model.functions import get_event_table_file_path
+from simulation_model.simulation_parameters import SimulationParameters
+from simulation_model.simulator import VALUE_SEPARATOR, EVENT_TABLE_COLUMNS, PROCESS_START_TIME, WEIGHT_COLUMN
+from utils.validators import validate_condition
+
+
+class IndexedEventLog:
+
+    def __init__(self, log: ColumnarEventLog):
+        """
+        A columnar event log with indexes from case ids and from activities to their events.
+        The events of a case, and of an activity, are ordered by timestamp (and event id for equal timestamps).
+
+        :param log: The log
+        """
+        self.log = log
+        timestamps = log.get_column("timestamp")
+        event_ids = log.get_column("event_id")
+        self.case_index = GroupIndex(log.get_column("case_id"), [timestamps, event_ids])
+        self.activity_index = GroupIndex(log.get_column("activity"), [timestamps, event_ids])
+
+    def get_case_rows(self, case_id: int) -> numpy.ndarray:
+        return self.case_index.get_rows(case_id)
+
+    def get_activity_rows(self, activity_name: str) -> numpy.ndarray:
+        activity_names = self.log.get_activity_names()
+        if activity_name not in activity_names:
+            return numpy.empty(0, dtype=numpy.int64)
+        return self.activity_index.get_rows(activity_names.index(activity_name))
+
+
+def get_event_table_paths(directory: str, model_name: str) -> list[str]:
+    """
+    Find the event tables that a simulation of a model has written.
+
+    :param directory: The directory of the tables
+    :param model_name: The name of the model
+    :return: The paths of the tables, sorted
+    """
+    pattern = os.path.basename(get_event_table_file_path("*", glob.escape(model_name)))
+    return sorted(glob.glob(os.path.join(directory, pattern)))
+
+
+def split_into_chunks(path: str, chunk_size: int) -> list[tuple[str, int, int]]:
+    """
+    Split the rows of an event table into byte ranges of roughly equal size.
+    Ranges are aligned to lines when they are read, so that the boundaries can be arbitrary.
+
+    :param path: The event table
+    :param chunk_size: The size of a range in bytes
+    :return: The ranges as (path, start, end)
+    """
+    with open(path, "rb") as file:
+        file.readline()
+        header_end = file.tell()
+    size = os.path.getsize(path)
+    return [(path, start, min(start + chunk_size, size)) for start in range(header_end, size, chunk_size)]
+
+
+def read_chunk(path: str, start: int, end: int) -> list[list[str]]:
+    """
+    Read the rows that begin within a byte range of an event table.
+
+    :param path: The event table
+    :param start: The first byte of the range
+    :param end: The end of the range (exclusive)
+    :return: The rows, split into fields
+    """
+    with open(path, "rb") as file:
+        # a row belongs to the range in which it begins
+        file.seek(start - 1)
+        file.readline()
+        begin = file.tell()
+        if begin >= end:
+            return []
+        data = file.read(end - begin)
+        if not data.endswith(b"\n"):
+            data += file.readline()
+    return [line.split(VALUE_SEPARATOR) for line in data.decode().splitlines() if line]
+
+
+def encode_labels(values: numpy.ndarray, labels: list[str], column: str) -> numpy.ndarray:
+    """
+    Encode a column of labels as their indices, vectorized over the distinct values.
+
+    :param values: The values
+    :param labels: The admissible labels, in the order of their codes
+    :param column: The name of the column (for error messages)
+    :return: The codes
+    """
+    distinct_values, inverse = numpy.unique(values, return_inverse=True)
+    label_codes = {label: code for code, label in enumerate(labels)}
+    unknown_values = [v for v in distinct_values if v not in label_codes]
+    validate_condition(not unknown_values,
+                       'Column "{0}" has values {1} that are not among its labels.'.format(column, unknown_values))
+    return numpy.array([label_codes[v] for v in distinct_values], dtype=numpy.int64)[inverse]
+
+
+def parse_event_ids(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.char.replace(values, SimulationParameters.EVENT_ID_PREFIX, "").astype(numpy.int64)
+
+
+def parse_case_ids(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.char.replace(values, SimulationParameters.CASE_ID_PREFIX, "").astype(numpy.int64)
+
+
+def parse_timestamps(values: numpy.ndarray) -> numpy.ndarray:
+    """
+    Parse timestamps written by t2s (in UTC) into seconds of model time.
+    Timestamps that are written as model time (see functions.TimestampFormat) are taken as they are.
+
+    :param values: The timestamps
+    :return: The seconds
+    """
+    if len(values) and "-" not in values[0]:
+        return values.astype(float)
+    return values.astype("datetime64[s]").astype(numpy.int64) - PROCESS_START_TIME
+
+
+def model_times_to_datetimes(values) -> numpy.ndarray:
+    """
+    Convert points in model time into dates in UTC, truncated to seconds, as t2s does in the generated CPN.
+
+    :param values: The points in model time, in seconds (numbers, or strings of numbers)
+    :return: The dates (numpy.datetime64)
+    """
+    seconds = numpy.floor(numpy.asarray(values, dtype=float) + PROCESS_START_TIME).astype(numpy.int64)
+    return seconds.astype("datetime64[s]")
+
+
+def format_model_times(values) -> numpy.ndarray:
+    """
+    Format points in model time as t2s does in the generated CPN (in UTC), e.g., "2024-11-28 08:00:00",
+    so that a MODEL_TIME table converted by format_event_table_timestamps matches a DATETIME table of the same run.
+    Model times written with three decimals may have been rounded up to the next second, though, which then
+    also shows in the formatted timestamp.
+
+    :param values: The points in model time, in seconds (numbers, or strings of numbers)
+    :return: The timestamps
+    """
+    return numpy.char.replace(numpy.datetime_as_string(model_times_to_datetimes(values), unit="s"), "T", " ")
+
+
+def format_event_table_timestamps(directory: str, model_name: str, output_directory: str = None):
+    """
+    Convert the timestamps of the event tables of a model that are written as model time
+    (see functions.TimestampFormat) into dates, one column per table at a time.
+    Tables whose timestamps are dates already are copied as they are.
+
+    :param directory: The directory of the tables
+    :param model_name: The name of the model
+    :param output_directory: The directory to write the converted tables to. If this is None,
+        the tables are converted in place.
+    """
+    output_directory = directory if output_directory is None else output_directory
+    os.makedirs(output_directory, exist_ok=True)
+    timestamp_index = EVENT_TABLE_COLUMNS.index("timestamp")
+    for path in get_event_table_paths(directory, model_name):
+        with open(path, "r") as file:
+            header = file.readline()
+            rows = [line.rstrip("\n").split(VALUE_SEPARATOR) for line in file if line.strip()]
+        if rows and "-" not in rows[0][timestamp_index]:
+            timestamps = format_model_times([row[timestamp_index] for row in rows])
+            for row, timestamp in zip(rows, timestamps.tolist()):
+                row[timestamp_index] = timestamp
+        output_path = os.path.join(output_directory, os.path.basename(path))
+        temporary_path = output_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(header)
+            file.writelines(VALUE_SEPARATOR.join(row) + "\n" for row in rows)
+        os.replace(temporary_path, output_path)
+
+
+def parse_chunk(path: str, start: int, end: int, activity_names: list[str],
+                attribute_labels_by_name: dict[str, tuple[str, list[str]]]) -> dict[str, numpy.ndarray]:
+    """
+    Parse a byte range of an event table into encoded columns.
+
+    :param path: The event table
+    :param start: The first byte of the range
+    :param end: The end of the range (exclusive)
+    :param activity_names: The activities, in the order of their codes
+    :param attribute_labels_by_name: For each attribute name, the attribute id and the labels
+    :return: An array for each column of the columnar log
+    """
+    with open(path, "r") as file:
+        header = file.readline().rstrip("\n").split(VALUE_SEPARATOR)
+    validate_condition(header[:len(EVENT_TABLE_COLUMNS)] == EVENT_TABLE_COLUMNS,
+                       "{0} is not an event table.".format(path))
+    rows = read_chunk(path, start, end)
+    if not rows:
+        return dict()
+    fields = numpy.array(rows, dtype=str)
+    columns = {
+        "event_id": parse_event_ids(fields[:, 0]),
+        "case_id": parse_case_ids(fields[:, 1]),
+        "activity": encode_labels(fields[:, 2], activity_names, "activity"),
+        "timestamp": parse_timestamps(fields[:, 3]),
+    }
+    for i, column in enumerate(header[len(EVENT_TABLE_COLUMNS):], start=len(EVENT_TABLE_COLUMNS)):
+        if column == WEIGHT_COLUMN:
+            # the weights of importance sampling are not kept in the columnar log
+            continue
+        validate_condition(column in attribute_labels_by_name,
+                           '{0} has a column "{1}" that is no attribute of the model.'.format(path, column))
+        attr_id, labels = attribute_labels_by_name[column]
+        columns[attr_id] = encode_labels(fields[:, i], labels, column)
+    return columns
+
+
+def load_event_tables(directory: str, model_name: str, causal_model: CausalProcessModel,
+                      activity_names: list[str] = None, workers: int = None,
+                      chunk_size: int = 2 ** 24) -> IndexedEventLog:
+    """
+    Load the event tables that a simulation of a model has written (one per activity) into an indexed columnar log.
+    The tables are split into chunks of bytes, which are parsed in parallel worker processes.
+    Labels are encoded by the attribute domains of the causal model.
+
+    :param directory: The directory of the tables
+    :param model_name: The name of the model
+    :param causal_model: The causal model of the simulation
+    :param activity_names: The activities, in the order of their codes. If this is None,
+        the activities of the causal model are taken.
+    :param workers: The number of worker processes. If this is None or 1, the chunks are parsed sequentially.
+    :param chunk_size: The size of a chunk in bytes
+    :return: The log
+    """
+    if activity_names is None:
+        activity_names = causal_model.get_activity_names()
+    attributes = [attr for attr in causal_model.get_attributes() if isinstance(attr, CPM_Categorical_Attribute)]
+    attribute_labels_by_name = {attr.get_name(): (attr.get_id(), attr.get_labels()) for attr in attributes}
+    chunks = [chunk for path in get_event_table_paths(directory, model_name)
+              for chunk in split_into_chunks(path, chunk_size)]
+    chunk_arguments = [(path, start, end, activity_names, attribute_labels_by_name) for path, start, end in chunks]
+    if workers is None or workers <= 1 or len(chunks) <= 1:
+        parsed_chunks = [parse_chunk(*arguments) for arguments in chunk_arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed_chunks = list(executor.map(parse_chunk, *zip(*chunk_arguments)))
+    log = ColumnarEventLog(activity_names, attributes)
+    for columns in parsed_chunks:
+        if columns:
+            log.append_chunk(columns)
+    return IndexedEventLog(log)
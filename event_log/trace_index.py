@@ -0,0 +1,309 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from event_log.loading import parse_event_ids, parse_case_ids, parse_timestamps, get_event_table_paths
+from simulation_model.functions import get_event_table_file_path
+from simulation_model.simulator import VALUE_SEPARATOR, EVENT_TABLE_COLUMNS
+from utils.validators import validate_condition
+
+TRACE_INDEX_SUFFIX = ".traceindex.npz"
+# how many case ids are kept as samples of each variant
+NUMBER_OF_VARIANT_SAMPLES = 5
+# the base of the polynomial hash of an activity sequence
+VARIANT_HASH_BASE = numpy.uint64(1099511628211)
+
+
+def get_trace_index_path(directory: str, model_name: str):
+    return os.path.join(directory, model_name + TRACE_INDEX_SUFFIX)
+
+
+def get_log_table_paths(directory: str, model_name: str) -> list[str]:
+    """
+    Find the event tables of a log, or, if there are none, those written by shards of the model.
+    Merging the tables of the shards (see SimulationModel.merge_CPN_shard_event_tables) writes the tables of the log
+    next to them, so that the tables of the shards are left out then, since they hold the same events.
+
+    :param directory: The directory of the tables
+    :param model_name: The name of the model
+    :return: The paths of the tables, sorted
+    """
+    table_paths = get_event_table_paths(directory, model_name)
+    if table_paths:
+        return table_paths
+    shard_pattern = os.path.basename(get_event_table_file_path("*", glob.escape(model_name) + "_shard*"))
+    return sorted(glob.glob(os.path.join(directory, shard_pattern)))
+
+
+def scan_event_table(path: str) -> dict[str, numpy.ndarray]:
+    """
+    Read the case id, event id, activity and timestamp of each row of an event table, and the byte offset of the row.
+
+    :param path: The event table
+    :return: An array for each of case_id, event_id, activity (names), timestamp and offset
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    lines = data.split(b"\n")
+    line_offsets = numpy.cumsum([0] + [len(line) + 1 for line in lines[:-1]])
+    header = lines[0].decode().split(VALUE_SEPARATOR)
+    validate_condition(header[:len(EVENT_TABLE_COLUMNS)] == EVENT_TABLE_COLUMNS,
+                       "{0} is not an event table.".format(path))
+    row_numbers = [i for i in range(1, len(lines)) if lines[i]]
+    fields = numpy.array([lines[i].decode().split(VALUE_SEPARATOR, len(EVENT_TABLE_COLUMNS))[:len(EVENT_TABLE_COLUMNS)]
+                          for i in row_numbers], dtype=str).reshape(-1, len(EVENT_TABLE_COLUMNS))
+    return {
+        "event_id": parse_event_ids(fields[:, 0]),
+        "case_id": parse_case_ids(fields[:, 1]),
+        "activity": fields[:, 2],
+        "timestamp": parse_timestamps(fields[:, 3]),
+        "offset": line_offsets[row_numbers].astype(numpy.int64),
+    }
+
+
+def mix_hashes(h: numpy.ndarray) -> numpy.ndarray:
+    # the finalizer of splitmix64, so that similar sequences get unrelated hashes
+    h = (h ^ (h >> numpy.uint64(30))) * numpy.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> numpy.uint64(27))) * numpy.uint64(0x94d049bb133111eb)
+    return h ^ (h >> numpy.uint64(31))
+
+
+def get_sequence_hashes(codes: numpy.ndarray, starts: numpy.ndarray, lengths: numpy.ndarray) -> numpy.ndarray:
+    """
+    Hash consecutive sequences of codes, vectorized: a polynomial in the codes modulo 2^64, mixed with the length.
+
+    :param codes: The codes of all sequences, one after another
+    :param starts: Where each sequence starts
+    :param lengths: How long each sequence is (positive)
+    :return: The hash of each sequence
+    """
+    positions = numpy.arange(len(codes)) - numpy.repeat(starts, lengths)
+    # BASE^k modulo 2^64, since unsigned integer arithmetic wraps around
+    powers = numpy.ones(int(lengths.max()), dtype=numpy.uint64)
+    powers[1:] = numpy.cumprod(numpy.full(len(powers) - 1, VARIANT_HASH_BASE, dtype=numpy.uint64))
+    terms = (codes.astype(numpy.uint64) + numpy.uint64(1)) * powers[positions]
+    h = numpy.add.reduceat(terms, starts)
+    return mix_hashes(h ^ (lengths.astype(numpy.uint64) * numpy.uint64(0x9e3779b97f4a7c15))).view(numpy.int64)
+
+
+class TraceIndex:
+
+    def __init__(self, directory: str, model_name: str):
+        """
+        A persistent index over the event tables of a simulated log (or the tables of its shards), to look up
+        the events of a case without scanning the tables, and to count the variants (activity sequences) of the log.
+        For each event, it stores the case id, the table and byte offset of its row, its timestamp and activity.
+        The index is stored next to the tables, and only tables that are new or have changed are scanned on updates.
+
+        :param directory: The directory of the tables
+        :param model_name: The name of the model
+        """
+        self.directory = directory
+        self.model_name = model_name
+        self.__file_names = []
+        self.__file_sizes = []
+        self.__file_mtimes = []
+        self.__activity_names = []
+        self.__entries = {
+            "case_id": numpy.empty(0, dtype=numpy.int64),
+            "event_id": numpy.empty(0, dtype=numpy.int64),
+            "timestamp": numpy.empty(0, dtype=numpy.float64),
+            "activity": numpy.empty(0, dtype=numpy.int32),
+            "file_index": numpy.empty(0, dtype=numpy.int32),
+            "offset": numpy.empty(0, dtype=numpy.int64),
+        }
+        self.__variant_hashes = numpy.empty(0, dtype=numpy.int64)
+        self.__variant_counts = numpy.empty(0, dtype=numpy.int64)
+        self.__variant_samples = numpy.empty((0, NUMBER_OF_VARIANT_SAMPLES), dtype=numpy.int64)
+        self.__min_case_id = 0
+        self.__case_starts = numpy.zeros(1, dtype=numpy.int64)
+
+    @classmethod
+    def build(cls, directory: str, model_name: str, workers: int = None):
+        """
+        Load the index of a log if it has been stored, bring it up to date with the tables, and store it.
+
+        :param directory: The directory of the tables
+        :param model_name: The name of the model
+        :param workers: The number of worker processes to scan new tables with
+        :return: The index
+        """
+        index = cls(directory, model_name)
+        if os.path.exists(get_trace_index_path(directory, model_name)):
+            index.load()
+        if index.update(workers):
+            index.save()
+        return index
+
+    def load(self):
+        with numpy.load(get_trace_index_path(self.directory, self.model_name), allow_pickle=False) as data:
+            self.__file_names = [str(name) for name in data["file_names"]]
+            self.__file_sizes = [int(size) for size in data["file_sizes"]]
+            self.__file_mtimes = [float(mtime) for mtime in data["file_mtimes"]]
+            self.__activity_names = [str(name) for name in data["activity_names"]]
+            for column in self.__entries:
+                self.__entries[column] = data[column]
+            self.__variant_hashes = data["variant_hashes"]
+            self.__variant_counts = data["variant_counts"]
+            self.__variant_samples = data["variant_samples"]
+        self.__make_case_starts()
+
+    def save(self):
+        numpy.savez_compressed(
+            get_trace_index_path(self.directory, self.model_name),
+            file_names=numpy.array(self.__file_names, dtype=str),
+            file_sizes=numpy.array(self.__file_sizes, dtype=numpy.int64),
+            file_mtimes=numpy.array(self.__file_mtimes, dtype=numpy.float64),
+            activity_names=numpy.array(self.__activity_names, dtype=str),
+            variant_hashes=self.__variant_hashes,
+            variant_counts=self.__variant_counts,
+            variant_samples=self.__variant_samples,
+            **self.__entries)
+
+    def update(self, workers: int = None) -> bool:
+        """
+        Scan the tables that are new or have changed since they were indexed, and drop the tables that are gone.
+
+        :param workers: The number of worker processes to scan tables with. If this is None or 1,
+            tables are scanned sequentially.
+        :return: Whether the index has changed
+        """
+        current_files = {}
+        for path in get_log_table_paths(self.directory, self.model_name):
+            stat = os.stat(path)
+            current_files[os.path.basename(path)] = (stat.st_size, stat.st_mtime)
+        unchanged_file_indices = [
+            i for i, name in enumerate(self.__file_names)
+            if current_files.get(name) == (self.__file_sizes[i], self.__file_mtimes[i])
+        ]
+        indexed_names = set(self.__file_names[i] for i in unchanged_file_indices)
+        new_names = [name for name in current_files if name not in indexed_names]
+        if len(unchanged_file_indices) == len(self.__file_names) and not new_names:
+            return False
+        # keep the entries of unchanged tables, renumbering the tables
+        file_renumbering = numpy.full(len(self.__file_names) + 1, -1, dtype=numpy.int32)
+        file_renumbering[unchanged_file_indices] = numpy.arange(len(unchanged_file_indices), dtype=numpy.int32)
+        kept = file_renumbering[self.__entries["file_index"]] >= 0
+        parts = [{column: values[kept] for column, values in self.__entries.items()}]
+        parts[0]["file_index"] = file_renumbering[parts[0]["file_index"]]
+        self.__file_names = [self.__file_names[i] for i in unchanged_file_indices]
+        self.__file_sizes = [self.__file_sizes[i] for i in unchanged_file_indices]
+        self.__file_mtimes = [self.__file_mtimes[i] for i in unchanged_file_indices]
+        new_paths = [os.path.join(self.directory, name) for name in new_names]
+        if workers is None or workers <= 1 or len(new_paths) <= 1:
+            scanned_tables = [scan_event_table(path) for path in new_paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                scanned_tables = list(executor.map(scan_event_table, new_paths))
+        for name, scanned_table in zip(new_names, scanned_tables):
+            file_index = len(self.__file_names)
+            self.__file_names.append(name)
+            self.__file_sizes.append(current_files[name][0])
+            self.__file_mtimes.append(current_files[name][1])
+            activity_codes = numpy.empty(len(scanned_table["activity"]), dtype=numpy.int32)
+            for activity_name in numpy.unique(scanned_table["activity"]):
+                if activity_name not in self.__activity_names:
+                    self.__activity_names.append(str(activity_name))
+                activity_codes[scanned_table["activity"] == activity_name] = \
+                    self.__activity_names.index(activity_name)
+            parts.append({
+                "case_id": scanned_table["case_id"],
+                "event_id": scanned_table["event_id"],
+                "timestamp": scanned_table["timestamp"].astype(numpy.float64),
+                "activity": activity_codes,
+                "file_index": numpy.full(len(activity_codes), file_index, dtype=numpy.int32),
+                "offset": scanned_table["offset"],
+            })
+        entries = {column: numpy.concatenate([part[column] for part in parts]) for column in self.__entries}
+        order = numpy.lexsort((entries["event_id"], entries["timestamp"], entries["case_id"]))
+        self.__entries = {column: values[order] for column, values in entries.items()}
+        self.__make_case_starts()
+        self.__make_variants()
+        return True
+
+    def __make_case_starts(self):
+        """
+        Case ids are (mostly) consecutive, so that the events of a case are found by its offset from the smallest id.
+        """
+        case_ids = self.__entries["case_id"]
+        if not len(case_ids):
+            self.__min_case_id = 0
+            self.__case_starts = numpy.zeros(1, dtype=numpy.int64)
+            return
+        self.__min_case_id = int(case_ids[0])
+        self.__case_starts = numpy.searchsorted(case_ids, numpy.arange(self.__min_case_id, int(case_ids[-1]) + 2))
+
+    def __make_variants(self):
+        case_ids = self.__entries["case_id"]
+        if not len(case_ids):
+            self.__variant_hashes = numpy.empty(0, dtype=numpy.int64)
+            self.__variant_counts = numpy.empty(0, dtype=numpy.int64)
+            self.__variant_samples = numpy.empty((0, NUMBER_OF_VARIANT_SAMPLES), dtype=numpy.int64)
+            return
+        distinct_case_ids, starts, lengths = numpy.unique(case_ids, return_index=True, return_counts=True)
+        case_hashes = get_sequence_hashes(self.__entries["activity"], starts, lengths)
+        # sorting by hash keeps the case ids of a variant ascending, since distinct_case_ids is sorted
+        order = numpy.argsort(case_hashes, kind="stable")
+        self.__variant_hashes, variant_starts, self.__variant_counts = numpy.unique(
+            case_hashes[order], return_index=True, return_counts=True)
+        self.__variant_samples = numpy.full((len(variant_starts), NUMBER_OF_VARIANT_SAMPLES), -1, dtype=numpy.int64)
+        for k in range(NUMBER_OF_VARIANT_SAMPLES):
+            has_sample = self.__variant_counts > k
+            self.__variant_samples[has_sample, k] = distinct_case_ids[order[variant_starts[has_sample] + k]]
+
+    def __get_case_entry_range(self, case_id: int) -> tuple[int, int]:
+        i = case_id - self.__min_case_id
+        if i < 0 or i + 1 >= len(self.__case_starts):
+            return 0, 0
+        return int(self.__case_starts[i]), int(self.__case_starts[i + 1])
+
+    def get_case_locations(self, case_id: int) -> list[tuple[str, int]]:
+        """
+        Get where the events of a case are stored, ordered by timestamp.
+
+        :param case_id: The case id (without prefix)
+        :return: The path of the table and the byte offset of the row of each event
+        """
+        start, end = self.__get_case_entry_range(case_id)
+        return [(os.path.join(self.directory, self.__file_names[f]), int(offset))
+                for f, offset in zip(self.__entries["file_index"][start:end], self.__entries["offset"][start:end])]
+
+    def read_case(self, case_id: int) -> list[list[str]]:
+        """
+        Read the rows of the events of a case from the tables, ordered by timestamp.
+
+        :param case_id: The case id (without prefix)
+        :return: The rows, split into fields
+        """
+        rows = []
+        for path, offset in self.get_case_locations(case_id):
+            with open(path, "r") as file:
+                file.seek(offset)
+                rows.append(file.readline().rstrip("\n").split(VALUE_SEPARATOR))
+        return rows
+
+    def get_case_activities(self, case_id: int) -> list[str]:
+        start, end = self.__get_case_entry_range(case_id)
+        return [self.__activity_names[a] for a in self.__entries["activity"][start:end]]
+
+    def get_number_of_cases(self) -> int:
+        return int(self.__variant_counts.sum())
+
+    def get_number_of_variants(self) -> int:
+        return len(self.__variant_hashes)
+
+    def get_variants(self) -> list[tuple[list[str], int, list[int]]]:
+        """
+        Get the variants of the log, most frequent first.
+
+        :return: For each variant its activity sequence, its number of cases, and some of its case ids
+        """
+        variants = []
+        for i in numpy.argsort(-self.__variant_counts, kind="stable"):
+            sample_case_ids = [int(c) for c in self.__variant_samples[i] if c >= 0]
+            variants.append((self.get_case_activities(sample_case_ids[0]),
+                             int(self.__variant_counts[i]),
+                             sample_case_ids))
+        return variants
@@ -212,7 +212,28 @@ class SimplePetriNet:
         incoming_arcs = [a for a in self.__arcs if a.get_target().get_id() == node_id]
         return incoming_arcs
 
+    def get_outgoing_arcs(self, node_id: str):
+        """
+        Get all arcs outgoing from a node of the net.
+
+        :param node_id: The id of the SimplePetriNetNode
+        :return: The arcs
+        """
+        a: SimplePetriNetArc
+        outgoing_arcs = [a for a in self.__arcs if a.get_source().get_id() == node_id]
+        return outgoing_arcs
+
     def get_initial_places(self):
         p: SimplePetriNetPlace
         initial_places = [p for p in self.__places if p.is_initial]
         return initial_places
+
+    def get_final_places(self):
+        """
+        Get all places of the net that have no outgoing arcs, that is, the places where cases end.
+
+        :return: The final places
+        """
+        p: SimplePetriNetPlace
+        final_places = [p for p in self.__places if not self.get_outgoing_arcs(p.get_id())]
+        return final_places
@@ -0,0 +1,196 @@
+from collections import deque
+
+from causal_model.aggregation import AggregationSelection, LastKSelection, TimeWindowSelection, \
+    ExponentialDecaySelection, AggregationFunction
+from causal_model.causal_process_model import CausalProcessModel
+from causal_model.causal_process_structure import AttributeRelation, CPM_Categorical_Attribute
+from utils.validators import validate_condition
+
+
+class AggregationState:
+
+    def __init__(self, number_of_labels: int):
+        """
+        The state of one aggregated dependency: label counts over the currently selected observations
+        of the aggregated attribute. Observations are passed as label indices, times in seconds of model time,
+        and are assumed to arrive in non-decreasing time order.
+
+        :param number_of_labels: How many labels the aggregated attribute has
+        """
+        self.counts = [0] * number_of_labels
+        self.total = 0
+
+    def observe(self, label_index: int, t: float):
+        raise NotImplementedError()
+
+    def expire(self, t: float):
+        """
+        Forget about (or discount) observations that fall out of the selection at time t.
+
+        :param t: The current time
+        """
+        pass
+
+    def get_counts(self, t: float) -> tuple[list, float]:
+        self.expire(t)
+        return list(self.counts), self.total
+
+
+class LastKState(AggregationState):
+
+    def __init__(self, number_of_labels: int, k: int):
+        super().__init__(number_of_labels)
+        self.__buffer = deque(maxlen=k)
+
+    def observe(self, label_index: int, t: float):
+        if len(self.__buffer) == self.__buffer.maxlen:
+            evicted_index = self.__buffer[0]
+            self.counts[evicted_index] -= 1
+            self.total -= 1
+        self.__buffer.append(label_index)
+        self.counts[label_index] += 1
+        self.total += 1
+
+
+class TimeWindowState(AggregationState):
+
+    def __init__(self, number_of_labels: int, window_seconds: float):
+        super().__init__(number_of_labels)
+        self.__window_seconds = window_seconds
+        self.__buffer = deque()
+
+    def observe(self, label_index: int, t: float):
+        self.__buffer.append((t, label_index))
+        self.counts[label_index] += 1
+        self.total += 1
+        self.expire(t)
+
+    def expire(self, t: float):
+        # every observation is appended and evicted once, so this is O(1) amortized
+        while self.__buffer and t - self.__buffer[0][0] > self.__window_seconds:
+            _, evicted_index = self.__buffer.popleft()
+            self.counts[evicted_index] -= 1
+            self.total -= 1
+
+
+class ExponentialDecayState(AggregationState):
+
+    def __init__(self, number_of_labels: int, half_life_seconds: float):
+        super().__init__(number_of_labels)
+        self.counts = [0.0] * number_of_labels
+        self.total = 0.0
+        self.__half_life_seconds = half_life_seconds
+        self.__last_t = None
+
+    def observe(self, label_index: int, t: float):
+        self.expire(t)
+        self.counts[label_index] += 1.0
+        self.total += 1.0
+
+    def expire(self, t: float):
+        # decay lazily: all weights decay at the same rate, so scaling the counts is enough
+        if self.__last_t is not None and t > self.__last_t:
+            factor = 0.5 ** ((t - self.__last_t) / self.__half_life_seconds)
+            self.counts = [c * factor for c in self.counts]
+            self.total *= factor
+        if self.__last_t is None or t > self.__last_t:
+            self.__last_t = t
+
+
+def make_aggregation_state(selection: AggregationSelection, number_of_labels: int) -> AggregationState:
+    """
+    Create the (empty) state that an aggregation selection requires.
+
+    :param selection: The aggregation selection
+    :param number_of_labels: How many labels the aggregated attribute has
+    :return: The state
+    """
+    if isinstance(selection, LastKSelection):
+        return LastKState(number_of_labels, selection.k)
+    if isinstance(selection, TimeWindowSelection):
+        return TimeWindowState(number_of_labels, selection.get_window_seconds())
+    if isinstance(selection, ExponentialDecaySelection):
+        return ExponentialDecayState(number_of_labels, selection.get_half_life_seconds())
+    raise NotImplementedError("No aggregation state for selection {0}".format(type(selection).__name__))
+
+
+class AggregationEngine:
+
+    def __init__(self, causal_model: CausalProcessModel):
+        """
+        Maintain the states of all aggregated dependencies of a causal model during a simulation,
+        so that observing an attribute value and evaluating an aggregated dependency are O(1) amortized
+        (with respect to the history of the simulation) instead of a recomputation over the log.
+
+        :param causal_model: The causal model
+        """
+        self.__causal_model = causal_model
+        self.__states: dict[tuple[str, str], AggregationState] = dict()
+        self.__functions: dict[tuple[str, str], AggregationFunction] = dict()
+        self.__attributes_by_id: dict[str, CPM_Categorical_Attribute] = dict()
+        self.__label_indices: dict[str, dict[str, int]] = dict()
+        self.__relation_keys_by_in_attribute_id: dict[str, list[tuple[str, str]]] = dict()
+        relation: AttributeRelation
+        for relation in causal_model.get_aggregated_relations():
+            attr_in: CPM_Categorical_Attribute = relation.get_in()
+            attr_in_id = attr_in.get_id()
+            key = (attr_in_id, relation.get_out().get_id())
+            labels = attr_in.get_labels()
+            selection = causal_model.get_aggregation_selection().get_selection(relation)
+            self.__states[key] = make_aggregation_state(selection, len(labels))
+            self.__functions[key] = causal_model.get_aggregation_function().get_function(relation)
+            self.__attributes_by_id[attr_in_id] = attr_in
+            self.__label_indices[attr_in_id] = {label: i for i, label in enumerate(labels)}
+            self.__relation_keys_by_in_attribute_id.setdefault(attr_in_id, []).append(key)
+
+    def is_aggregated(self, attribute_id: str) -> bool:
+        """
+        Whether an attribute is the source of some aggregated dependency, that is, whether its observations
+        need to be passed to this engine.
+
+        :param attribute_id: The id of the attribute
+        """
+        return attribute_id in self.__relation_keys_by_in_attribute_id
+
+    def observe(self, attribute_id: str, label: str, t: float):
+        """
+        Record an observation of an attribute (in any case) for all aggregated dependencies it is the source of.
+
+        :param attribute_id: The id of the attribute
+        :param label: The observed label
+        :param t: The time of the observation (seconds of model time)
+        """
+        if attribute_id not in self.__relation_keys_by_in_attribute_id:
+            return
+        label_index = self.__label_indices[attribute_id][label]
+        for key in self.__relation_keys_by_in_attribute_id[attribute_id]:
+            self.__states[key].observe(label_index, t)
+
+    def evaluate(self, attr_in_id: str, attr_out_id: str, t: float) -> str:
+        """
+        Evaluate an aggregated dependency at some time, that is, apply its aggregation function
+        to the currently selected observations.
+
+        :param attr_in_id: The id of the aggregated attribute
+        :param attr_out_id: The id of the dependent attribute
+        :param t: The current time (seconds of model time)
+        :return: The aggregated label
+        """
+        key = (attr_in_id, attr_out_id)
+        validate_condition(key in self.__states,
+                           'There is no aggregated dependency from "{0}" to "{1}".'.format(attr_in_id, attr_out_id))
+        counts, total = self.__states[key].get_counts(t)
+        return self.__functions[key].aggregate(counts, total, self.__attributes_by_id[attr_in_id])
+
+    def evaluate_preset(self, attribute_id: str, t: float) -> dict[str, str]:
+        """
+        Evaluate all aggregated dependencies into some attribute.
+
+        :param attribute_id: The id of the dependent attribute
+        :param t: The current time (seconds of model time)
+        :return: The aggregated label for each aggregated attribute in the preset
+        """
+        return {
+            relation.get_in().get_id(): self.evaluate(relation.get_in().get_id(), attribute_id, t)
+            for relation in self.__causal_model.get_aggregated_preset(attribute_id)
+        }
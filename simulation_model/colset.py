@@ -2,7 +2,7 @@ from enum import Enum
 from xml.etree.ElementTree import Element
 
 from causal_model.causal_process_structure import AttributeActivities, CPM_Attribute, CPM_Attribute_Domain, \
-    CPM_Categorical_Attribute
+    CPM_Categorical_Attribute, AttributeRelation
 from simulation_model.cpn_utils.cpn import CPN
 from simulation_model.cpn_utils.xml_utils.cpn_id_managment import CPN_ID_Manager
 
@@ -158,6 +158,11 @@ class ColsetManager:
     CASEID_COLSET_NAME = COLSET_PREFIX + "cid"
     EVENTID_COLSET_NAME = COLSET_PREFIX + "eid"
     TIMEDINT_COLSET_NAME = COLSET_PREFIX + "timedint"
+    CASESTATE_COLSET_NAME = COLSET_PREFIX + "case_state"
+    OBSERVATIONSEQ_COLSET_NAME = COLSET_PREFIX + "obs_seq"
+    INTLIST_COLSET_NAME = COLSET_PREFIX + "intlist"
+    CASEARRIVAL_COLSET_NAME = COLSET_PREFIX + "case_arrival"
+    CASEPROGRESS_COLSET_NAME = COLSET_PREFIX + "case_progress"
 
     def __init__(self, cpn_id_manager: CPN_ID_Manager):
         """
@@ -169,6 +174,7 @@ class ColsetManager:
         self.parsed_colsets = set()
         self.var_name_roots = list()
         self.colset_vars_map = dict()
+        self.case_state_attribute_ids = list()
 
     def parse_standard_colsets(self, declarations_block: Element):
         """
@@ -205,6 +211,98 @@ class ColsetManager:
         """
         self.__add_alias_colset(Standard_Colsets.INT.value, self.TIMEDINT_COLSET_NAME, timed=True)
 
+    def add_case_arrival_colset(self):
+        """
+        Add a colset for the arrival times of cases, that is, a case identifier and a point in model time
+        """
+        return self.__add_product_colset(self.CASEARRIVAL_COLSET_NAME, [
+            self.get_case_id_colset(), self.colset_map.colsets_by_name[Standard_Colsets.INT.value]
+        ])
+
+    def get_case_arrival_colset(self) -> Colset:
+        """
+        Get the colset for the arrival times of cases
+        :return: the case arrival colset
+        """
+        return self.colset_map.colsets_by_name[self.CASEARRIVAL_COLSET_NAME]
+
+    def add_case_progress_colset(self):
+        """
+        Add a colset for the progress of cases, that is, a case identifier and the number of tokens
+        the case has in places that are not final
+        """
+        return self.__add_product_colset(self.CASEPROGRESS_COLSET_NAME, [
+            self.get_case_id_colset(), self.colset_map.colsets_by_name[Standard_Colsets.INT.value]
+        ])
+
+    def get_case_progress_colset(self) -> Colset:
+        """
+        Get the colset for the progress of cases
+        :return: the case progress colset
+        """
+        return self.colset_map.colsets_by_name[self.CASEPROGRESS_COLSET_NAME]
+
+    def add_case_state_colset(self, attribute_ids: list[str]):
+        """
+        Add a colset for case tokens that carry the observed attribute values of their case,
+        that is, the case identifier and, for each of the attributes, a list that is either empty
+        or holds the last observed value, followed by the id of the event that observed it (~1 if none did),
+        so that the later of two observations can be told apart when concurrent branches are synchronized.
+
+        :param attribute_ids: the attributes to be carried on the case token (at least one)
+        :return: the case state colset
+        """
+        caseid_colset = self.get_case_id_colset()
+        observation_seq_colset = self.__add_alias_colset(Standard_Colsets.INT.value, self.OBSERVATIONSEQ_COLSET_NAME)
+        case_state_subcols = [caseid_colset]
+        for attr_id in attribute_ids:
+            case_state_subcols.append(self.colset_map.colsets_by_name[self.get_attribute_list_colset_name(attr_id)])
+            case_state_subcols.append(observation_seq_colset)
+        self.case_state_attribute_ids = list(attribute_ids)
+        return self.__add_product_colset(self.CASESTATE_COLSET_NAME, case_state_subcols, timed=True)
+
+    def has_case_state_colset(self) -> bool:
+        return self.CASESTATE_COLSET_NAME in self.colset_map.colsets_by_name
+
+    def get_case_state_colset(self) -> Colset:
+        """
+        Get the colset of case tokens that carry the observed attribute values of their case
+        :return: the case state colset
+        """
+        return self.colset_map.colsets_by_name[self.CASESTATE_COLSET_NAME]
+
+    def get_case_state_attribute_ids(self) -> list[str]:
+        return self.case_state_attribute_ids
+
+    def get_case_state_projection(self, attribute_id: str = None) -> str:
+        """
+        Get the projection on a case state token that selects the list of observed values of an attribute,
+        or the case identifier if no attribute is given.
+
+        :param attribute_id: the id of the attribute
+        :return: the projection (e.g., "#2")
+        """
+        if attribute_id is None:
+            return "#1"
+        return "#" + str(2 * self.case_state_attribute_ids.index(attribute_id) + 2)
+
+    def get_case_state_sequence_projection(self, attribute_id: str) -> str:
+        """
+        Get the projection on a case state token that selects the id of the event
+        that observed the value of an attribute.
+
+        :param attribute_id: the id of the attribute
+        :return: the projection (e.g., "#3")
+        """
+        return "#" + str(2 * self.case_state_attribute_ids.index(attribute_id) + 3)
+
+    def get_observation_sequence_colset(self) -> Colset:
+        """
+        Get the colset for the ids of the events that observed the values on a case state token
+        :return: the observation sequence colset
+        """
+        return self.colset_map.colsets_by_name[self.OBSERVATIONSEQ_COLSET_NAME]
+
     def get_case_id_colset(self) -> Colset:
         """
         Get the unique case_id colset to describe a token just with a case identifier
@@ -230,7 +328,7 @@ class ColsetManager:
                                            activity_ids: list[str],
                                            attributes: list[CPM_Attribute],
                                            attributes_with_last_observations: list[str],
-                                           attributes_with_system_aggregations: list[str],
+                                           aggregated_relations: list[AttributeRelation],
                                            attribute_activities: AttributeActivities
                                            ):
         """
@@ -239,7 +337,7 @@ class ColsetManager:
         :param attribute_ids:   all attributes
         :param attributes_with_last_observations:   attributes for which simple dependencies exist so
         that last value observations of a case are needed
-        :param attributes_with_system_aggregations:   attributes for which aggregated dependencies exist
+        :param aggregated_relations:   the aggregated dependencies, each of which maintains a state
         """
         for attr in attributes:
             self.add_attribute_domain_colset(attr)
@@ -250,9 +348,14 @@ class ColsetManager:
             self.add_activity_colset(act_id, act_attribute_ids)
         for attr_id in attributes_with_last_observations:
             self.add_attribute_last_observation_colset(attr_id)
-        for attr_id in attributes_with_system_aggregations:
-            act_id = attribute_activities.get_activity_for_attribute(attr_id)
-            self.add_attribute_system_aggregation_colset(attr_id, act_id)
+        if aggregated_relations:
+            self.__add_list_colset(self.INTLIST_COLSET_NAME,
+                                   self.colset_map.colsets_by_name[Standard_Colsets.INT.value])
+        for relation in aggregated_relations:
+            attr_in_id = relation.get_in().get_id()
+            if self.get_attribute_observation_list_colset_name(attr_in_id) not in self.colset_map.colsets_by_name:
+                self.add_attribute_observation_list_colset(attr_in_id)
+            self.add_aggregation_state_colset(attr_in_id, relation.get_out().get_id())
 
     def add_activity_colset(self, activity_id: str, attribute_ids: list[str]):
         """
@@ -324,29 +427,44 @@ class ColsetManager:
         attribute_last_observation_colset_name = attribute_colset_prefix + "_LAST"
         return attribute_last_observation_colset_name
 
-    def get_attribute_system_aggregation_colset_name_single(self, attr_id):
+    def get_attribute_observation_colset_name(self, attr_id):
         """
-        Canonic naming scheme for colsets that describes ONE observed values
+        Canonic naming scheme for colsets that describe ONE timestamped observation
         of an attribute in the system (i.e., across cases).
 
         :param attr_id: the id of the attribute
         :return: the canonic name
         """
         attribute_colset_prefix = self.get_named_entity_colset_prefix(attr_id)
-        attribute_system_aggregation_colset_name = attribute_colset_prefix + "_SINGLE"
-        return attribute_system_aggregation_colset_name
+        attribute_observation_colset_name = attribute_colset_prefix + "_OBS"
+        return attribute_observation_colset_name
 
-    def get_attribute_system_aggregation_colset_name_list(self, attr_id):
+    def get_attribute_observation_list_colset_name(self, attr_id):
         """
-        Canonic naming scheme for colsets that describes ALL observed values
+        Canonic naming scheme for colsets that describe a sequence of timestamped observations
         of an attribute in the system (i.e., across cases).
 
         :param attr_id: the id of the attribute
         :return: the canonic name
         """
         attribute_colset_prefix = self.get_named_entity_colset_prefix(attr_id)
-        attribute_system_aggregation_colset_name = attribute_colset_prefix + "_SYS"
-        return attribute_system_aggregation_colset_name
+        attribute_observation_list_colset_name = attribute_colset_prefix + "_OBSLIST"
+        return attribute_observation_list_colset_name
+
+    def get_aggregation_state_colset_name(self, attr_in_id, attr_out_id):
+        """
+        Canonic naming scheme for colsets that describe the state of an aggregated dependency.
+
+        :param attr_in_id: the id of the aggregated attribute
+        :param attr_out_id: the id of the dependent attribute
+        :return: the canonic name
+        """
+        attribute_colset_prefix = self.get_named_entity_colset_prefix(attr_in_id)
+        aggregation_state_colset_name = attribute_colset_prefix + "_" + "_".join(attr_out_id.split(" ")) + "_AGG"
+        return aggregation_state_colset_name
+
+    def get_intlist_colset_name(self):
+        return self.INTLIST_COLSET_NAME
 
     def add_attribute_last_observation_colset(self, attribute_id: str):
         """
@@ -365,27 +483,40 @@ class ColsetManager:
         ])#, timed=True)
         return colset
 
-    def add_attribute_system_aggregation_colset(self, attribute_id: str, activity_id: str):
+    def add_attribute_observation_list_colset(self, attribute_id: str):
         """
-        Create the colset to describe all observed values of an attribute within the system.
+        Create the colset to describe a sequence of timestamped observations of an attribute within the system.
 
         :param attribute_id: the id of the attribute
-        :param activity_id: the activity of that attribute
         :return: the colset
         """
-        caseid_colset = self.get_case_id_colset()
-        activity_eaval_colset = self.colset_map.colsets_by_name[self.get_activity_eaval_colset_name(activity_id)]
+        time_colset = self.colset_map.colsets_by_name[Standard_Colsets.REAL.value]
         attribute_domain_colset = self.colset_map.colsets_by_name[self.get_attribute_domain_colset_name(attribute_id)]
-        attribute_system_aggregation_colset_name_single = self.get_attribute_system_aggregation_colset_name_single(
-            attribute_id)
-        attribute_system_aggregation_colset_name_list = self.get_attribute_system_aggregation_colset_name_list(
-            attribute_id)
-        system_aggregation_colset_single = self.__add_product_colset(
-            attribute_system_aggregation_colset_name_single, [
-                caseid_colset, activity_eaval_colset, attribute_domain_colset
+        observation_colset = self.__add_product_colset(
+            self.get_attribute_observation_colset_name(attribute_id), [
+                time_colset, attribute_domain_colset
             ])
         colset = self.__add_list_colset(
-            attribute_system_aggregation_colset_name_list, system_aggregation_colset_single)
+            self.get_attribute_observation_list_colset_name(attribute_id), observation_colset)
+        return colset
+
+    def add_aggregation_state_colset(self, attr_in_id: str, attr_out_id: str):
+        """
+        Create the colset to describe the state of an aggregated dependency, that is,
+        the selected observations of the aggregated attribute as a queue of two lists (the older ones oldest first,
+        the newer ones newest first) and the label counts over those.
+
+        :param attr_in_id: the id of the aggregated attribute
+        :param attr_out_id: the id of the dependent attribute
+        :return: the colset
+        """
+        observation_list_colset = self.colset_map.colsets_by_name[
+            self.get_attribute_observation_list_colset_name(attr_in_id)]
+        intlist_colset = self.colset_map.colsets_by_name[self.INTLIST_COLSET_NAME]
+        colset = self.__add_product_colset(
+            self.get_aggregation_state_colset_name(attr_in_id, attr_out_id), [
+                observation_list_colset, observation_list_colset, intlist_colset
+            ])
         return colset
 
     def add_attribute_domain_colset(self, attribute: CPM_Attribute):
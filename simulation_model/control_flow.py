@@ -1,15 +1,44 @@
+import math
+from enum import Enum
+
 from causal_model.causal_process_model import CausalProcessModel
-from causal_model.causal_process_structure import CPM_Attribute, CPM_Activity
+from causal_model.causal_process_structure import CPM_Attribute, CPM_Activity, AttributeRelation, \
+    CPM_Categorical_Attribute
 from process_model.petri_net import SimplePetriNet, SimplePetriNetPlace, SimplePetriNetTransition, SimplePetriNetArc
 from simulation_model.colset import ColsetManager
 from simulation_model.cpn_utils.cpn_arc import CPN_Arc
 from simulation_model.cpn_utils.cpn_place import CPN_Place
 from simulation_model.cpn_utils.cpn_transition import CPN_Transition, TransitionType
 from simulation_model.cpn_utils.xml_utils.cpn_id_managment import CPN_ID_Manager
+from simulation_model.monitors import DataCollectorMonitor, MonitorObservation
 from simulation_model.functions import get_activity_event_writer_name, get_activity_event_table_initializer_name, \
-    get_normalized_delay_from_now_function_name
+    get_normalized_delay_from_now_function_name, get_case_state_merger_name, get_now_time_getter_name, \
+    get_aggregation_updater_name, get_aggregation_expirer_name, get_aggregation_value_getter_name, \
+    get_warmup_case_id_name
 from simulation_model.simulation_parameters import SimulationParameters
 from simulation_model.timing import ProcessTimeCategory
+from utils.validators import validate_condition
+
+
+class CaseStateEncoding(Enum):
+    """
+    How the observed attribute values of a case are made available to later activities of the same case:
+    LAST_OBSERVATION_PLACES keeps them in global places (one token per case) that are searched by case id,
+    CASE_TOKEN carries them on the case token itself, so that they can be projected from the bound token.
+    """
+    LAST_OBSERVATION_PLACES = "LAST_OBSERVATION_PLACES"
+    CASE_TOKEN = "CASE_TOKEN"
+
+
+class EventOutput(Enum):
+    """
+    What a simulation in CPN Tools outputs: EVENT_TABLES writes each event to the event table (.csv) of its activity,
+    MONITORS writes no events, but collects the cycle times of the cases, the number of events of each activity,
+    and the frequency of each attribute label with data collector monitors, whose summary statistics CPN Tools
+    writes to its performance report.
+    """
+    EVENT_TABLES = "EVENT_TABLES"
+    MONITORS = "MONITORS"
 
 
 class ControlFlowMap:
@@ -17,6 +46,8 @@ class ControlFlowMap:
     def __init__(self):
         self.cpn_places: list[CPN_Place] = list()
         self.cpn_lobs_places: list[CPN_Place] = list()
+        self.cpn_lobs_places_by_attribute_id: dict[str, CPN_Place] = dict()
+        self.cpn_aggregation_places_by_relation: dict[tuple[str, str], CPN_Place] = dict()
         self.cpn_transitions: list[CPN_Transition] = list()
         self.cpn_nodes_by_id: dict = dict()
         self.cpn_places_by_id: dict = dict()
@@ -27,6 +58,7 @@ class ControlFlowMap:
         self.cpn_arcs: list[CPN_Arc] = list()
         self.cpn_arcs_by_id: dict = dict()
         self.cpn_arcs_by_simple_pn_arc_id: dict = dict()
+        self.cpn_node_ids_by_simple_labeled_transition_id: dict[str, list[str]] = dict()
 
     def add_place(self, place: CPN_Place, simple_place_id: str = None):
         place_id = place.get_id()
@@ -73,9 +105,14 @@ class ControlFlowMap:
         self.cpn_arcs_by_simple_pn_arc_id = {
             key: value for key, value in self.cpn_arcs_by_simple_pn_arc_id.items() if value.get_id() != arc_id}
 
-    def add_lobs_place(self, lobs_place):
+    def add_lobs_place(self, lobs_place, attribute_id: str):
         self.add_place(lobs_place)
         self.cpn_lobs_places.append(lobs_place)
+        self.cpn_lobs_places_by_attribute_id[attribute_id] = lobs_place
+
+    def add_aggregation_place(self, aggregation_place, attr_in_id: str, attr_out_id: str):
+        self.add_place(aggregation_place)
+        self.cpn_aggregation_places_by_relation[(attr_in_id, attr_out_id)] = aggregation_place
 
 
 def get_attribute_place_name(attribute_id: str, suffix):
@@ -97,6 +134,29 @@ def get_attribute_global_last_observation_place_name(attribute_id):
     return get_attribute_place_name(attribute_id, "LAST")
 
 
+def get_aggregation_state_place_name(attr_in_id: str, attr_out_id: str):
+    """
+    Canonical name of the unique place in the net where the state of an aggregated dependency
+    (the selected observations of the in-attribute across cases) is being maintained.
+
+    :param attr_in_id: the aggregated attribute
+    :param attr_out_id: the dependent attribute
+    :return: the canonical name
+    """
+    return "p_" + "_".join(attr_in_id.split(" ")) + "_" + "_".join(attr_out_id.split(" ")) + "_AGG"
+
+
+def get_preset_attribute_aggregation_place_name(transition_id, attribute_id):
+    """
+    Canonical name for places that hold the aggregated value of an attribute in the aggregated preset of
+    the valuated attribute
+    :param transition_id: the currently transformed transition of some activity
+    :param attribute_id: the aggregated preset attribute of some attribute that is being valuated for the activity
+    :return: the canonical name/identifier
+    """
+    return get_transition_attribute_place_name(transition_id, attribute_id, "AGG")
+
+
 def get_preset_attribute_last_observation_place_name(transition_id, attribute_id):
     """
     Canonical name for places that hold the value of an attribute in the preset of
@@ -144,6 +204,22 @@ def get_kickstart_place_name():
     return "p_kickstart"
 
 
+def get_case_cleanup_transition_name(p: SimplePetriNetPlace):
+    return "t_cleanup_" + p.get_id()
+
+
+def get_case_arrival_place_name():
+    return "init_p_case_arrival"
+
+
+def get_case_progress_place_name():
+    return "init_p_case_progress"
+
+
+def get_case_completion_transition_name():
+    return "t_case_completion"
+
+
 class ControlFlowManager:
     # some coordinates to put nodes somewhere
     # TODO: use some graph layouting algorithm
@@ -155,16 +231,56 @@ class ControlFlowManager:
                  petriNet: SimplePetriNet,
                  causalModel: CausalProcessModel,
                  simulationParameters: SimulationParameters,
-                 colsetManager: ColsetManager
+                 colsetManager: ColsetManager,
+                 case_state_encoding: CaseStateEncoding = CaseStateEncoding.LAST_OBSERVATION_PLACES,
+                 event_output: EventOutput = EventOutput.EVENT_TABLES,
+                 warmup_time: float = 0.0
                  ):
         self.cpn_id_manager = cpn_id_manager
         self.__petriNet = petriNet
         self.__causalModel = causalModel
         self.__simulationParameters = simulationParameters
         self.__colsetManager = colsetManager
+        self.__case_state_encoding = case_state_encoding
         self.__controlFlowMap = ControlFlowMap()
         # remember the variable names in the event attribute value maps
         self.__eaval_parameter_tuples = {}
+        # the terms that describe the (merged) case state at the transitions, when carried on case tokens
+        self.__case_state_terms = {}
+        self.__event_output = event_output
+        # the events of cases that arrive before the end of the warm-up period are not written
+        self.__warmup_time = warmup_time
+        # the place that keeps the arrival time of each active case, when monitoring cycle times
+        self.__case_arrival_place: CPN_Place = None
+        # the place that keeps the number of tokens of each active case in places that are not final,
+        # when the net has several final places
+        self.__case_progress_place: CPN_Place = None
+        # the transitions where cases are done
+        self.__case_completion_transitions: list[CPN_Transition] = []
+
+    def __carries_case_state(self) -> bool:
+        """
+        Whether observed attribute values are carried on the case tokens. This is only the case if the
+        CASE_TOKEN encoding is chosen and there are attributes with (non-aggregated) post-dependencies.
+        """
+        return self.__case_state_encoding == CaseStateEncoding.CASE_TOKEN \
+            and self.__colsetManager.has_case_state_colset()
+
+    def __tracks_case_progress(self) -> bool:
+        """
+        Whether the progress of the cases is tracked, so that it can be determined when a case is done.
+        This is only the case if the net has several final places, so that a case may still be running
+        when one of them is marked.
+        """
+        return len(self.__petriNet.get_final_places()) > 1
+
+    def __get_case_token_colset_name(self) -> str:
+        if self.__carries_case_state():
+            return self.__colsetManager.get_case_state_colset().colset_name
+        return self.__colsetManager.get_case_id_colset().colset_name
+
+    def __get_case_token_var(self) -> str:
+        return self.__colsetManager.get_one_var(self.__get_case_token_colset_name())
 
     def merge_models(self):
         self.cast_petri_net()
@@ -180,9 +296,7 @@ class ControlFlowManager:
         place: SimplePetriNetPlace
         transition: SimplePetriNetTransition
         arc: SimplePetriNetArc
-        v_case_id = self.__colsetManager.get_one_var(
-            self.__colsetManager.get_case_id_colset().colset_name
-        )
+        v_case_id = self.__get_case_token_var()
         for arc in arcs:
             place = arc.get_place()
             transition = arc.get_transition()
@@ -204,7 +318,7 @@ class ControlFlowManager:
         simple_pn_place_id = simple_pn_place.get_id()
         if simple_pn_place_id in self.__controlFlowMap.cpn_places_by_simple_pn_place_id:
             return self.__controlFlowMap.cpn_places_by_simple_pn_place_id[simple_pn_place_id]
-        colset_name = self.__colsetManager.get_case_id_colset().colset_name
+        colset_name = self.__get_case_token_colset_name()
         initmark = None
         cpn_place = CPN_Place(name=simple_pn_place_id,
                               x=simple_pn_place.x,
@@ -237,6 +351,18 @@ class ControlFlowManager:
     def get_cpn_transitions(self):
         return self.__controlFlowMap.cpn_transitions
 
+    def get_cpn_node_ids_by_labeled_transition(self) -> dict[str, list[str]]:
+        """
+        Get, for each labeled transition of the Petri net, the nodes of the CPN that model its execution
+        (start transition, control places, attribute valuation structure, and the labeled transition itself).
+
+        :return: The ids of the CPN nodes by the id of the labeled transition
+        """
+        return self.__controlFlowMap.cpn_node_ids_by_simple_labeled_transition_id
+
+    def get_cpn_node(self, node_id: str):
+        return self.__controlFlowMap.cpn_nodes_by_id[node_id]
+
     def get_cpn_arcs(self):
         return self.__controlFlowMap.cpn_arcs
 
@@ -247,7 +373,7 @@ class ControlFlowManager:
         semaphore_place = CPN_Place(
             get_global_semaphore_place_name(), x, y, self.cpn_id_manager,
             colset_name= "INT",
-            initmark="1"
+            initmark=str(self.__simulationParameters.first_event_id)
         )
         self.__controlFlowMap.add_place(semaphore_place)
         cm_activities = self.__causalModel.get_activities()
@@ -257,12 +383,16 @@ class ControlFlowManager:
             t: SimplePetriNetTransition
             for t in act_transitions:
                 self.__convert_transition(t, act)
+        if self.__carries_case_state():
+            self.__merge_case_states_at_silent_transitions()
 
     def __make_causal_places(self):
-        non_agg_attributes = self.__causalModel.get_attributes_with_non_aggregated_dependencies()
-        for attribute in non_agg_attributes:
-            self.__make_last_observation_place(attribute)
-        # TODO: aggregation logic
+        if not self.__carries_case_state():
+            non_agg_attributes = self.__causalModel.get_attributes_with_non_aggregated_dependencies()
+            for attribute in non_agg_attributes:
+                self.__make_last_observation_place(attribute)
+        for relation in self.__causalModel.get_aggregated_relations():
+            self.__make_aggregation_place(relation)
 
     def __make_last_observation_place(self, attribute: CPM_Attribute):
         """
@@ -277,15 +407,35 @@ class ControlFlowManager:
         )
         x, y = self.__get_node_coordinates()
         lobs_place = CPN_Place(lobs_place_name, x, y, self.cpn_id_manager, lobs_colset_name, False)
-        self.__controlFlowMap.add_lobs_place(lobs_place)
+        self.__controlFlowMap.add_lobs_place(lobs_place, attribute.get_id())
+
+    def __make_aggregation_place(self, relation: AttributeRelation):
+        """
+        Make the unique place in the net where the state of an aggregated dependency is maintained.
+        Initially, no observations are selected and all label counts are zero.
+
+        :param relation: the aggregated relation
+        """
+        attr_in: CPM_Categorical_Attribute = relation.get_in()
+        attr_in_id = attr_in.get_id()
+        attr_out_id = relation.get_out().get_id()
+        aggregation_place_name = get_aggregation_state_place_name(attr_in_id, attr_out_id)
+        aggregation_colset_name = self.__colsetManager.get_aggregation_state_colset_name(attr_in_id, attr_out_id)
+        initmark = "([], [], [{0}])".format(",".join(["0"] * len(attr_in.get_labels())))
+        x, y = self.__get_node_coordinates()
+        aggregation_place = CPN_Place(aggregation_place_name, x, y, self.cpn_id_manager, aggregation_colset_name,
+                                      initmark=initmark)
+        self.__controlFlowMap.add_aggregation_place(aggregation_place, attr_in_id, attr_out_id)
 
     def __convert_transition(self, t: SimplePetriNetTransition, activity: CPM_Activity):
+        node_ids_before = set(self.__controlFlowMap.cpn_nodes_by_id.keys())
         start_t = self.__make_start_transition(t)
         control_p_case, control_p_event = self.__make_control_places(t)
         cpn_t = self.__controlFlowMap.cpn_transitions_by_simple_pn_transition_id[t.get_id()]
-        caseid_var = self.__colsetManager.get_one_var(self.__colsetManager.get_case_id_colset().colset_name)
+        caseid_var = self.__get_case_token_var()
         int_var = self.__colsetManager.get_one_var("INT")
-        control_a1 = CPN_Arc(self.cpn_id_manager, start_t, control_p_case, caseid_var)
+        control_a1 = CPN_Arc(self.cpn_id_manager, start_t, control_p_case,
+                             self.__case_state_terms.get(start_t.get_id(), caseid_var))
         control_a2 = CPN_Arc(self.cpn_id_manager, control_p_case, cpn_t, caseid_var)
         self.__controlFlowMap.add_arc(control_a1)
         self.__controlFlowMap.add_arc(control_a2)
@@ -300,6 +450,9 @@ class ControlFlowManager:
         sem_out = CPN_Arc(self.cpn_id_manager, cpn_t, sem, str(int_var) + " + 1")
         self.__controlFlowMap.add_arc(sem_in)
         self.__controlFlowMap.add_arc(sem_out)
+        # remember the nodes that make up the execution of the transition, e.g., to put them onto a subpage
+        self.__controlFlowMap.cpn_node_ids_by_simple_labeled_transition_id[t.get_id()] = [cpn_t.get_id()] + [
+            node_id for node_id in self.__controlFlowMap.cpn_nodes_by_id.keys() if node_id not in node_ids_before]
 
     def __make_start_transition(self, t: SimplePetriNetTransition) -> CPN_Transition:
         start_t_name = get_start_transition_id(t)
@@ -312,19 +465,80 @@ class ControlFlowManager:
         in_arcs = self.__petriNet.get_incoming_arcs(t.get_id())
         cpn_in_arcs = [self.__controlFlowMap.cpn_arcs_by_simple_pn_arc_id[arc.get_id()] for arc in in_arcs]
         arc: CPN_Arc
+        new_in_arcs = []
         for arc in cpn_in_arcs:
             self.__controlFlowMap.remove_arc(arc)
             new_arc = CPN_Arc(self.cpn_id_manager, arc.source, start_t, arc.annotation_text)
             self.__controlFlowMap.add_arc(new_arc)
+            new_in_arcs.append(new_arc)
+        if self.__carries_case_state():
+            self.__merge_case_states(start_t, new_in_arcs)
         return start_t
 
+    def __merge_case_states(self, transition: CPN_Transition, in_arcs: list[CPN_Arc]) -> str:
+        """
+        When case states are carried on case tokens, determine the term that describes the case state
+        at a transition. If the transition synchronizes several case tokens, their arcs share the variable
+        of the case id, so that CPN Tools binds the case id once and only matches tokens of the same case,
+        each token gets its own variables for the observations, and the later observations are kept.
+
+        :param transition: The transition
+        :param in_arcs: The arcs that carry case tokens to the transition
+        :return: The term describing the case state at the transition
+        """
+        case_state_term = self.__get_case_token_var()
+        if len(in_arcs) > 1:
+            case_id_var = self.__colsetManager.get_one_var(self.__colsetManager.get_case_id_colset().colset_name)
+            attribute_ids = self.__colsetManager.get_case_state_attribute_ids()
+            list_vars_by_attribute_id = {
+                attr_id: self.__colsetManager.get_some_vars(
+                    self.__colsetManager.get_attribute_list_colset_name(attr_id), len(in_arcs))
+                for attr_id in attribute_ids
+            }
+            seq_vars = self.__colsetManager.get_some_vars(
+                self.__colsetManager.get_observation_sequence_colset().colset_name, len(in_arcs) * len(attribute_ids))
+            case_state_patterns = [
+                "(" + ", ".join([case_id_var] + [
+                    "{0}, {1}".format(list_vars_by_attribute_id[attr_id][i], seq_vars[i * len(attribute_ids) + j])
+                    for j, attr_id in enumerate(attribute_ids)
+                ]) + ")"
+                for i in range(len(in_arcs))
+            ]
+            for arc, case_state_pattern in zip(in_arcs, case_state_patterns):
+                arc.set_annotation(case_state_pattern)
+            case_state_term = case_state_patterns[0]
+            for case_state_pattern in case_state_patterns[1:]:
+                case_state_term = "{0}({1}, {2})".format(
+                    get_case_state_merger_name(), case_state_pattern, case_state_term)
+        self.__case_state_terms[transition.get_id()] = case_state_term
+        return case_state_term
+
+    def __merge_case_states_at_silent_transitions(self):
+        """
+        Silent transitions pass the case state on. If they synchronize several case tokens,
+        the case states of those are merged.
+        """
+        labeled_transition_ids = self.__petriNet.get_labels().get_keys()
+        t: SimplePetriNetTransition
+        for t in self.__petriNet.get_transitions():
+            if t.get_id() in labeled_transition_ids:
+                continue
+            cpn_t = self.__controlFlowMap.cpn_transitions_by_simple_pn_transition_id[t.get_id()]
+            in_arcs = [self.__controlFlowMap.cpn_arcs_by_simple_pn_arc_id[arc.get_id()]
+                       for arc in self.__petriNet.get_incoming_arcs(t.get_id())]
+            if len(in_arcs) < 2:
+                continue
+            case_state_term = self.__merge_case_states(cpn_t, in_arcs)
+            for arc in self.__petriNet.get_outgoing_arcs(t.get_id()):
+                self.__controlFlowMap.cpn_arcs_by_simple_pn_arc_id[arc.get_id()].set_annotation(case_state_term)
+
     def __make_control_places(self, t: SimplePetriNetTransition) -> [CPN_Place, CPN_Place]:
         control_p_name_case = get_control_place_id_case(t)
         control_p_name_event = get_control_place_id_event(t)
         x = t.x + 50
         y = t.y
         control_p_case = CPN_Place(control_p_name_case, x, y, self.cpn_id_manager,
-                              self.__colsetManager.get_case_id_colset().colset_name)
+                                   self.__get_case_token_colset_name())
         control_p_event = CPN_Place(control_p_name_event, x, y, self.cpn_id_manager, "INT")
         self.__controlFlowMap.add_place(control_p_case)
         self.__controlFlowMap.add_place(control_p_event)
@@ -341,7 +555,6 @@ class ControlFlowManager:
         # for each activity attribute, make a transition to valuate the attribute,
         # and feed it into the labeled transition
         # add connections w.r.t non-aggregated dependencies
-        # TODO: add connections w.r.t aggregated dependencies
         attribute_ids = self.__causalModel.get_attribute_ids_by_activity_id(activity.get_id())
         transition_id = simple_labeled_t.get_id()
         # for each preset attribute, that is, each attribute on which some event attribute at the current
@@ -381,6 +594,10 @@ class ControlFlowManager:
         case_id_var = self.__colsetManager.get_one_var(
             self.__colsetManager.get_case_id_colset().colset_name
         )
+        if self.__carries_case_state():
+            # the case id is projected from the case state token that the labeled transition consumes
+            case_id_var = "{0} {1}".format(self.__colsetManager.get_case_state_projection(),
+                                           self.__get_case_token_var())
         self.__eaval_parameter_tuples[activity.get_name()] = [case_id_var] + attribute_domain_vars
         act_guard = "{0}=({1},{2})".format(
             eaval_var,
@@ -388,6 +605,9 @@ class ControlFlowManager:
             ",".join(attribute_domain_vars)
         )
         cpn_labeled_t.add_conjunct(act_guard)
+        if self.__carries_case_state():
+            self.__update_case_state(simple_labeled_t, attribute_ids, attribute_domain_vars)
+        self.__update_aggregation_states(cpn_labeled_t, attribute_ids, attribute_domain_vars)
         # distribute new last observations to global monitoring places
         for i, attribute_id in enumerate(attribute_ids):
             global_lobs_place_name = get_attribute_global_last_observation_place_name(attribute_id)
@@ -412,6 +632,63 @@ class ControlFlowManager:
             self.__controlFlowMap.add_arc(lobs_old_arc)
             self.__controlFlowMap.add_arc(lobs_new_arc)
 
+    def __update_case_state(self, simple_labeled_t: SimplePetriNetTransition, attribute_ids: list[str],
+                            attribute_domain_vars: list[str]):
+        """
+        When case states are carried on case tokens, the labeled transition puts the new observations
+        of its event attributes on the case tokens it produces, together with the id of its event.
+
+        :param simple_labeled_t: The labeled transition
+        :param attribute_ids: The event attributes of the activity
+        :param attribute_domain_vars: The variables carrying the values of those attributes
+        """
+        case_state_var = self.__get_case_token_var()
+        # the id of the executed event
+        event_id_var = self.__colsetManager.get_one_var("INT")
+        case_state_components = ["{0} {1}".format(self.__colsetManager.get_case_state_projection(), case_state_var)]
+        for case_state_attr_id in self.__colsetManager.get_case_state_attribute_ids():
+            if case_state_attr_id in attribute_ids:
+                new_observation = "[{0}], {1}".format(
+                    attribute_domain_vars[attribute_ids.index(case_state_attr_id)], event_id_var)
+            else:
+                new_observation = "{0} {2}, {1} {2}".format(
+                    self.__colsetManager.get_case_state_projection(case_state_attr_id),
+                    self.__colsetManager.get_case_state_sequence_projection(case_state_attr_id),
+                    case_state_var)
+            case_state_components.append(new_observation)
+        new_case_state = "(" + ", ".join(case_state_components) + ")"
+        for arc in self.__petriNet.get_outgoing_arcs(simple_labeled_t.get_id()):
+            self.__controlFlowMap.cpn_arcs_by_simple_pn_arc_id[arc.get_id()].set_annotation(new_case_state)
+
+    def __update_aggregation_states(self, cpn_labeled_t: CPN_Transition, attribute_ids: list[str],
+                                    attribute_domain_vars: list[str]):
+        """
+        The labeled transition adds the new observations of its event attributes to the state of
+        each aggregated dependency that these attributes are the source of.
+
+        :param cpn_labeled_t: The labeled transition
+        :param attribute_ids: The event attributes of the activity
+        :param attribute_domain_vars: The variables carrying the values of those attributes
+        """
+        relation: AttributeRelation
+        for relation in self.__causalModel.get_aggregated_relations():
+            attr_in_id = relation.get_in().get_id()
+            if attr_in_id not in attribute_ids:
+                continue
+            attr_out_id = relation.get_out().get_id()
+            aggregation_place = self.__controlFlowMap.cpn_aggregation_places_by_relation[(attr_in_id, attr_out_id)]
+            aggregation_var = self.__colsetManager.get_one_var(
+                self.__colsetManager.get_aggregation_state_colset_name(attr_in_id, attr_out_id))
+            new_aggregation_state = "{0}({1}, {2}, {3}())".format(
+                get_aggregation_updater_name(attr_in_id, attr_out_id),
+                aggregation_var,
+                attribute_domain_vars[attribute_ids.index(attr_in_id)],
+                get_now_time_getter_name())
+            state_in = CPN_Arc(self.cpn_id_manager, aggregation_place, cpn_labeled_t, aggregation_var)
+            state_out = CPN_Arc(self.cpn_id_manager, cpn_labeled_t, aggregation_place, new_aggregation_state)
+            self.__controlFlowMap.add_arc(state_in)
+            self.__controlFlowMap.add_arc(state_out)
+
     def __make_attribute_valuation_structure(self, transition_id: str,
                                              start_transition: CPN_Transition, attribute_id: str, x=0.0, y=0.0) \
             -> CPN_Place:
@@ -428,20 +705,30 @@ class ControlFlowManager:
         """
         # make valuation transition and its guard
         preset = self.__causalModel.get_preset(attribute_id)
-        preset_attr_ids = [in_relation.get_in().get_id() for in_relation in preset]
-        preset_domain_colset_names = [
-            self.__colsetManager.get_attribute_domain_colset_name(preset_attr_id)
-            for preset_attr_id in preset_attr_ids]
-        preset_domain_variables = [
-            self.__colsetManager.get_one_var(preset_colset_name)
-            for preset_colset_name in preset_domain_colset_names
-        ]
+        aggregated_preset = self.__causalModel.get_aggregated_preset(attribute_id)
+        # the variables that carry the values of the preset attributes into the valuation transition.
+        # Aggregated values get a variable of their own, as an attribute may aggregate over itself.
+        preset_domain_variables_by_attr_id = {
+            in_relation.get_in().get_id(): self.__colsetManager.get_one_var(
+                self.__colsetManager.get_attribute_domain_colset_name(in_relation.get_in().get_id()))
+            for in_relation in preset
+        }
+        preset_domain_variables_by_attr_id.update({
+            in_relation.get_in().get_id(): self.__colsetManager.get_some_vars(
+                self.__colsetManager.get_attribute_domain_colset_name(in_relation.get_in().get_id()), 2)[1]
+            for in_relation in aggregated_preset
+        })
         attr_colset_name = self.__colsetManager.get_attribute_domain_colset_name(attribute_id)
         attr_variable = self.__colsetManager.get_one_var(attr_colset_name)
         valuation_transition_name = get_attribute_valuation_transition_name(transition_id, attribute_id)
-        valuation_call = self.__causalModel.get_attribute_valuations(). \
-            get_attribute_valuation(attribute_id).get_call()
-        valuation_guard = "[" + attr_variable + "=" + valuation_call(preset_domain_variables) + "]"
+        valuation = self.__causalModel.get_attribute_valuations().get_attribute_valuation(attribute_id)
+        valuation_call = valuation.get_call()
+        # pass the values in the order of the valuation parameters
+        valuation_arguments = [
+            preset_domain_variables_by_attr_id[param.get_attribute().get_id()]
+            for param in valuation.valuation_parameters.get_valuation_parameters_list()
+        ]
+        valuation_guard = "[" + attr_variable + "=" + valuation_call(valuation_arguments) + "]"
         valuation_transition = CPN_Transition(TransitionType.SILENT, valuation_transition_name, x, y,
                                               self.cpn_id_manager,
                                               valuation_guard)
@@ -459,13 +746,10 @@ class ControlFlowManager:
         # note that this can be redundant with other attributes at this transition
         # add place of preset attribute domain and connect it with valuation transition.
         for i, in_relation in enumerate(preset):
-            if in_relation.is_aggregated():
-                raise NotImplementedError()
-            # else:
             in_attr_id = in_relation.get_in().get_id()
             in_attr_colset_name = self.__colsetManager.get_attribute_domain_colset_name(in_attr_id)
             in_attr_place_name = get_preset_attribute_last_observation_place_name(transition_id, in_attr_id)
-            in_attr_variable = self.__colsetManager.get_one_var(in_attr_colset_name)
+            in_attr_variable = preset_domain_variables_by_attr_id[in_attr_id]
             preset_list_colset_name = self.__colsetManager.get_attribute_list_colset_name(in_attr_id)
             lobs_place = CPN_Place(in_attr_place_name, x + 50, y - 50 * i, self.cpn_id_manager,
                                    in_attr_colset_name)
@@ -475,10 +759,35 @@ class ControlFlowManager:
             # the last_observation colset is a product colset and the second element is a list
             # carrying either the last observation or nothing
             lobs_expression = "hd({0})".format(preset_list_variable)
+            if self.__carries_case_state():
+                lobs_expression = "hd({0} ({1}))".format(
+                    self.__colsetManager.get_case_state_projection(in_attr_id),
+                    self.__case_state_terms[start_transition.get_id()])
             start_to_lobs = CPN_Arc(self.cpn_id_manager, start_transition, lobs_place, lobs_expression)
             lobs_to_vt = CPN_Arc(self.cpn_id_manager, lobs_place, valuation_transition, in_attr_variable)
             self.__controlFlowMap.add_arc(start_to_lobs)
             self.__controlFlowMap.add_arc(lobs_to_vt)
+        # for aggregated dependencies, the start transition expires the observations that fall out of
+        # the selection and passes the aggregated value on to the valuation transition.
+        for i, in_relation in enumerate(aggregated_preset):
+            in_attr_id = in_relation.get_in().get_id()
+            in_attr_colset_name = self.__colsetManager.get_attribute_domain_colset_name(in_attr_id)
+            aggregation_place = self.__controlFlowMap.cpn_aggregation_places_by_relation[(in_attr_id, attribute_id)]
+            aggregation_var = self.__colsetManager.get_one_var(
+                self.__colsetManager.get_aggregation_state_colset_name(in_attr_id, attribute_id))
+            now_term = get_now_time_getter_name() + "()"
+            state_in = CPN_Arc(self.cpn_id_manager, aggregation_place, start_transition, aggregation_var)
+            state_out = CPN_Arc(self.cpn_id_manager, start_transition, aggregation_place, "{0}({1}, {2})".format(
+                get_aggregation_expirer_name(in_attr_id, attribute_id), aggregation_var, now_term))
+            agg_place = CPN_Place(get_preset_attribute_aggregation_place_name(transition_id, in_attr_id),
+                                  x + 50, y + 50 * (i + 1), self.cpn_id_manager, in_attr_colset_name)
+            self.__controlFlowMap.add_place(agg_place)
+            start_to_agg = CPN_Arc(self.cpn_id_manager, start_transition, agg_place, "{0}({1}, {2})".format(
+                get_aggregation_value_getter_name(in_attr_id, attribute_id), aggregation_var, now_term))
+            agg_to_vt = CPN_Arc(self.cpn_id_manager, agg_place, valuation_transition,
+                                preset_domain_variables_by_attr_id[in_attr_id])
+            for arc in [state_in, state_out, start_to_agg, agg_to_vt]:
+                self.__controlFlowMap.add_arc(arc)
         attr_domain_colset_name = self.__colsetManager.get_attribute_domain_colset_name(attribute_id)
         main_out_place = CPN_Place(
             get_attribute_valuation_main_out_place_name(transition_id, attribute_id), x + 50, y, self.cpn_id_manager,
@@ -497,6 +806,13 @@ class ControlFlowManager:
 
     def __control_transition_for_last_observations(self, start_transition: CPN_Transition):
         all_preset_attr_ids = list(self.__current_transformed_transition_dependent_attributes)
+        if self.__carries_case_state():
+            # last observations are projected from the case state at the start transition
+            case_state_term = self.__case_state_terms[start_transition.get_id()]
+            for preset_attr_id in all_preset_attr_ids:
+                start_transition.add_conjunct("length({0} ({1}))>0".format(
+                    self.__colsetManager.get_case_state_projection(preset_attr_id), case_state_term))
+            return
         all_preset_colset_names = [
             self.__colsetManager.get_attribute_list_colset_name(preset_attr_id)
             for preset_attr_id in all_preset_attr_ids]
@@ -560,6 +876,13 @@ class ControlFlowManager:
                     get_activity_event_writer_name(act_id),
                     action_parameters
                 )
+                if self.__event_output == EventOutput.MONITORS:
+                    # no event is written, only the delay is computed
+                    action_input = ""
+                    action = "ModelTime.fromInt(round(\n{0}\n(({1}))))".format(
+                        get_normalized_delay_from_now_function_name(ProcessTimeCategory.SERVICE),
+                        delay_term
+                    )
                 cpn_t.make_code(action_input, action_output, action)
 
     def add_table_initializing(self):
@@ -603,10 +926,10 @@ class ControlFlowManager:
             for t in act_transitions:
                 cpn_t = self.__controlFlowMap.cpn_transitions_by_simple_pn_transition_id[t.get_id()]
                 arc: CPN_Arc
-                case_id_colset = self.__colsetManager.get_case_id_colset()
+                case_token_colset_name = self.__get_case_token_colset_name()
                 control_postset = [
                     arc for arc in self.__controlFlowMap.cpn_arcs
-                    if arc.source == cpn_t and arc.target.colset_name == case_id_colset.colset_name
+                    if arc.source == cpn_t and arc.target.colset_name == case_token_colset_name
                 ]
                 for arc in control_postset:
                     annotation_text = arc.annotation_text + "@++" + self.__colsetManager.get_one_var("TIME")
@@ -622,16 +945,21 @@ class ControlFlowManager:
         #case_id_colset_name =   self.__colsetManager.get_case_id_colset().colset_name
         timedint_v = self.__colsetManager.get_one_var(timed_int_colset_name)
         #caseid_v = self.__colsetManager.get_one_var(case_id_colset_name)
-        caseid_term = '"CASE" ^ Int.toString({0})'.format(timedint_v)
-        number_of_cases = self.__simulationParameters.number_of_cases
-        case_generator_guard = "{0} <= {1}".format(timedint_v, str(number_of_cases))
+        caseid_term = '"{0}" ^ Int.toString({1})'.format(SimulationParameters.CASE_ID_PREFIX, timedint_v)
+        first_case_id = self.__simulationParameters.first_case_id
+        last_case_id = first_case_id + self.__simulationParameters.number_of_cases - 1
+        case_generator_guard = "{0} <= {1}".format(timedint_v, str(last_case_id))
         #case_id_declaration  = '{0} = "CASE" ^ Int.toString({1})'.format(caseid_v, timedint_v)
         initial_transition = CPN_Transition(TransitionType.SILENT, "init_t_case_generator", x, y+100.0,
                                             self.cpn_id_manager, case_generator_guard)
         #initial_transition.add_conjunct(case_id_declaration)
         initial_transition.add_conjunct(case_generator_guard)
         case_count_place = CPN_Place("init_p_case_count", x, y+150.0, self.cpn_id_manager,
-                                    colset_name=timed_int_colset_name, initmark="1")
+                                    colset_name=timed_int_colset_name, initmark=str(first_case_id))
+        if self.__warmup_time > 0:
+            # case ids are given in the order of arrival, and arrivals happen at integer times
+            initial_transition.make_code(timedint_v, "", "if intTime() < {0} then {1} := {2} else ()".format(
+                math.ceil(self.__warmup_time), get_warmup_case_id_name(), timedint_v))
         self.__controlFlowMap.add_transition(initial_transition)
         self.__controlFlowMap.add_place(case_count_place)
         delay_term = "ModelTime.fromInt(round(\n{0}\n(({1}))))".format(
@@ -643,10 +971,32 @@ class ControlFlowManager:
         self.__controlFlowMap.add_arc(cc_to_it)
         self.__controlFlowMap.add_arc(it_to_cc)
         init_p: SimplePetriNetPlace
+        initial_case_token = caseid_term
+        if self.__carries_case_state():
+            # a new case has not observed any attribute values yet
+            initial_case_token = "({0})".format(", ".join(
+                [caseid_term] + ["[], ~1" for _ in self.__colsetManager.get_case_state_attribute_ids()]))
         for init_p in initial_places:
             cpn_ip = self.__controlFlowMap.cpn_places_by_simple_pn_place_id[init_p.get_id()]
-            it_to_ip = CPN_Arc(self.cpn_id_manager, initial_transition, cpn_ip, caseid_term)
+            it_to_ip = CPN_Arc(self.cpn_id_manager, initial_transition, cpn_ip, initial_case_token)
             self.__controlFlowMap.add_arc(it_to_ip)
+        if self.__event_output == EventOutput.MONITORS:
+            # remember the arrival time of the case for its cycle time
+            self.__case_arrival_place = CPN_Place(get_case_arrival_place_name(), x, y + 200.0, self.cpn_id_manager,
+                                                  colset_name=self.__colsetManager.get_case_arrival_colset().colset_name)
+            self.__controlFlowMap.add_place(self.__case_arrival_place)
+            it_to_ca = CPN_Arc(self.cpn_id_manager, initial_transition, self.__case_arrival_place,
+                               "({0}, intTime())".format(caseid_term))
+            self.__controlFlowMap.add_arc(it_to_ca)
+        if self.__tracks_case_progress():
+            # a new case has a token in each of the initial places
+            self.__case_progress_place = CPN_Place(
+                get_case_progress_place_name(), x, y + 250.0, self.cpn_id_manager,
+                colset_name=self.__colsetManager.get_case_progress_colset().colset_name)
+            self.__controlFlowMap.add_place(self.__case_progress_place)
+            it_to_cp = CPN_Arc(self.cpn_id_manager, initial_transition, self.__case_progress_place,
+                               "({0}, {1})".format(caseid_term, len(initial_places)))
+            self.__controlFlowMap.add_arc(it_to_cp)
         lobs_p: CPN_Place
         #it_to_lobs_annotation = '({0},[])'.format(caseid_v)
         it_to_lobs_annotation = '({0},[])'.format(caseid_term)
@@ -654,3 +1004,129 @@ class ControlFlowManager:
             it_to_lobs = CPN_Arc(self.cpn_id_manager, initial_transition, lobs_p, it_to_lobs_annotation)
             self.__controlFlowMap.add_arc(it_to_lobs)
 
+    def make_case_cleanup(self):
+        """
+        For each final place of the net, make a transition that consumes the case tokens that reach it.
+        Once a case is done, the other tokens of the case, that is, its last observations (and its arrival time),
+        are consumed, too. If the net has a single final place, a case is done when its token reaches it,
+        so that its cleanup transition consumes them. With several final places, a case may still be running
+        when one of them is marked. Then, the number of tokens that each case has in places that are not final
+        is tracked, and a completion transition consumes these tokens once that number is zero.
+        This way, the marking of the net stays bounded by the number of concurrently active cases.
+        """
+        final_places = self.__petriNet.get_final_places()
+        case_token_var = self.__get_case_token_var()
+        final_p: SimplePetriNetPlace
+        for final_p in final_places:
+            cpn_fp = self.__controlFlowMap.cpn_places_by_simple_pn_place_id[final_p.get_id()]
+            cleanup_transition = CPN_Transition(TransitionType.SILENT, get_case_cleanup_transition_name(final_p),
+                                                final_p.x + 100.0, final_p.y, self.cpn_id_manager)
+            self.__controlFlowMap.add_transition(cleanup_transition)
+            fp_to_ct = CPN_Arc(self.cpn_id_manager, cpn_fp, cleanup_transition, case_token_var)
+            self.__controlFlowMap.add_arc(fp_to_ct)
+            if not self.__tracks_case_progress():
+                case_id_term = self.__colsetManager.get_one_var(self.__colsetManager.get_case_id_colset().colset_name)
+                if self.__carries_case_state():
+                    case_id_term = "{0} {1}".format(self.__colsetManager.get_case_state_projection(), case_token_var)
+                self.__consume_case_tokens(cleanup_transition, case_id_term)
+        if self.__tracks_case_progress():
+            self.__make_case_progress_tracking()
+
+    def __make_case_progress_tracking(self):
+        """
+        Update the number of tokens of each case in places that are not final at the transitions of the net,
+        and make the transition that consumes the other tokens of a case once that number is zero.
+        """
+        final_place_ids = set(p.get_id() for p in self.__petriNet.get_final_places())
+        case_id_var = self.__colsetManager.get_one_var(self.__colsetManager.get_case_id_colset().colset_name)
+        # the first INT variable is taken by the running event id at the labeled transitions
+        count_var = self.__colsetManager.get_some_vars("INT", 2)[1]
+        t: SimplePetriNetTransition
+        for t in self.__petriNet.get_transitions():
+            in_arcs = self.__petriNet.get_incoming_arcs(t.get_id())
+            out_arcs = self.__petriNet.get_outgoing_arcs(t.get_id())
+            delta = len([arc for arc in out_arcs if arc.get_place().get_id() not in final_place_ids]) - len(in_arcs)
+            if delta == 0:
+                continue
+            # the case tokens are produced by the (end) transition, so that a case that is executing an activity
+            # still counts the tokens it consumed at the start of the activity
+            cpn_t = self.__controlFlowMap.cpn_transitions_by_simple_pn_transition_id[t.get_id()]
+            case_id_term = case_id_var
+            if self.__carries_case_state() and not (
+                    cpn_t.get_id() in self.__case_state_terms and len(in_arcs) > 1):
+                case_id_term = "{0} {1}".format(
+                    self.__colsetManager.get_case_state_projection(), self.__get_case_token_var())
+            cp_to_t = CPN_Arc(self.cpn_id_manager, self.__case_progress_place, cpn_t,
+                              "({0},{1})".format(case_id_term, count_var))
+            t_to_cp = CPN_Arc(self.cpn_id_manager, cpn_t, self.__case_progress_place,
+                              "({0},{1} {2} {3})".format(case_id_term, count_var, "+" if delta > 0 else "-",
+                                                         abs(delta)))
+            self.__controlFlowMap.add_arc(cp_to_t)
+            self.__controlFlowMap.add_arc(t_to_cp)
+        some_initial_place = self.__petriNet.get_initial_places()[0]
+        completion_transition = CPN_Transition(TransitionType.SILENT, get_case_completion_transition_name(),
+                                               some_initial_place.x + 100.0, some_initial_place.y + 250.0,
+                                               self.cpn_id_manager)
+        self.__controlFlowMap.add_transition(completion_transition)
+        cp_to_ct = CPN_Arc(self.cpn_id_manager, self.__case_progress_place, completion_transition,
+                           "({0},0)".format(case_id_var))
+        self.__controlFlowMap.add_arc(cp_to_ct)
+        self.__consume_case_tokens(completion_transition, case_id_var)
+
+    def __consume_case_tokens(self, completion_transition: CPN_Transition, case_id_term: str):
+        """
+        Make a transition where cases are done consume their last observations (and their arrival times).
+
+        :param completion_transition: The transition where cases are done
+        :param case_id_term: The term of the case id at that transition
+        """
+        self.__case_completion_transitions.append(completion_transition)
+        if self.__case_arrival_place is not None:
+            ca_to_ct = CPN_Arc(self.cpn_id_manager, self.__case_arrival_place, completion_transition,
+                               "({0},{1})".format(case_id_term, self.__colsetManager.get_one_var("INT")))
+            self.__controlFlowMap.add_arc(ca_to_ct)
+        lobs_p: CPN_Place
+        for attribute_id, lobs_p in self.__controlFlowMap.cpn_lobs_places_by_attribute_id.items():
+            lobs_list_var = self.__colsetManager.get_one_var(
+                self.__colsetManager.get_attribute_list_colset_name(attribute_id)
+            )
+            lobs_to_ct = CPN_Arc(self.cpn_id_manager, lobs_p, completion_transition,
+                                 "({0},{1})".format(case_id_term, lobs_list_var))
+            self.__controlFlowMap.add_arc(lobs_to_ct)
+
+    def get_monitors(self) -> list[DataCollectorMonitor]:
+        """
+        Get the data collector monitors of a simulation whose output are monitors (see EventOutput):
+        the cycle time of each case (observed when it is done), the number of events of each activity
+        (as the count of an observation of 1 per event), and for each label of each attribute, whether an event
+        observes it (1 or 0, so that the average is the frequency of the label).
+
+        :return: the monitors
+        """
+        if self.__event_output != EventOutput.MONITORS:
+            return []
+        int_var = self.__colsetManager.get_one_var("INT")
+        monitors = [DataCollectorMonitor("cycle_time", [
+            MonitorObservation(completion_transition, [int_var], "intTime() - {0}".format(int_var))
+            for completion_transition in self.__case_completion_transitions
+        ])]
+        for act in self.__causalModel.get_activities():
+            act_transitions = [self.__controlFlowMap.cpn_transitions_by_simple_pn_transition_id[t.get_id()]
+                               for t in self.__petriNet.get_transitions_with_label(act.get_name())]
+            if not act_transitions:
+                continue
+            monitors.append(DataCollectorMonitor("count_" + act.get_id(), [
+                MonitorObservation(cpn_t, [], "1") for cpn_t in act_transitions
+            ]))
+            attribute: CPM_Categorical_Attribute
+            for attribute in self.__causalModel.get_attributes_for_activity_id(act.get_id()):
+                attribute_domain_var = self.__colsetManager.get_one_var(
+                    self.__colsetManager.get_attribute_domain_colset_name(attribute.get_id())
+                )
+                for label in attribute.get_labels():
+                    monitors.append(DataCollectorMonitor("frequency_{0}_{1}".format(attribute.get_id(), label), [
+                        MonitorObservation(cpn_t, [attribute_domain_var],
+                                           "if {0} = {1} then 1 else 0".format(attribute_domain_var, label))
+                        for cpn_t in act_transitions
+                    ]))
+        return monitors
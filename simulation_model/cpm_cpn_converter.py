@@ -1,43 +1,84 @@
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element
 
+from causal_model.aggregation import LastKSelection, TimeWindowSelection
 from causal_model.causal_process_model import CausalProcessModel
 from causal_model.causal_process_structure import CPM_Categorical_Attribute
 from process_model.petri_net import SimplePetriNet
-from simulation_model.cpn_utils.cpn_transition import CPN_Transition
+from simulation_model.cpn_utils.cpn_arc import CPN_Arc
+from simulation_model.cpn_utils.cpn_place import CPN_Place
+from simulation_model.cpn_utils.cpn_transition import CPN_Transition, TransitionType
 from simulation_model.functions import get_all_standard_functions_ordered_sml, get_event_writer_sml, \
     get_activity_event_writer_name, get_eaval2list_converter_sml, get_eaval2list_converter_name, \
     get_label_to_string_converter_sml, get_label_to_string_converter_name, get_activity_event_table_initializer_name, \
-    get_activity_event_table_initializer_sml, get_all_timing_functions_ordered_sml, get_all_event_functions_ordered_sml
+    get_activity_event_table_initializer_sml, get_all_timing_functions_ordered_sml, get_all_event_functions_ordered_sml, \
+    get_case_state_merger_name, get_case_state_merger_sml, get_all_aggregation_functions_ordered_sml, \
+    get_aggregation_label_index_name, get_aggregation_label_index_sml, get_aggregation_index_label_name, \
+    get_aggregation_index_label_sml, get_aggregation_functions_sml, get_all_seeded_random_functions_ordered_sml, \
+    get_aggregation_eviction_condition_sml, get_aggregation_expression_sml, get_all_warmup_functions_ordered_sml, \
+    TimestampFormat
 from simulation_model.simulation_parameters import SimulationParameters
 from simulation_model.timing import ActivityTimingManager, ProcessTimeCategory
 from simulation_model.cpn_utils.cpn import CPN
 from simulation_model.colset import ColsetManager, Colset_Type, Colset, WithColset
-from simulation_model.control_flow import ControlFlowManager
+from simulation_model.control_flow import ControlFlowManager, CaseStateEncoding, EventOutput
+from simulation_model.monitors import DataCollectorMonitor, DATA_COLLECTOR_TYPE, DATA_COLLECTOR_TYPE_DESCRIPTION
 from simulation_model.cpn_utils.xml_utils.cpn_id_managment import CPN_ID_Manager
 from simulation_model.cpn_utils.xml_utils.page import Page
+from utils.validators import validate_condition
 
 
 class CPM_CPN_Converter:
 
+    def __validate(self):
+        aggregation_selections = self.causalModel.get_aggregation_selection()
+        unsupported_relations = [
+            "{0} -> {1}".format(relation.get_in().get_id(), relation.get_out().get_id())
+            for relation in self.causalModel.get_aggregated_relations()
+            if not isinstance(aggregation_selections.get_selection(relation), (LastKSelection, TimeWindowSelection))
+        ]
+        validate_condition(
+            not unsupported_relations,
+            "The aggregated dependencies {0} select observations in a way that only the Python simulation supports "
+            "(e.g., exponential decay), not the CPN.".format(unsupported_relations))
+        validate_condition(self.warmup_time >= 0, "The warm-up time must not be negative.")
+        validate_condition(
+            self.warmup_time == 0 or self.event_output == EventOutput.EVENT_TABLES,
+            "The warm-up period of the CPN only applies to the event tables it writes, not to monitors.")
+
     def __init__(self,
                  cpn_template_path: str,
                  petriNet: SimplePetriNet,
                  causalModel: CausalProcessModel,
                  simulationParameters: SimulationParameters,
-                 model_name: str
+                 model_name: str,
+                 case_state_encoding: CaseStateEncoding = CaseStateEncoding.LAST_OBSERVATION_PLACES,
+                 use_subpages: bool = False,
+                 event_output: EventOutput = EventOutput.EVENT_TABLES,
+                 timestamp_format: TimestampFormat = TimestampFormat.DATETIME,
+                 warmup_time: float = 0.0
                  ):
         self.model_name = model_name
+        self.event_output = event_output
+        self.warmup_time = warmup_time
+        self.timestamp_format = timestamp_format
+        self.case_state_encoding = case_state_encoding
+        self.use_subpages = use_subpages
         self.tree = ET.parse(cpn_template_path)
         self.root = self.tree.getroot()
         self.mainpage = self.root.find("cpnet").find("page")
         self.subpages = []
+        self.mainpage_nodes = []
+        self.subpage_instance_ids = dict()
         # self.portsock_map = dict()
         cpn_id_manager = CPN_ID_Manager(open(cpn_template_path).read())
         self.cpn_id_manager = cpn_id_manager
         self.colset_manager = ColsetManager(cpn_id_manager)
         self.controlflow_manager = ControlFlowManager(
-            cpn_id_manager, petriNet, causalModel, simulationParameters, self.colset_manager
+            cpn_id_manager, petriNet, causalModel, simulationParameters, self.colset_manager,
+            case_state_encoding=case_state_encoding,
+            event_output=event_output,
+            warmup_time=warmup_time
         )
         self.initial_places = {}
         self.new_colsets = []
@@ -50,6 +91,7 @@ class CPM_CPN_Converter:
         self.petriNet = petriNet
         self.causalModel = causalModel
         self.simulationParameters = simulationParameters
+        self.__validate()
 
     def convert(self):
         self.__initialize_activities_and_attributes()
@@ -57,8 +99,11 @@ class CPM_CPN_Converter:
         self.__make_colset_variables()
         self.__merge_nets()
         self.__make_case_generator()
+        self.__make_case_cleanup()
         self.__add_timing()
         self.__add_actions()
+        if self.use_subpages:
+            self.__make_subpages()
         self.__build_dom()
 
     def export(self, model_outpath):
@@ -110,9 +155,7 @@ class CPM_CPN_Converter:
             attr.get_id() for attr in
             self.causalModel.get_attributes_with_non_aggregated_dependencies()
         ]
-        attributes_with_system_aggregations = [
-            attr.get_id() for attr in
-            self.causalModel.get_attributes_with_aggregated_dependencies()]
+        aggregated_relations = self.causalModel.get_aggregated_relations()
         standard_declarations_element = self.__get_dom_block_element("Standard declarations")
         self.colset_manager.parse_standard_colsets(standard_declarations_element)
         self.colset_manager.add_case_id_colset()
@@ -123,8 +166,14 @@ class CPM_CPN_Converter:
             attributes=self.__attributes,
             attribute_activities=self.__attributeActivities,
             attributes_with_last_observations=attributes_with_last_observations,
-            attributes_with_system_aggregations=attributes_with_system_aggregations
+            aggregated_relations=aggregated_relations
         )
+        if self.case_state_encoding == CaseStateEncoding.CASE_TOKEN and attributes_with_last_observations:
+            self.colset_manager.add_case_state_colset(attributes_with_last_observations)
+        if self.event_output == EventOutput.MONITORS:
+            self.colset_manager.add_case_arrival_colset()
+        if len(self.petriNet.get_final_places()) > 1:
+            self.colset_manager.add_case_progress_colset()
 
     def __make_colset_variables(self):
         self.colset_manager.make_variables()
@@ -132,6 +181,9 @@ class CPM_CPN_Converter:
     def __make_case_generator(self):
         self.controlflow_manager.make_case_generator()
 
+    def __make_case_cleanup(self):
+        self.controlflow_manager.make_case_cleanup()
+
     def __merge_nets(self):
         self.controlflow_manager.merge_models()
 
@@ -140,6 +192,7 @@ class CPM_CPN_Converter:
         self.__build_variables()
         self.__build_petri_net()
         self.__build_functions()
+        self.__build_monitors()
 
     def __build_colsets(self):
         for colset in self.colset_manager.get_ordered_colsets():
@@ -161,15 +214,110 @@ class CPM_CPN_Converter:
             self.__build_colset_vars(var_block, colset_name, varset)
 
     def __build_petri_net(self):
-        places = self.controlflow_manager.get_cpn_places()
-        transitions = self.controlflow_manager.get_cpn_transitions()
-        arcs = self.controlflow_manager.get_cpn_arcs()
-        for node in places + transitions + arcs:
+        if self.use_subpages:
+            mainpage_nodes = self.mainpage_nodes
+        else:
+            places = self.controlflow_manager.get_cpn_places()
+            transitions = self.controlflow_manager.get_cpn_transitions()
+            arcs = self.controlflow_manager.get_cpn_arcs()
+            mainpage_nodes = places + transitions + arcs
+        for node in mainpage_nodes:
             node.to_DOM_Element(self.mainpage)
-        for subpage in self.subpages:
+        # subpages follow the main page
+        cpnet = self.root.find("cpnet")
+        mainpage_index = list(cpnet).index(self.mainpage)
+        mainpage_instance = cpnet.find("instances").find("instance")
+        for i, subpage in enumerate(self.subpages):
             subpage: Page
-            # subpage.scale(2.0)
-            subpage.to_DOM_Element(self.root.find("cpnet"))
+            subpage_element = subpage.to_DOM_Element(cpnet)
+            cpnet.remove(subpage_element)
+            cpnet.insert(mainpage_index + 1 + i, subpage_element)
+            subpage_instance = ET.SubElement(mainpage_instance, "instance")
+            subpage_instance.set("id", self.cpn_id_manager.give_ID())
+            self.subpage_instance_ids[subpage.get_id()] = subpage_instance.get("id")
+            subpage_instance.set("trans", subpage.subpage_transition.get_id())
+
+    def __make_subpages(self):
+        """
+        Put the nodes that model the execution of each labeled transition onto a subpage of its own.
+        On the main page, the labeled transition is replaced by a substitution transition.
+        Places of the main page that those nodes are connected to become sockets of the substitution transition,
+        and get a copy on the subpage that is assigned to the socket as a port.
+        """
+        node_ids_by_labeled_transition = self.controlflow_manager.get_cpn_node_ids_by_labeled_transition()
+        subpage_id_by_node_id = dict()
+        for labeled_transition_id, node_ids in node_ids_by_labeled_transition.items():
+            for node_id in node_ids:
+                subpage_id_by_node_id[node_id] = labeled_transition_id
+        subpage_nodes = {t_id: [self.controlflow_manager.get_cpn_node(node_id) for node_id in node_ids]
+                         for t_id, node_ids in node_ids_by_labeled_transition.items()}
+        subpage_arcs = {t_id: [] for t_id in node_ids_by_labeled_transition}
+        # for each subpage, the sockets and the directions in which the subpage accesses them
+        socket_orientations = {t_id: dict() for t_id in node_ids_by_labeled_transition}
+        ports = {t_id: dict() for t_id in node_ids_by_labeled_transition}
+        mainpage_arcs = []
+        arc: CPN_Arc
+        for arc in self.controlflow_manager.get_cpn_arcs():
+            place_subpage = subpage_id_by_node_id.get(arc.placeend.get_id())
+            transition_subpage = subpage_id_by_node_id.get(arc.transend.get_id())
+            if transition_subpage is None:
+                validate_condition(place_subpage is None,
+                                   "Place {0} is internal to a subpage, but connected to transition {1} "
+                                   "outside of it.".format(arc.placeend.get_name(), arc.transend.name))
+                mainpage_arcs.append(arc)
+                continue
+            if place_subpage == transition_subpage:
+                subpage_arcs[transition_subpage].append(arc)
+                continue
+            validate_condition(place_subpage is None,
+                               "Place {0} is connected to the subpages of two transitions.".format(
+                                   arc.placeend.get_name()))
+            socket = arc.placeend
+            if socket.get_id() not in ports[transition_subpage]:
+                ports[transition_subpage][socket.get_id()] = CPN_Place(
+                    socket.get_name(), socket.x, socket.y, self.cpn_id_manager, socket.colset_name)
+                socket_orientations[transition_subpage][socket.get_id()] = set()
+            port = ports[transition_subpage][socket.get_id()]
+            socket_orientations[transition_subpage][socket.get_id()].add(arc.orientation)
+            if arc.orientation == "PtoT":
+                port_arc = CPN_Arc(self.cpn_id_manager, port, arc.transend, arc.annotation_text)
+            else:
+                port_arc = CPN_Arc(self.cpn_id_manager, arc.transend, port, arc.annotation_text)
+            subpage_arcs[transition_subpage].append(port_arc)
+        subpage_node_ids = set(subpage_id_by_node_id.keys())
+        mainpage_places = [p for p in self.controlflow_manager.get_cpn_places() if p.get_id() not in subpage_node_ids]
+        mainpage_transitions = [t for t in self.controlflow_manager.get_cpn_transitions()
+                                if t.get_id() not in subpage_node_ids]
+        for labeled_transition_id, nodes in subpage_nodes.items():
+            labeled_transition: CPN_Transition = self.controlflow_manager.get_cpn_node(
+                node_ids_by_labeled_transition[labeled_transition_id][0])
+            substitution_transition = CPN_Transition(TransitionType.ACTIVITY, labeled_transition.name,
+                                                     labeled_transition.x, labeled_transition.y,
+                                                     self.cpn_id_manager)
+            portsock_map = dict()
+            for socket_id, port in ports[labeled_transition_id].items():
+                socket: CPN_Place = self.controlflow_manager.get_cpn_node(socket_id)
+                orientations = socket_orientations[labeled_transition_id][socket_id]
+                if orientations == {"PtoT"}:
+                    port.make_port("In", None)
+                    mainpage_arcs.append(CPN_Arc(self.cpn_id_manager, socket, substitution_transition))
+                elif orientations == {"TtoP"}:
+                    port.make_port("Out", None)
+                    mainpage_arcs.append(CPN_Arc(self.cpn_id_manager, substitution_transition, socket))
+                else:
+                    port.make_port("I/O", None)
+                    socket_arc = CPN_Arc(self.cpn_id_manager, socket, substitution_transition)
+                    socket_arc.set_bidirectional()
+                    mainpage_arcs.append(socket_arc)
+                portsock_map[port] = socket
+            places = [node for node in nodes if isinstance(node, CPN_Place)] + list(ports[labeled_transition_id].values())
+            transitions = [node for node in nodes if isinstance(node, CPN_Transition)]
+            subpage = Page(labeled_transition_id, self.cpn_id_manager, places, transitions,
+                           subpage_arcs[labeled_transition_id], subpage_transition=substitution_transition)
+            substitution_transition.add_substitution_info(subpage, portsock_map)
+            mainpage_transitions.append(substitution_transition)
+            self.subpages.append(subpage)
+        self.mainpage_nodes = mainpage_places + mainpage_transitions + mainpage_arcs
 
     def __build_colset(self, parent: Element, colset: Colset):
         colset_element = ET.SubElement(parent, "color")
@@ -224,14 +372,26 @@ class CPM_CPN_Converter:
         fun_block.set("id", fun_block_id)
         id_child = ET.SubElement(fun_block, "id")
         id_child.text = "Functions"
-        all_functions = \
+        all_functions = []
+        if self.simulationParameters.random_seed is not None:
+            all_functions += get_all_seeded_random_functions_ordered_sml(self.simulationParameters.random_seed)
+        if self.warmup_time > 0:
+            all_functions += get_all_warmup_functions_ordered_sml(self.simulationParameters.first_case_id)
+        # only summary statistics are collected with monitors, so that no event rows are written
+        writes_event_tables = self.event_output == EventOutput.EVENT_TABLES
+        all_functions += \
             get_all_standard_functions_ordered_sml() + \
             get_all_timing_functions_ordered_sml({
                 ProcessTimeCategory.SERVICE: self.simulationParameters.service_time_density,
                 ProcessTimeCategory.ARRIVAL: self.simulationParameters.case_arrival_density
-            }) + \
-            get_all_event_functions_ordered_sml() + \
-            self.causalModel.get_valuation_functions_sml()
+            })
+        if writes_event_tables:
+            all_functions += get_all_event_functions_ordered_sml()
+        all_functions += self.causalModel.get_valuation_functions_sml()
+        if self.colset_manager.has_case_state_colset():
+            all_functions.append((get_case_state_merger_name(), get_case_state_merger_sml(
+                self.colset_manager.get_case_state_colset().colset_name,
+                len(self.colset_manager.get_case_state_attribute_ids()))))
         for attribute in self.__attributes:
             if not isinstance(attribute, CPM_Categorical_Attribute):
                 continue
@@ -240,22 +400,26 @@ class CPM_CPN_Converter:
             l2s_name = get_label_to_string_converter_name(attribute)
             l2s_sml = get_label_to_string_converter_sml(attribute, domain_colset_name)
             all_functions.append((l2s_name, l2s_sml))
-        for activity in self.__activities:
-            act_id = activity.get_id()
-            act_name = activity.get_name()
-            eaval_colset_name = self.colset_manager.get_activity_eaval_colset_name(act_id)
-            eaval_to_list_converter_name = get_eaval2list_converter_name(act_id)
-            attributes = self.causalModel.get_attributes_for_activity_id(act_id)
-            attribute_names = [attr.get_name() for attr in attributes]
-            eaval_to_list_converter_sml = get_eaval2list_converter_sml(
-                act_id, eaval_colset_name, attributes)
-            event_writer_name = get_activity_event_writer_name(act_id)
-            event_writer_sml = get_event_writer_sml(act_id, act_name, eaval_colset_name, self.model_name)
-            event_initializer_name = get_activity_event_table_initializer_name(act_id)
-            event_initializer_sml  = get_activity_event_table_initializer_sml(act_id, attribute_names, self.model_name)
-            all_functions.append((event_initializer_name, event_initializer_sml))
-            all_functions.append((eaval_to_list_converter_name, eaval_to_list_converter_sml))
-            all_functions.append((event_writer_name, event_writer_sml))
+        all_functions += self.__get_aggregation_functions()
+        if writes_event_tables:
+            for activity in self.__activities:
+                act_id = activity.get_id()
+                act_name = activity.get_name()
+                eaval_colset_name = self.colset_manager.get_activity_eaval_colset_name(act_id)
+                eaval_to_list_converter_name = get_eaval2list_converter_name(act_id)
+                attributes = self.causalModel.get_attributes_for_activity_id(act_id)
+                attribute_names = [attr.get_name() for attr in attributes]
+                eaval_to_list_converter_sml = get_eaval2list_converter_sml(
+                    act_id, eaval_colset_name, attributes)
+                event_writer_name = get_activity_event_writer_name(act_id)
+                event_writer_sml = get_event_writer_sml(act_id, act_name, eaval_colset_name, self.model_name,
+                                                        self.timestamp_format, self.warmup_time > 0)
+                event_initializer_name = get_activity_event_table_initializer_name(act_id)
+                event_initializer_sml  = get_activity_event_table_initializer_sml(act_id, attribute_names,
+                                                                                  self.model_name)
+                all_functions.append((event_initializer_name, event_initializer_sml))
+                all_functions.append((eaval_to_list_converter_name, eaval_to_list_converter_sml))
+                all_functions.append((event_writer_name, event_writer_sml))
         for act in self.__activities:
             act_name = act.get_name()
             timing = self.simulationParameters.activity_timing_manager.\
@@ -273,9 +437,94 @@ class CPM_CPN_Converter:
             layout_element.text = fun_string
             fun_element.set("id", self.cpn_id_manager.give_ID())
 
+    def __build_monitors(self):
+        """
+        Add the data collector monitors of the simulation (if any) to the monitor block of the CPN.
+        Each monitor refers to its transitions by the instances of their pages.
+        """
+        monitors = self.controlflow_manager.get_monitors()
+        if not monitors:
+            return
+        cpnet = self.root.find("cpnet")
+        mainpage_name = self.mainpage.find("pageattr").get("name")
+        mainpage_instance_id = cpnet.find("instances").find("instance").get("id")
+        page_names = dict()
+        page_instance_ids = dict()
+        for subpage in self.subpages:
+            subpage: Page
+            for node_id in self.controlflow_manager.get_cpn_node_ids_by_labeled_transition()[subpage.name]:
+                page_names[node_id] = subpage.name
+                page_instance_ids[node_id] = self.subpage_instance_ids[subpage.get_id()]
+        monitor_block = cpnet.find("monitorblock")
+        monitor: DataCollectorMonitor
+        for monitor in monitors:
+            for transition in monitor.get_transitions():
+                page_names.setdefault(transition.get_id(), mainpage_name)
+            monitor_element = ET.SubElement(monitor_block, "monitor")
+            monitor_element.set("id", self.cpn_id_manager.give_ID())
+            monitor_element.set("name", monitor.name)
+            monitor_element.set("type", DATA_COLLECTOR_TYPE)
+            monitor_element.set("typedescription", DATA_COLLECTOR_TYPE_DESCRIPTION)
+            monitor_element.set("disabled", "false")
+            for transition in monitor.get_transitions():
+                node_element = ET.SubElement(monitor_element, "node")
+                node_element.set("idref", transition.get_id())
+                node_element.set("pageinstanceidref", page_instance_ids.get(transition.get_id(), mainpage_instance_id))
+            for declaration_name, declaration_sml in [("Predicate", monitor.get_predicate_sml(page_names)),
+                                                      ("Observer", monitor.get_observer_sml(page_names)),
+                                                      ("Init function", monitor.get_init_sml()),
+                                                      ("Stop", monitor.get_stop_sml())]:
+                declaration_element = ET.SubElement(monitor_element, "declaration")
+                declaration_element.set("name", declaration_name)
+                ml_element = ET.SubElement(declaration_element, "ml")
+                ml_element.set("id", self.cpn_id_manager.give_ID())
+                ml_element.text = declaration_sml
+                layout_element = ET.SubElement(ml_element, "layout")
+                layout_element.text = declaration_sml
+            for option_name in ["Timed", "Logging"]:
+                option_element = ET.SubElement(monitor_element, "option")
+                option_element.set("name", option_name)
+                option_element.set("value", "false")
+
+    def __get_aggregation_functions(self):
+        """
+        Get the functions that maintain and evaluate the states of the aggregated dependencies.
+
+        :return: the functions as (name, code) pairs
+        """
+        aggregated_relations = self.causalModel.get_aggregated_relations()
+        if not aggregated_relations:
+            return []
+        functions = get_all_aggregation_functions_ordered_sml()
+        aggregated_attributes = []
+        for relation in aggregated_relations:
+            if relation.get_in() not in aggregated_attributes:
+                aggregated_attributes.append(relation.get_in())
+        attribute: CPM_Categorical_Attribute
+        for attribute in aggregated_attributes:
+            domain_colset_name = self.colset_manager.get_attribute_domain_colset_name(attribute.get_id())
+            functions.append((get_aggregation_label_index_name(attribute.get_id()),
+                              get_aggregation_label_index_sml(attribute, domain_colset_name)))
+            functions.append((get_aggregation_index_label_name(attribute.get_id()),
+                              get_aggregation_index_label_sml(attribute, domain_colset_name)))
+        for relation in aggregated_relations:
+            attr_in: CPM_Categorical_Attribute = relation.get_in()
+            attr_out_id = relation.get_out().get_id()
+            selection = self.causalModel.get_aggregation_selection().get_selection(relation)
+            function = self.causalModel.get_aggregation_function().get_function(relation)
+            eviction_condition = get_aggregation_eviction_condition_sml(selection, "t", "s", "n")
+            aggregation_expression = get_aggregation_expression_sml(function, "counts", "total", attr_in)
+            functions += get_aggregation_functions_sml(
+                attr_in, attr_out_id,
+                self.colset_manager.get_aggregation_state_colset_name(attr_in.get_id(), attr_out_id),
+                self.colset_manager.get_intlist_colset_name(),
+                eviction_condition, aggregation_expression)
+        return functions
+
     def __add_timing(self):
         self.controlflow_manager.add_timing()
 
     def __add_actions(self):
         self.controlflow_manager.add_iostream()
-        self.controlflow_manager.add_table_initializing()
+        if self.event_output == EventOutput.EVENT_TABLES:
+            self.controlflow_manager.add_table_initializing()
@@ -98,6 +98,13 @@ class CPN_Arc(CPN_Node):
         self.annotation_text = annotation_text
         self.annotation.set_text(annotation_text)
 
+    def set_bidirectional(self):
+        """
+        Make this a double arc (e.g., between a socket place and a substitution transition with an I/O port).
+        """
+        self.orientation = "BOTHDIR"
+        self.attributes["orientation"] = self.orientation
+
     def update_target(self, new_target: SemanticNetNode):
         arc: CPN_Arc
         self.target.incoming_arcs = list(filter(lambda arc: arc.get_id() != self.get_id(), self.target.incoming_arcs))
@@ -24,8 +24,7 @@ class Port(CPN_Node):
         child_elements.append(Fillattr("Solid"))
         child_elements.append(Lineattr("0"))
         child_elements.append(Textattr())
-        element_id = cpn_id_manager.give_ID()
-        CPN_Node.__init__(self, tag, element_id, attributes, child_elements)
+        CPN_Node.__init__(self, tag, cpn_id_manager, attributes, child_elements)
 
 
 class Pageattr(DOM_Element):
@@ -229,7 +229,7 @@ class CPN_Transition(SemanticNetNode):
         child_elements.append(Code(x, y, cpn_id_manager, code))
         child_elements.append(Priority(x, y, cpn_id_manager, priority))
         if portsock_info is not None:
-            child_elements.append(Substitution(x, y, cpn_id_manager, subpage.description, subpage.get_id, portsock_info))
+            child_elements.append(Substitution(x, y, cpn_id_manager, subpage.name, subpage.get_id(), portsock_info))
         SemanticNetNode.__init__(self, tag, cpn_id_manager, attributes, child_elements)
         self.is_subpage_transition = False
 
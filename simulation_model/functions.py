@@ -1,6 +1,11 @@
+from enum import Enum
+
+from causal_model.aggregation import AggregationSelection, LastKSelection, TimeWindowSelection, \
+    AggregationFunction, MajorityAggregation, LabelShareAggregation
 from causal_model.causal_process_structure import CPM_Categorical_Attribute
 from simulation_model.timing import TimeInterval, HourDensity, WeekdayDensity, TimeDensity, ProcessTimeCategory, \
     TimeUnit, TimeDensityCalendar
+from simulation_model.simulation_parameters import SimulationParameters
 
 MINUTE_CONSTANT_NAME = "minute"
 HOUR_CONSTANT_NAME = "hour"
@@ -24,10 +29,39 @@ NORMALIZED_DELAY_FUNCTION_NAME = "normalized_delay"
 EAVAL2LIST_CONVERTER_NAME = "eaval2list"
 RECORD_WRITER_NAME = "write_record"
 EVENT_WRITER_NAME = "write_event"
+CASE_STATE_MERGER_NAME = "merge_case_state"
+AGGREGATION_COUNT_ADDER_NAME = "agg_add_count"
+AGGREGATION_SUM_NAME = "agg_sum"
+AGGREGATION_ARGMAX_NAME = "agg_argmax"
+AGGREGATION_LABEL_INDEX_NAME = "agg_label_index"
+AGGREGATION_INDEX_LABEL_NAME = "agg_index_label"
+AGGREGATION_EVICTOR_NAME = "agg_evict"
+AGGREGATION_EXPIRER_NAME = "agg_expire"
+AGGREGATION_UPDATER_NAME = "agg_update"
+AGGREGATION_VALUE_GETTER_NAME = "agg_value"
+RANDOM_STATE_NAME = "rng_state"
+RANDOM_NEXT_NAME = "rng_next"
+# seeded simulations shadow the random distribution functions of CPN Tools that the generated code calls
+UNIFORM_DISTRIBUTION_NAME = "uniform"
+EXPONENTIAL_DISTRIBUTION_NAME = "exponential"
+# the events of cases that arrive during the warm-up period are not written
+WARMUP_CASE_ID_NAME = "last_warmup_case_id"
+WARMUP_CASE_CHECKER_NAME = "is_warmup_case"
 # TODO: Make start time parametrizable
 PROCESS_START_TIMESTAMP = str(TimeInterval(days=20055, hours=8).get_seconds()) + ".0"
 
 
+class TimestampFormat(Enum):
+    """
+    How the simulation in CPN Tools writes the timestamps of events: DATETIME formats them as dates in UTC by t2s
+    (e.g., "2024-11-28 08:00:00"), MODEL_TIME writes the model time in seconds since the process start
+    (e.g., "1234.500"), which avoids the date conversion for each event. Such tables can be loaded as they are,
+    or converted to dates afterwards (see event_log.loading.format_event_table_timestamps).
+    """
+    DATETIME = "DATETIME"
+    MODEL_TIME = "MODEL_TIME"
+
+
 def get_timeunit_constant_name(timeunit: TimeUnit):
     if timeunit == TimeUnit.MINUTE:
         return MINUTE_CONSTANT_NAME
@@ -116,6 +150,46 @@ def get_event_writer_name():
     return EVENT_WRITER_NAME
 
 
+def get_case_state_merger_name():
+    return CASE_STATE_MERGER_NAME
+
+
+def get_aggregation_count_adder_name():
+    return AGGREGATION_COUNT_ADDER_NAME
+
+
+def get_aggregation_sum_name():
+    return AGGREGATION_SUM_NAME
+
+
+def get_aggregation_argmax_name():
+    return AGGREGATION_ARGMAX_NAME
+
+
+def get_aggregation_label_index_name(attribute_id: str):
+    return "{0}_{1}".format(AGGREGATION_LABEL_INDEX_NAME, attribute_id)
+
+
+def get_aggregation_index_label_name(attribute_id: str):
+    return "{0}_{1}".format(AGGREGATION_INDEX_LABEL_NAME, attribute_id)
+
+
+def get_aggregation_evictor_name(attr_in_id: str, attr_out_id: str):
+    return "{0}_{1}_{2}".format(AGGREGATION_EVICTOR_NAME, attr_in_id, attr_out_id)
+
+
+def get_aggregation_expirer_name(attr_in_id: str, attr_out_id: str):
+    return "{0}_{1}_{2}".format(AGGREGATION_EXPIRER_NAME, attr_in_id, attr_out_id)
+
+
+def get_aggregation_updater_name(attr_in_id: str, attr_out_id: str):
+    return "{0}_{1}_{2}".format(AGGREGATION_UPDATER_NAME, attr_in_id, attr_out_id)
+
+
+def get_aggregation_value_getter_name(attr_in_id: str, attr_out_id: str):
+    return "{0}_{1}_{2}".format(AGGREGATION_VALUE_GETTER_NAME, attr_in_id, attr_out_id)
+
+
 def get_process_start_timestamp():
     return PROCESS_START_TIMESTAMP
 
@@ -151,7 +225,7 @@ def get_list2string_converter_sml():
 
 
 def get_time2date_converter_sml():
-    return "fun {0}(t) = Date.fromTimeLocal(Time.fromReal(t+{1}()));".format(
+    return "fun {0}(t) = Date.fromTimeUniv(Time.fromReal(t+{1}()));".format(
         get_time2date_converter_name(),
         get_start_time_getter_name()
     )
@@ -187,7 +261,7 @@ def get_time2projected_timeunit_string_converter_sml(timeunit: TimeUnit):
         iso_format_string = "H"
     else:
         raise AttributeError("Invalid Timeunit {0}".format(timeunit.value))
-    return 'fun {0}(t) = Date.fmt "%{1}" (Date.fromTimeLocal(Time.fromReal(t+start_time())));'.format(
+    return 'fun {0}(t) = Date.fmt "%{1}" (Date.fromTimeUniv(Time.fromReal(t+start_time())));'.format(
         get_time2projected_timeunit_string_converter_name(timeunit),
         iso_format_string
     )
@@ -217,7 +291,7 @@ def get_timeunit2string_converter_name(timeunit: str):
 
 def get_time2string_converter_sml():
     return '''
-    fun {0}(t) = Date.fmt "%Y-%m-%d %H:%M:%S" (Date.fromTimeLocal(Time.fromReal(t+{1}())));    
+    fun {0}(t) = Date.fmt "%Y-%m-%d %H:%M:%S" (Date.fromTimeUniv(Time.fromReal(t+{1}())));    
     '''.format(
         get_time2string_converter_name(),
         get_start_time_getter_name()
@@ -407,23 +481,36 @@ def get_eaval2list_converter_sml(act_id: str, eaval_colset_name: str,
     return sml
 
 
-def get_event_writer_sml(activity_id: str, activity_name: str, eaval_colset_name: str, model_name: str):
+def get_event_writer_sml(activity_id: str, activity_name: str, eaval_colset_name: str, model_name: str,
+                         timestamp_format: TimestampFormat = TimestampFormat.DATETIME,
+                         skips_warmup_cases: bool = False):
     """
     A function for writing an event, taking an event id, the activity name, and ordered event attribute values.
 
+    :param timestamp_format: How the timestamp of the event is written
+    :param skips_warmup_cases: Whether the events of cases that arrived during the warm-up period are not written
+        (see get_all_warmup_functions_ordered_sml). The delay of the event is returned either way.
     :return: The SML code
     """
+    if timestamp_format == TimestampFormat.MODEL_TIME:
+        timestamp_term = "Real.fmt (StringCvt.FIX (SOME 3)) endtime"
+    else:
+        timestamp_term = "{0}(endtime)".format(get_time2string_converter_name())
+    write_term = '{0}(event_file_id, [event_id, case_id, "{1}", endtime_s]^^{2}(eaval))'.format(
+        get_record_writer_name(), activity_name, get_eaval2list_converter_name(activity_id))
+    if skips_warmup_cases:
+        write_term = "if {0}(case_id) then () else {1}".format(get_warmup_case_checker_name(), write_term)
     return '''
     fun {0}(event_counter: INT, delay: real, eaval: {1}) = 
     let
-        val event_id = "EVENT" ^ Int.toString event_counter
+        val event_id = "{5}" ^ Int.toString event_counter
         val event_file_id = "{2}"
         val case_id = #1 eaval
         val starttime = {3}()
         val norm_delay = {4}(delay) 
         val endtime = starttime + norm_delay
-        val endtime_s = t2s(endtime)
-        val _ = {7}(event_file_id, [event_id, case_id, "{5}", endtime_s]^^{6}(eaval))
+        val endtime_s = {6}
+        val _ = {7}
     in
        ModelTime.fromInt(round(norm_delay))
     end;        
@@ -432,12 +519,298 @@ def get_event_writer_sml(activity_id: str, activity_name: str, eaval_colset_name
                get_event_table_file_path(activity_id, model_name),
                get_now_time_getter_name(),
                get_normalized_delay_from_now_function_name(ProcessTimeCategory.SERVICE),
-               activity_name,
-               get_eaval2list_converter_name(activity_id),
-               get_record_writer_name()
+               SimulationParameters.EVENT_ID_PREFIX,
+               timestamp_term,
+               write_term
                )
 
 
+def get_case_state_merger_sml(case_state_colset_name: str, number_of_attributes: int):
+    """
+    A function that merges two case state tokens of the same case, e.g., at the synchronization of
+    concurrent branches. For each attribute, the later observation is kept, that is, the one with the greater
+    event id. This way, the merged case state holds the last observations of the case, as the
+    last observation places would.
+
+    :param case_state_colset_name: The name of the case state colset
+    :param number_of_attributes: How many attributes the case state carries
+    :return: The SML code
+    """
+    return '''
+    fun {0}(a: {1}, b: {1}) =
+        (#1 a, {2});
+    '''.format(get_case_state_merger_name(),
+               case_state_colset_name,
+               ", ".join([
+                   "if #{1} a >= #{1} b then #{0} a else #{0} b, if #{1} a >= #{1} b then #{1} a else #{1} b".format(
+                       2 * i + 2, 2 * i + 3)
+                   for i in range(number_of_attributes)
+               ]))
+
+
+def get_aggregation_count_adder_sml():
+    return '''
+    fun {0}([], _, _) = []
+      | {0}(c::cs, 0, d: INT) = (c + d)::cs
+      | {0}(c::cs, i, d: INT) = c::{0}(cs, i - 1, d);
+    '''.format(get_aggregation_count_adder_name())
+
+
+def get_aggregation_sum_sml():
+    return '''
+    fun {0}(counts: INT list) = foldl (op +) 0 counts;
+    '''.format(get_aggregation_sum_name())
+
+
+def get_aggregation_argmax_sml():
+    return '''
+    fun {0}(counts: INT list) =
+    let
+        fun argmax_from([], _, best, _) = best
+          | argmax_from(c::cs, i, best, best_c) =
+                if c > best_c then argmax_from(cs, i + 1, i, c) else argmax_from(cs, i + 1, best, best_c)
+    in
+        argmax_from(counts, 0, 0, ~1)
+    end;
+    '''.format(get_aggregation_argmax_name())
+
+
+def get_aggregation_label_index_sml(attribute: CPM_Categorical_Attribute, colset_name: str):
+    """
+    A function that maps each label of a categorical attribute (WITH colset) to its position among the labels.
+
+    :param attribute: The attribute
+    :param colset_name: The name of the attribute domain colset
+    :return: The SML code
+    """
+    labels = attribute.get_labels()
+    fun_body = "fun {0}(x: {1}) =".format(get_aggregation_label_index_name(attribute.get_id()), colset_name)
+    fun_body += "\ncase x of "
+    fun_body += " | ".join(["{0} => {1}".format(label, str(i)) for i, label in enumerate(labels)]) + ";"
+    return fun_body
+
+
+def get_aggregation_index_label_sml(attribute: CPM_Categorical_Attribute, colset_name: str):
+    """
+    The inverse of the label index function.
+
+    :param attribute: The attribute
+    :param colset_name: The name of the attribute domain colset
+    :return: The SML code
+    """
+    labels = attribute.get_labels()
+    fun_body = "fun {0}(i: INT): {1} =".format(get_aggregation_index_label_name(attribute.get_id()), colset_name)
+    fun_body += "\ncase i of "
+    fun_body += " | ".join(
+        ["{0} => {1}".format(str(i), label) for i, label in enumerate(labels[:-1])] + ["_ => " + labels[-1]]) + ";"
+    return fun_body
+
+
+def get_aggregation_eviction_condition_sml(selection: AggregationSelection, now_term: str,
+                                           observation_time_term: str, count_term: str) -> str:
+    """
+    Get the SML condition under which the oldest observation in the buffer of an aggregated dependency is evicted.
+
+    :param selection: The aggregation selection
+    :param now_term: The term describing the current model time
+    :param observation_time_term: The term describing the time of the oldest observation
+    :param count_term: The term describing the number of observations in the buffer
+    :return: The SML condition
+    """
+    if isinstance(selection, LastKSelection):
+        return "{0} > {1}".format(count_term, str(selection.k))
+    if isinstance(selection, TimeWindowSelection):
+        return "{0} - {1} > {2}".format(now_term, observation_time_term, str(selection.get_window_seconds()))
+    raise NotImplementedError("No eviction condition for selection {0}".format(type(selection).__name__))
+
+
+def get_aggregation_expression_sml(function: AggregationFunction, counts_term: str, total_term: str,
+                                   attribute: CPM_Categorical_Attribute) -> str:
+    """
+    Get the SML expression that computes the aggregated label of an aggregated dependency
+    (the counterpart of AggregationFunction.aggregate).
+
+    :param function: The aggregation function
+    :param counts_term: The term describing the list of label counts (ordered as the attribute labels)
+    :param total_term: The term describing the total count
+    :param attribute: The aggregated attribute
+    :return: The SML expression
+    """
+    if isinstance(function, MajorityAggregation):
+        return "if {0} = 0 then {1} else {2}({3}({4}))".format(
+            total_term,
+            function.get_default_label(attribute),
+            get_aggregation_index_label_name(attribute.get_id()),
+            get_aggregation_argmax_name(),
+            counts_term)
+    if isinstance(function, LabelShareAggregation):
+        label_index = attribute.get_labels().index(function.label)
+        return "if {0} > 0 andalso Real.fromInt(List.nth({1}, {2})) >= {3} * Real.fromInt({0}) " \
+               "then {4} else {5}".format(
+                    total_term,
+                    counts_term,
+                    str(label_index),
+                    str(float(function.threshold)),
+                    function.label,
+                    function.label_otherwise)
+    raise NotImplementedError("No SML expression for aggregation function {0}".format(type(function).__name__))
+
+
+def get_aggregation_functions_sml(attr_in: CPM_Categorical_Attribute, attr_out_id: str,
+                                  aggregation_colset_name: str, intlist_colset_name: str,
+                                  eviction_condition: str, aggregation_expression: str):
+    """
+    The functions that maintain the state of an aggregated dependency, that is, a buffer of
+    timestamped observations of the in-attribute together with the label counts over that buffer.
+    The buffer is a queue of two lists: new observations are put in front of the second list (newest first),
+    and observations are evicted from the head of the first list (oldest first) as long as the eviction
+    condition holds. The second list is reversed into the first one only when that is empty,
+    so that each observation is added, reversed and evicted once, and an update takes amortized constant time.
+    This way, the state remains bounded by the aggregation selection.
+
+    :param attr_in: The aggregated attribute
+    :param attr_out_id: The id of the dependent attribute
+    :param aggregation_colset_name: The name of the colset of the aggregation state
+    :param intlist_colset_name: The name of the integer list colset
+    :param eviction_condition: An SML condition over "t" (now), "s" (time of the oldest observation)
+        and "n" (the number of observations in the buffer)
+    :param aggregation_expression: An SML expression over "counts" and "total" that computes the aggregated label
+    :return: The SML code, as a list of (name, code) pairs
+    """
+    attr_in_id = attr_in.get_id()
+    evictor = get_aggregation_evictor_name(attr_in_id, attr_out_id)
+    expirer = get_aggregation_expirer_name(attr_in_id, attr_out_id)
+    updater = get_aggregation_updater_name(attr_in_id, attr_out_id)
+    value_getter = get_aggregation_value_getter_name(attr_in_id, attr_out_id)
+    label_index = get_aggregation_label_index_name(attr_in_id)
+    evictor_sml = '''
+    fun {0}(t: real, [], [], counts: {1}) = ([], [], counts)
+      | {0}(t: real, [], newer, counts: {1}) = {0}(t, rev newer, [], counts)
+      | {0}(t: real, older as ((s, y)::rest), newer, counts: {1}) =
+            let
+                val n = {5}(counts)
+            in
+                if {2}
+                then {0}(t, rest, newer, {3}(counts, {4}(y), ~1))
+                else (older, newer, counts)
+            end;
+    '''.format(evictor, intlist_colset_name, eviction_condition, get_aggregation_count_adder_name(), label_index,
+               get_aggregation_sum_name())
+    expirer_sml = '''
+    fun {0}(state: {1}, t: real): {1} = {2}(t, #1 state, #2 state, #3 state);
+    '''.format(expirer, aggregation_colset_name, evictor)
+    updater_sml = '''
+    fun {0}(state: {1}, x, t: real): {1} =
+        {2}(t, #1 state, (t, x)::(#2 state), {3}(#3 state, {4}(x), 1));
+    '''.format(updater, aggregation_colset_name, evictor, get_aggregation_count_adder_name(), label_index)
+    value_getter_sml = '''
+    fun {0}(state: {1}, t: real) =
+    let
+        val counts = #3 ({2}(state, t))
+        val total = {3}(counts)
+    in
+        {4}
+    end;
+    '''.format(value_getter, aggregation_colset_name, expirer, get_aggregation_sum_name(), aggregation_expression)
+    return [
+        (evictor, evictor_sml),
+        (expirer, expirer_sml),
+        (updater, updater_sml),
+        (value_getter, value_getter_sml)
+    ]
+
+
+def get_all_aggregation_functions_ordered_sml():
+    return [
+        (get_aggregation_count_adder_name(), get_aggregation_count_adder_sml()),
+        (get_aggregation_sum_name(), get_aggregation_sum_sml()),
+        (get_aggregation_argmax_name(), get_aggregation_argmax_sml())
+    ]
+
+
+def get_random_state_sml(seed: int):
+    return "globref {0} = {1}.0;".format(RANDOM_STATE_NAME, str(seed))
+
+
+def get_random_next_sml():
+    """
+    The Park-Miller minimal standard generator. The state is kept as a real, where all
+    intermediate products are exact, since integers in CPN Tools only have 31 bits.
+
+    :return: The SML code of a function that draws a real uniformly from the open interval (0, 1)
+    """
+    return '''
+    fun {0}() = (
+        {1} := Real.rem(16807.0 * (!{1}), {2}.0);
+        (!{1}) / {2}.0);
+    '''.format(RANDOM_NEXT_NAME, RANDOM_STATE_NAME, str(SimulationParameters.RANDOM_MODULUS))
+
+
+def get_seeded_uniform_distribution_sml():
+    return "fun {0}(a: real, b: real) = a + (b - a) * {1}();".format(
+        UNIFORM_DISTRIBUTION_NAME, RANDOM_NEXT_NAME)
+
+
+def get_seeded_exponential_distribution_sml():
+    return "fun {0}(r: real) = ~(Math.ln(1.0 - {1}())) / r;".format(
+        EXPONENTIAL_DISTRIBUTION_NAME, RANDOM_NEXT_NAME)
+
+
+def get_all_seeded_random_functions_ordered_sml(seed: int):
+    """
+    Functions that replace the random distributions of CPN Tools by ones drawn from a seeded generator.
+    They need to be declared before any function that draws random numbers.
+    Note that CPN Tools still chooses randomly among enabled transitions.
+
+    :param seed: The seed
+    :return: The functions as (name, code) pairs
+    """
+    return [
+        (RANDOM_STATE_NAME, get_random_state_sml(seed)),
+        (RANDOM_NEXT_NAME, get_random_next_sml()),
+        (UNIFORM_DISTRIBUTION_NAME, get_seeded_uniform_distribution_sml()),
+        (EXPONENTIAL_DISTRIBUTION_NAME, get_seeded_exponential_distribution_sml()),
+    ]
+
+
+def get_warmup_case_id_name():
+    return WARMUP_CASE_ID_NAME
+
+
+def get_warmup_case_checker_name():
+    return WARMUP_CASE_CHECKER_NAME
+
+
+def get_warmup_case_id_sml(first_case_id: int):
+    last_warmup_case_id = first_case_id - 1
+    return "globref {0} = {1};".format(
+        WARMUP_CASE_ID_NAME, str(last_warmup_case_id) if last_warmup_case_id >= 0 else "~" + str(-last_warmup_case_id))
+
+
+def get_warmup_case_checker_sml():
+    return '''
+    fun {0}(case_id: string) =
+        case Int.fromString(String.extract(case_id, size "{1}", NONE)) of
+            SOME n => n <= !{2}
+          | NONE => false;
+    '''.format(WARMUP_CASE_CHECKER_NAME, SimulationParameters.CASE_ID_PREFIX, WARMUP_CASE_ID_NAME)
+
+
+def get_all_warmup_functions_ordered_sml(first_case_id: int):
+    """
+    Functions that tell the cases that arrive during the warm-up period from the others. Since case ids are
+    given in the order of arrival, it suffices to remember the id of the last case that arrived during the
+    warm-up period, which the case generator updates. They need to be declared before the event writers.
+
+    :param first_case_id: The id of the first case
+    :return: The functions as (name, code) pairs
+    """
+    return [
+        (WARMUP_CASE_ID_NAME, get_warmup_case_id_sml(first_case_id)),
+        (WARMUP_CASE_CHECKER_NAME, get_warmup_case_checker_sml()),
+    ]
+
+
 def get_all_standard_functions_ordered_sml():
     """
     This is the first batch of standard functions.
@@ -0,0 +1,98 @@
+import numpy
+
+from causal_model.valuation import BayesianValuation
+from simulation_model.simulator import SimulatedEvent
+from utils.validators import validate_condition
+
+
+def get_tilted_valuation(valuation: BayesianValuation, label_factors: dict[str, float],
+                         parameter_keys: list[tuple] = None) -> BayesianValuation:
+    """
+    Get a proposal valuation for importance sampling that makes some labels more likely: in the selected rows
+    of the probability mappings, the probability of each label is multiplied by its factor, and the row is
+    normalized again. For example, label_factors={"Mad": 20} samples a rare label "Mad" about 20 times as often.
+
+    :param valuation: The valuation
+    :param label_factors: The factor of some labels (positive). Other labels keep factor 1.
+    :param parameter_keys: The rows to tilt. If this is None, all rows are tilted.
+    :return: The proposal valuation
+    """
+    validate_condition(all(factor > 0 for factor in label_factors.values()), "The factors must be positive.")
+    labels = valuation.outcome_attribute.get_labels()
+    validate_condition(all(label in labels for label in label_factors),
+                       "Unknown labels {0}.".format([label for label in label_factors if label not in labels]))
+    probability_mappings = dict()
+    for key, dist in valuation.get_probability_mappings().items():
+        if parameter_keys is None or key in parameter_keys:
+            tilted = {label: dist.get(label, 0.0) * label_factors.get(label, 1.0) for label in labels}
+            total = sum(tilted.values())
+            dist = {label: p / total for label, p in tilted.items()}
+        probability_mappings[key] = dist
+    return BayesianValuation(valuation.valuation_parameters, valuation.outcome_attribute,
+                             probability_mappings=probability_mappings)
+
+
+def get_case_weights(events: list[SimulatedEvent]) -> dict[int, float]:
+    """
+    Get the likelihood ratio of each case, i.e., the weight of its last event.
+
+    :param events: The events of the cases
+    :return: The weight of each case id
+    """
+    last_events: dict[int, SimulatedEvent] = dict()
+    for event in events:
+        if event.case_id not in last_events or event.event_id > last_events[event.case_id].event_id:
+            last_events[event.case_id] = event
+    return {case_id: event.weight for case_id, event in last_events.items()}
+
+
+def estimate_weighted_mean(values, weights, self_normalized: bool = False) -> tuple[float, float]:
+    """
+    Estimate the mean of a quantity under the valuations of the model from importance sampled cases.
+
+    :param values: The quantity in each case
+    :param weights: The likelihood ratio of each case
+    :param self_normalized: Whether to divide by the sum of the weights instead of the number of cases, which
+        is biased, but often has a smaller variance
+    :return: The estimate and its standard error
+    """
+    values = numpy.asarray(values, dtype=float)
+    weights = numpy.asarray(weights, dtype=float)
+    n = len(values)
+    validate_condition(n > 1, "At least two cases are needed.")
+    weighted_values = weights * values
+    if not self_normalized:
+        return float(numpy.mean(weighted_values)), float(numpy.std(weighted_values, ddof=1) / numpy.sqrt(n))
+    estimate = float(numpy.sum(weighted_values) / numpy.sum(weights))
+    # delta method
+    residuals = weights * (values - estimate)
+    standard_error = float(numpy.sqrt(numpy.sum(residuals ** 2)) / numpy.sum(weights))
+    return estimate, standard_error
+
+
+def estimate_label_probability(events: list[SimulatedEvent], attribute_id: str, label: str,
+                               self_normalized: bool = False) -> tuple[float, float]:
+    """
+    Estimate the probability that a case observes an attribute with some label (at its last observation),
+    from the events of importance sampled cases. Each case that observes the label counts with the weight of
+    that event, which is the likelihood ratio of everything the case sampled up to it; later draws of the case
+    do not influence the outcome, so that they would only add variance.
+
+    :param events: The events of the cases
+    :param attribute_id: The attribute
+    :param label: The label
+    :param self_normalized: See estimate_weighted_mean
+    :return: The estimate and its standard error
+    """
+    case_weights = get_case_weights(events)
+    last_observations: dict[int, SimulatedEvent] = dict()
+    for event in events:
+        if attribute_id in event.attribute_values and (
+                event.case_id not in last_observations or event.event_id > last_observations[event.case_id].event_id):
+            last_observations[event.case_id] = event
+    case_ids = list(case_weights)
+    hits = [1.0 if case_id in last_observations and last_observations[case_id].attribute_values[attribute_id] == label
+            else 0.0 for case_id in case_ids]
+    weights = [last_observations[case_id].weight if hit else case_weights[case_id]
+               for case_id, hit in zip(case_ids, hits)]
+    return estimate_weighted_mean(hits, weights, self_normalized)
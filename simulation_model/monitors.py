@@ -0,0 +1,87 @@
+import re
+
+from simulation_model.cpn_utils.cpn_transition import CPN_Transition
+
+# the monitor type of data collectors in CPN Tools
+DATA_COLLECTOR_TYPE = "3"
+DATA_COLLECTOR_TYPE_DESCRIPTION = "Data collection"
+
+
+def get_sml_identifier(name: str) -> str:
+    """
+    Get the name by which CPN Tools refers to a page or transition in SML code,
+    where characters that may not occur in identifiers (e.g., spaces) are replaced by underscores.
+
+    :param name: The name of the page or transition
+    :return: The identifier
+    """
+    return re.sub(r"[^A-Za-z0-9_']", "_", name)
+
+
+class MonitorObservation:
+
+    def __init__(self, transition: CPN_Transition, variables: list[str], observation: str):
+        """
+        What a data collector observes when a transition occurs.
+
+        :param transition: The transition
+        :param variables: The variables of the transition that the observation uses
+        :param observation: The observed value, an SML expression of type int
+        """
+        self.transition = transition
+        self.variables = variables
+        self.observation = observation
+
+
+class DataCollectorMonitor:
+
+    def __init__(self, name: str, observations: list[MonitorObservation]):
+        """
+        A data collector monitor of CPN Tools, which observes a value at each occurrence of some transitions,
+        and reports summary statistics of the values (count, sum, average, minimum, maximum, etc.)
+        in the performance report of a simulation.
+
+        :param name: The name of the monitor
+        :param observations: What the monitor observes at each of its transitions
+        """
+        self.name = get_sml_identifier(name)
+        self.observations = observations
+
+    def get_transitions(self) -> list[CPN_Transition]:
+        return [observation.transition for observation in self.observations]
+
+    def __get_binding_pattern(self, observation: MonitorObservation, page_names: dict[str, str],
+                              variables: list[str]) -> str:
+        transition = observation.transition
+        record = "{" + ", ".join(variables + ["..."]) + "}" if variables else "_"
+        return "{0}'{1} (1, {2})".format(get_sml_identifier(page_names[transition.get_id()]),
+                                         get_sml_identifier(transition.name), record)
+
+    def get_predicate_sml(self, page_names: dict[str, str]) -> str:
+        """
+        :param page_names: The name of the page of each transition, by transition id
+        :return: The predicate function, which holds at the occurrences of the transitions of the monitor
+        """
+        cases = ["predBindElem ({0}) = true".format(self.__get_binding_pattern(observation, page_names, []))
+                 for observation in self.observations] + ["predBindElem _ = false"]
+        return "fun pred (bindelem) =\nlet\n  fun " + "\n    | ".join(cases) + \
+            "\nin\n  predBindElem bindelem\nend"
+
+    def get_observer_sml(self, page_names: dict[str, str]) -> str:
+        """
+        :param page_names: The name of the page of each transition, by transition id
+        :return: The observation function
+        """
+        cases = ["obsBindElem ({0}) = {1}".format(
+            self.__get_binding_pattern(observation, page_names, observation.variables), observation.observation)
+                    for observation in self.observations] + ["obsBindElem _ = ~1"]
+        return "fun obs (bindelem) =\nlet\n  fun " + "\n    | ".join(cases) + \
+            "\nin\n  obsBindElem bindelem\nend"
+
+    @staticmethod
+    def get_init_sml() -> str:
+        return "fun init () = NONE"
+
+    @staticmethod
+    def get_stop_sml() -> str:
+        return "fun stop () = NONE"
@@ -0,0 +1,156 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator, SimulatedEvent, SimulatedCase, write_event_tables
+
+
+class ReplicationResult:
+
+    def __init__(self, replication_index: int, events: list[SimulatedEvent], statistics: dict[str, float]):
+        """
+        The outcome of one replication of a simulation.
+
+        :param replication_index: The index of the replication (and of its random stream)
+        :param events: The event table of the replication
+        :param statistics: Summary statistics of the replication, by name
+        """
+        self.replication_index = replication_index
+        self.events = events
+        self.statistics = statistics
+
+
+class ReplicationsResult:
+
+    def __init__(self, model: SimulationModel, replications: list[ReplicationResult]):
+        """
+        The outcome of independent replications of a simulation.
+
+        :param model: The simulation model
+        :param replications: The results of the replications, ordered by replication index
+        """
+        self.__model = model
+        self.replications = replications
+        self.summary = summarize_replications(replications)
+
+    def write_event_tables(self, output_path: str, model_name: str):
+        """
+        Write the event tables of each replication, in the format of the event tables of the CPN.
+        The model name of replication i is suffixed by "_rep<i>".
+
+        :param output_path: The directory to write the tables to
+        :param model_name: The name of the model
+        """
+        for replication in self.replications:
+            write_event_tables(replication.events,
+                               self.__model.get_petri_net(),
+                               self.__model.get_causal_model(),
+                               output_path,
+                               "{0}_rep{1}".format(model_name, replication.replication_index))
+
+
+def get_replication_statistics(simulator: Simulator, events: list[SimulatedEvent]) -> dict[str, float]:
+    """
+    Compute the summary statistics of one replication.
+
+    :param simulator: The simulator after the replication
+    :param events: The events of the replication
+    :return: The statistics, by name
+    """
+    return get_statistics(simulator.get_completed_cases(), events)
+
+
+def get_statistics(completed_cases: list[SimulatedCase], events: list[SimulatedEvent]) -> dict[str, float]:
+    """
+    Compute summary statistics of simulated cases and their events.
+
+    :param completed_cases: The completed cases
+    :param events: The events
+    :return: The statistics, by name
+    """
+    cycle_times = [case.get_cycle_time() for case in completed_cases]
+    statistics = {
+        "number_of_events": float(len(events)),
+        "number_of_completed_cases": float(len(completed_cases)),
+        "mean_cycle_time": float(numpy.mean(cycle_times)) if cycle_times else float("nan"),
+        "makespan": max((event.timestamp for event in events), default=0.0),
+    }
+    for event in events:
+        key = "number_of_events_{0}".format(event.activity_id)
+        statistics[key] = statistics.get(key, 0.0) + 1.0
+    return statistics
+
+
+def summarize_replications(replications: list[ReplicationResult]) -> dict[str, dict[str, float]]:
+    """
+    Merge the statistics of independent replications into their mean, standard deviation,
+    and the standard error of the mean.
+
+    :param replications: The replications
+    :return: For each statistic, its mean ("mean"), standard deviation ("std") and standard error ("sem")
+    """
+    statistic_names = []
+    for replication in replications:
+        for name in replication.statistics:
+            if name not in statistic_names:
+                statistic_names.append(name)
+    summary = dict()
+    for name in statistic_names:
+        # a statistic that a replication does not report (e.g., an activity that did not occur) counts as zero
+        values = numpy.array([replication.statistics.get(name, 0.0) for replication in replications])
+        n = len(values)
+        std = float(numpy.std(values, ddof=1)) if n > 1 else float("nan")
+        summary[name] = {
+            "mean": float(numpy.mean(values)),
+            "std": std,
+            "sem": float(std / numpy.sqrt(n)) if n > 1 else float("nan"),
+        }
+    return summary
+
+
+def run_replication(model: SimulationModel, replication_index: int,
+                    seed_sequence: numpy.random.SeedSequence, warmup_time: float = 0.0) -> ReplicationResult:
+    """
+    Run one replication of a simulation.
+
+    :param model: The simulation model
+    :param replication_index: The index of the replication
+    :param seed_sequence: The seed sequence of the random stream of the replication
+    :param warmup_time: The end of the warm-up period (see warmup.detect_warmup). Cases that arrive
+        before it generate no events.
+    :return: The result
+    """
+    simulator = Simulator(model.get_petri_net(),
+                          model.get_causal_model(),
+                          model.get_simulation_parameters(),
+                          numpy.random.default_rng(seed_sequence),
+                          warmup_time=warmup_time)
+    events = simulator.run()
+    return ReplicationResult(replication_index, events, get_replication_statistics(simulator, events))
+
+
+def run_replications(model: SimulationModel, n: int, workers: int = None, seed=None,
+                     warmup_time: float = 0.0) -> ReplicationsResult:
+    """
+    Run independent replications of a simulation in Python, possibly in parallel worker processes.
+    Each replication draws from its own random stream, spawned from one seed sequence, so that
+    the results only depend on the seed, and not on the number of workers or the scheduling of replications.
+
+    :param model: The simulation model
+    :param n: The number of replications
+    :param workers: The number of worker processes. If this is None or 1, replications run sequentially.
+    :param seed: The root seed (an int, or None for fresh entropy)
+    :param warmup_time: The end of the warm-up period of each replication (see warmup.detect_warmup).
+        Cases that arrive before it generate no events, so that they are neither written nor summarized.
+    :return: The results of all replications and their summary
+    """
+    seed_sequences = numpy.random.SeedSequence(seed).spawn(n)
+    replication_indices = list(range(n))
+    if workers is None or workers <= 1 or n <= 1:
+        replications = [run_replication(model, i, seed_sequences[i], warmup_time) for i in replication_indices]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            replications = list(executor.map(run_replication,
+                                             [model] * n, replication_indices, seed_sequences, [warmup_time] * n))
+    return ReplicationsResult(model, replications)
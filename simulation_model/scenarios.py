@@ -0,0 +1,114 @@
+import numpy
+
+from simulation_model.replications import get_statistics
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator, SimulatedEvent, SimulatedCase, iter_arrival_times, \
+    write_event_tables
+from utils.validators import validate_condition
+
+
+class ScenarioResult:
+
+    def __init__(self, interventions: dict[str, str], events: list[SimulatedEvent],
+                 completed_cases: list[SimulatedCase]):
+        """
+        The outcome of simulating a model under an intervention.
+
+        :param interventions: The label that each intervened attribute is set to, by attribute id
+        :param events: The events, case by case
+        :param completed_cases: The completed cases
+        """
+        self.interventions = interventions
+        self.events = events
+        self.completed_cases = completed_cases
+        self.statistics = get_statistics(completed_cases, events)
+
+
+class ScenariosResult:
+
+    def __init__(self, model: SimulationModel, scenarios: list[ScenarioResult], number_of_shared_events: int):
+        """
+        The outcome of simulating a model under several interventions.
+
+        :param model: The simulation model
+        :param scenarios: The results of the scenarios, in the order of their interventions
+        :param number_of_shared_events: How many events were simulated once for all scenarios
+        """
+        self.__model = model
+        self.scenarios = scenarios
+        self.number_of_shared_events = number_of_shared_events
+
+    def write_event_tables(self, output_path: str, model_name: str):
+        """
+        Write the event tables of each scenario, in the format of the event tables of the CPN.
+        The model name of scenario i is suffixed by "_scenario<i>".
+
+        :param output_path: The directory to write the tables to
+        :param model_name: The name of the model
+        """
+        for i, scenario in enumerate(self.scenarios):
+            write_event_tables(scenario.events,
+                               self.__model.get_petri_net(),
+                               self.__model.get_causal_model(),
+                               output_path,
+                               "{0}_scenario{1}".format(model_name, i))
+
+
+def run_intervention_scenarios(model: SimulationModel, interventions: list[dict[str, str]],
+                               seed=None) -> ScenariosResult:
+    """
+    Simulate a model under several do-interventions on its attributes (e.g., [{"doctor": "Dr_Knopp"},
+    {"doctor": "Dr_Yuan"}]), with the same cases and random numbers in each scenario.
+
+    Each case is simulated once up to the first activity that observes an intervened attribute. Everything
+    before that point is the same in all scenarios, so that the state of the case there (its marking,
+    observations, and random generator) is copied into each scenario, and only the rest of the case is
+    simulated per scenario. Cases that complete without reaching such an activity are shared entirely.
+
+    Cases are simulated one at a time, which requires that they do not influence each other, i.e.,
+    that the model has no aggregated dependencies. The events of a scenario are ordered case by case.
+
+    :param model: The simulation model
+    :param interventions: For each scenario, the label that each intervened attribute is set to, by attribute id
+    :param seed: The root seed (an int, or None for fresh entropy)
+    :return: The results of the scenarios
+    """
+    causal_model = model.get_causal_model()
+    validate_condition(not causal_model.get_aggregated_relations(),
+                       "Intervention scenarios cannot be forked for a model with aggregated dependencies, "
+                       "since its cases are not independent.")
+    validate_condition(len(interventions) > 0, "There must be at least one scenario.")
+    simulation_parameters = model.get_simulation_parameters()
+    arrival_seed_sequence, cases_seed_sequence = numpy.random.SeedSequence(seed).spawn(2)
+    arrival_times = list(iter_arrival_times(simulation_parameters, numpy.random.default_rng(arrival_seed_sequence)))
+    case_seed_sequences = cases_seed_sequence.spawn(len(arrival_times))
+    # the simulator of the shared parts; its own random generator is not used
+    prefix_simulator = Simulator(model.get_petri_net(), causal_model, simulation_parameters,
+                                 numpy.random.default_rng(cases_seed_sequence))
+    scenario_simulators = [Simulator(model.get_petri_net(), causal_model, simulation_parameters,
+                                     numpy.random.default_rng(cases_seed_sequence), interventions=scenario)
+                           for scenario in interventions]
+    fork_attribute_ids = set(attr_id for scenario in interventions for attr_id in scenario)
+    events = [[] for _ in interventions]
+    completed_cases = [[] for _ in interventions]
+    number_of_shared_events = 0
+    next_event_id = simulation_parameters.first_event_id
+    for i, arrival_time in enumerate(arrival_times):
+        case_id = simulation_parameters.first_case_id + i
+        prefix_events, snapshot = prefix_simulator.simulate_case(
+            case_id, arrival_time, numpy.random.default_rng(case_seed_sequences[i]), next_event_id,
+            fork_attribute_ids)
+        number_of_shared_events += len(prefix_events)
+        next_event_id = snapshot.next_event_id
+        for scenario_index, simulator in enumerate(scenario_simulators):
+            events[scenario_index] += prefix_events
+            case_snapshot = snapshot
+            if snapshot.transition_id is not None:
+                suffix_events, case_snapshot = simulator.resume_case(snapshot)
+                events[scenario_index] += suffix_events
+                next_event_id = max(next_event_id, case_snapshot.next_event_id)
+            if case_snapshot.is_completed:
+                completed_cases[scenario_index].append(case_snapshot.case)
+    return ScenariosResult(model, [ScenarioResult(scenario, events[scenario_index], completed_cases[scenario_index])
+                                   for scenario_index, scenario in enumerate(interventions)],
+                           number_of_shared_events)
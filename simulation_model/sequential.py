@@ -0,0 +1,261 @@
+import math
+
+import numpy
+
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator, SimulatedCase, SimulatedEvent, iter_arrival_times
+from utils.math import student_t_quantile
+from utils.validators import validate_condition
+
+CASES_MODE = "cases"
+REPLICATIONS_MODE = "replications"
+
+
+class CycleTimeKPI:
+
+    def __init__(self):
+        """
+        The cycle time of a case, in seconds of model time.
+        """
+        self.name = "cycle_time"
+
+    def get_value(self, case: SimulatedCase, events: list[SimulatedEvent]):
+        return case.get_cycle_time()
+
+
+class LabelFrequencyKPI:
+
+    def __init__(self, attribute_id: str, label: str):
+        """
+        Whether a case observes an attribute with some label (1 or 0, at its last observation),
+        so that the mean over the cases is the frequency of the label.
+
+        :param attribute_id: The attribute
+        :param label: The label
+        """
+        self.attribute_id = attribute_id
+        self.label = label
+        self.name = "frequency_{0}_{1}".format(attribute_id, label)
+
+    def get_value(self, case: SimulatedCase, events: list[SimulatedEvent]):
+        return 1.0 if case.observations.get(self.attribute_id) == self.label else 0.0
+
+
+class ActivityWaitingTimeKPI:
+
+    def __init__(self, activity_name: str):
+        """
+        The time a case waits before an activity starts, in seconds of model time: from the latest completion
+        of an earlier activity of the case (or its arrival) to the start of the activity. If the case executes
+        the activity several times, its waiting times are averaged. Cases without the activity have no value.
+
+        :param activity_name: The activity
+        """
+        self.activity_name = activity_name
+        self.name = "waiting_time_{0}".format(activity_name)
+
+    def get_value(self, case: SimulatedCase, events: list[SimulatedEvent]):
+        waiting_times = []
+        for event in events:
+            if event.activity_name == self.activity_name:
+                ready_time = max((other.timestamp for other in events if other.timestamp <= event.start_time),
+                                 default=case.arrival_time)
+                waiting_times.append(event.start_time - ready_time)
+        return float(numpy.mean(waiting_times)) if waiting_times else None
+
+
+class BatchMeansEstimator:
+
+    def __validate(self):
+        validate_condition(self.__batch_size >= 1, "The batch size must be positive.")
+        validate_condition(self.__max_batches >= 4 and self.__max_batches % 2 == 0,
+                           "The maximal number of batches must be even and at least 4.")
+
+    def __init__(self, batch_size: int = 1, max_batches: int = 40):
+        """
+        An online estimator of the mean of a (possibly autocorrelated) sequence of observations, with a confidence
+        interval by the method of batch means: consecutive observations are averaged in batches, whose means are
+        roughly independent if the batches are long enough. Whenever max_batches batches are complete, adjacent
+        batches are merged pairwise and the batch size doubles, so that the batches grow with the run while
+        memory stays constant.
+
+        :param batch_size: The initial number of observations per batch (1 for independent observations)
+        :param max_batches: The number of batches at which they are merged (even)
+        """
+        self.__batch_size = batch_size
+        self.__max_batches = max_batches
+        self.__validate()
+        self.__batch_means: list[float] = []
+        self.__batch_sum = 0.0
+        self.__batch_count = 0
+        self.__sum = 0.0
+        self.__count = 0
+
+    def add(self, value: float):
+        self.__sum += value
+        self.__count += 1
+        self.__batch_sum += value
+        self.__batch_count += 1
+        if self.__batch_count == self.__batch_size:
+            self.__batch_means.append(self.__batch_sum / self.__batch_size)
+            self.__batch_sum = 0.0
+            self.__batch_count = 0
+            if len(self.__batch_means) == self.__max_batches:
+                self.__batch_means = [(self.__batch_means[i] + self.__batch_means[i + 1]) / 2
+                                      for i in range(0, self.__max_batches, 2)]
+                self.__batch_size *= 2
+
+    def get_count(self) -> int:
+        return self.__count
+
+    def get_batch_size(self) -> int:
+        return self.__batch_size
+
+    def get_number_of_batches(self) -> int:
+        return len(self.__batch_means)
+
+    def get_mean(self) -> float:
+        return self.__sum / self.__count if self.__count else float("nan")
+
+    def get_half_width(self, confidence: float = 0.95) -> float:
+        """
+        :param confidence: The confidence level of the interval
+        :return: The half-width of the confidence interval of the mean (infinite with fewer than two batches)
+        """
+        k = len(self.__batch_means)
+        if k < 2:
+            return float("inf")
+        std = float(numpy.std(self.__batch_means, ddof=1))
+        return student_t_quantile(1 - (1 - confidence) / 2, k - 1) * std / math.sqrt(k)
+
+
+class SequentialResult:
+
+    def __init__(self, estimates: dict[str, float], half_widths: dict[str, float], number_of_cases: int,
+                 number_of_replications: int, converged: bool):
+        """
+        The outcome of a sequential simulation.
+
+        :param estimates: The estimated mean of each KPI, by name
+        :param half_widths: The half-width of the confidence interval of each KPI, by name
+        :param number_of_cases: The number of completed cases that were observed
+        :param number_of_replications: The number of replications (1 in cases mode)
+        :param converged: Whether all intervals met their targets before the budget was used up
+        """
+        self.estimates = estimates
+        self.half_widths = half_widths
+        self.number_of_cases = number_of_cases
+        self.number_of_replications = number_of_replications
+        self.converged = converged
+
+
+def is_precise(estimator: BatchMeansEstimator, target_half_width: float, confidence: float, min_batches: int,
+               relative: bool) -> bool:
+    """
+    Check whether the confidence interval of an estimator is narrow enough.
+
+    :param estimator: The estimator
+    :param target_half_width: The largest acceptable half-width
+    :param confidence: The confidence level of the interval
+    :param min_batches: The number of batches needed before the interval is trusted
+    :param relative: Whether the target is relative to the magnitude of the mean
+    :return: Whether the interval is narrow enough
+    """
+    if estimator.get_number_of_batches() < min_batches:
+        return False
+    target = target_half_width * abs(estimator.get_mean()) if relative else target_half_width
+    return estimator.get_half_width(confidence) <= target
+
+
+def run_until_precise(model: SimulationModel, kpis: list, target_half_widths: dict[str, float],
+                      confidence: float = 0.95, seed=None, mode: str = CASES_MODE, batch_size: int = 10,
+                      min_batches: int = 10, max_cases: int = 1000000, max_replications: int = 1000,
+                      relative: bool = False, warmup_time: float = 0.0) -> SequentialResult:
+    """
+    Simulate a model in Python until the confidence interval of each KPI is narrower than its target,
+    instead of for a fixed number of cases.
+
+    In cases mode, one long run is observed case by case (in the order of completion). Consecutive cases of a run
+    are correlated (e.g., through aggregated dependencies and shared arrival patterns), so that the intervals are
+    computed by batch means (see BatchMeansEstimator). In replications mode, independent replications with the
+    simulation parameters of the model are run one after another, and each replication contributes the mean of each
+    KPI over its cases as one independent observation.
+
+    :param model: The simulation model
+    :param kpis: The KPIs, e.g., [CycleTimeKPI(), LabelFrequencyKPI("patient_satisfaction", "Mad")]. A KPI has a
+        name and a method get_value(case, events) that returns a number or None (no value for the case).
+    :param target_half_widths: The largest acceptable half-width of each KPI, by name
+    :param confidence: The confidence level of the intervals
+    :param seed: The root seed (an int, or None for fresh entropy)
+    :param mode: CASES_MODE or REPLICATIONS_MODE
+    :param batch_size: The initial number of cases per batch in cases mode
+    :param min_batches: The number of batches (or replications) needed before an interval is trusted (at least 4)
+    :param max_cases: The most cases to simulate in cases mode
+    :param max_replications: The most replications to run in replications mode
+    :param relative: Whether the targets are relative to the magnitude of the means (e.g., 0.01 for 1%)
+    :param warmup_time: The end of the warm-up period of each run (see warmup.detect_warmup). Cases that arrive
+        before it are not observed.
+    :return: The estimates and their half-widths
+    """
+    kpi_names = [kpi.name for kpi in kpis]
+    validate_condition(len(set(kpi_names)) == len(kpi_names), "The names of the KPIs must be unique.")
+    validate_condition(set(target_half_widths) == set(kpi_names), "Each KPI needs a target half-width.")
+    validate_condition(all(target > 0 for target in target_half_widths.values()), "The targets must be positive.")
+    validate_condition(0 < confidence < 1, "The confidence level must be in (0, 1).")
+    validate_condition(mode in [CASES_MODE, REPLICATIONS_MODE], 'Unknown mode "{0}".'.format(mode))
+    validate_condition(min_batches >= 4, "At least 4 batches are needed.")
+    if mode == CASES_MODE:
+        estimators = {kpi.name: BatchMeansEstimator(batch_size, max(40, 2 * min_batches)) for kpi in kpis}
+    else:
+        # replications are independent, and there are no more of them than the budget
+        estimators = {kpi.name: BatchMeansEstimator(1, max(4, 2 * max_replications)) for kpi in kpis}
+
+    def is_converged():
+        return all(is_precise(estimators[name], target_half_widths[name], confidence, min_batches, relative)
+                   for name in kpi_names)
+
+    simulation_parameters = model.get_simulation_parameters()
+    number_of_cases = 0
+    number_of_replications = 0
+    converged = False
+    if mode == CASES_MODE:
+        rng = numpy.random.default_rng(seed)
+        simulator = Simulator(model.get_petri_net(), model.get_causal_model(), simulation_parameters, rng,
+                              arrival_times=iter_arrival_times(simulation_parameters, rng, max_cases),
+                              first_case_id=simulation_parameters.first_case_id,
+                              first_event_id=simulation_parameters.first_event_id,
+                              keep_completed_cases=False, warmup_time=warmup_time)
+        number_of_replications = 1
+        for case, events in simulator.iter_completed_cases():
+            number_of_cases += 1
+            for kpi in kpis:
+                value = kpi.get_value(case, events)
+                if value is not None:
+                    estimators[kpi.name].add(value)
+            if number_of_cases % batch_size == 0 and is_converged():
+                converged = True
+                break
+    else:
+        for seed_sequence in numpy.random.SeedSequence(seed).spawn(max_replications):
+            simulator = Simulator(model.get_petri_net(), model.get_causal_model(), simulation_parameters,
+                                  numpy.random.default_rng(seed_sequence),
+                                  first_case_id=simulation_parameters.first_case_id,
+                                  first_event_id=simulation_parameters.first_event_id,
+                                  keep_completed_cases=False, warmup_time=warmup_time)
+            values = {kpi.name: [] for kpi in kpis}
+            for case, events in simulator.iter_completed_cases():
+                number_of_cases += 1
+                for kpi in kpis:
+                    value = kpi.get_value(case, events)
+                    if value is not None:
+                        values[kpi.name].append(value)
+            number_of_replications += 1
+            for name, replication_values in values.items():
+                if replication_values:
+                    estimators[name].add(float(numpy.mean(replication_values)))
+            if is_converged():
+                converged = True
+                break
+    return SequentialResult({name: estimators[name].get_mean() for name in kpi_names},
+                            {name: estimators[name].get_half_width(confidence) for name in kpi_names},
+                            number_of_cases, number_of_replications, converged)
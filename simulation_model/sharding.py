@@ -0,0 +1,135 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator, iter_arrival_times, VALUE_SEPARATOR, EVENT_TABLE_COLUMNS
+from utils.validators import validate_condition
+
+# the column by which shard logs are merged; timestamps are zero-padded, so they sort chronologically as strings
+TIMESTAMP_COLUMN_INDEX = EVENT_TABLE_COLUMNS.index("timestamp")
+
+
+def get_shard_log_path(output_file: str, shard_index: int):
+    return "{0}.shard{1}".format(output_file, shard_index)
+
+
+def simulate_shard(model: SimulationModel,
+                   arrival_times: numpy.ndarray,
+                   first_case_id: int,
+                   first_event_id: int,
+                   event_id_block_size: int,
+                   seed_sequence: numpy.random.SeedSequence,
+                   shard_log_path: str,
+                   warmup_time: float = 0.0) -> int:
+    """
+    Simulate a range of cases with given arrival times, and write their events, sorted by timestamp, to a shard log.
+
+    :param model: The simulation model
+    :param arrival_times: The arrival times of the cases of the shard
+    :param first_case_id: The id of the first case of the shard
+    :param first_event_id: The id of the first event of the shard
+    :param event_id_block_size: How many event ids are reserved for the shard
+    :param seed_sequence: The seed sequence of the random stream of the shard
+    :param shard_log_path: Where to write the shard log
+    :param warmup_time: The end of the warm-up period. Cases that arrive before it generate no events.
+    :return: The number of events of the shard
+    """
+    simulator = Simulator(model.get_petri_net(),
+                          model.get_causal_model(),
+                          model.get_simulation_parameters(),
+                          numpy.random.default_rng(seed_sequence),
+                          arrival_times=arrival_times,
+                          first_case_id=first_case_id,
+                          first_event_id=first_event_id,
+                          warmup_time=warmup_time)
+    events = simulator.run()
+    validate_condition(len(events) <= event_id_block_size,
+                       "Shard with first case {0} has {1} events, more than the {2} event ids reserved for it.".format(
+                           first_case_id, len(events), event_id_block_size))
+    events.sort(key=lambda event: event.timestamp)
+    attribute_ids = [attr.get_id() for attr in model.get_causal_model().get_attributes()]
+    with open(shard_log_path, "w") as file:
+        for event in events:
+            file.write(VALUE_SEPARATOR.join(event.to_log_record(attribute_ids)) + "\n")
+    return len(events)
+
+
+def merge_shard_logs(shard_log_paths: list[str], output_file: str, header: list[str]):
+    """
+    Merge shard logs that are sorted by timestamp into one log sorted by timestamp, streaming
+    over the shard logs. Events with equal timestamps are taken from the shards in the order of the shards.
+
+    :param shard_log_paths: The shard logs
+    :param output_file: The merged log
+    :param header: The column names of the logs
+    """
+    shard_logs = [open(path, "r") for path in shard_log_paths]
+    try:
+        with open(output_file, "w") as file:
+            file.write(VALUE_SEPARATOR.join(header) + "\n")
+            for line in heapq.merge(*shard_logs,
+                                    key=lambda l: l.split(VALUE_SEPARATOR, TIMESTAMP_COLUMN_INDEX + 1)[
+                                        TIMESTAMP_COLUMN_INDEX]):
+                file.write(line)
+    finally:
+        for shard_log in shard_logs:
+            shard_log.close()
+
+
+def run_sharded(model: SimulationModel, output_file: str, shards: int, workers: int = None, seed=None,
+                event_id_block_size: int = 10 ** 9, warmup_time: float = 0.0) -> int:
+    """
+    Simulate one large run by splitting its cases into shards of consecutive case ids, which are simulated
+    independently in parallel worker processes and then merged into one event log sorted by timestamp.
+    The arrival schedule is sampled up front, so that the arrival process is the same as in an unsharded run.
+    Case ids start at the first case id of the simulation parameters,
+    and shard i gets the event ids from first_event_id + i * event_id_block_size on.
+    Cases must not interact, so that models with aggregated dependencies cannot be sharded.
+
+    :param model: The simulation model
+    :param output_file: The .csv file to write the merged event log to
+    :param shards: The number of shards
+    :param workers: The number of worker processes. If this is None, there is one per shard.
+    :param seed: The root seed (an int, or None for fresh entropy)
+    :param event_id_block_size: How many event ids are reserved for each shard
+    :param warmup_time: The end of the warm-up period of the run (see warmup.detect_warmup).
+        Cases that arrive before it are simulated in their shard, but their events are not written.
+    :return: The number of events
+    """
+    causal_model = model.get_causal_model()
+    validate_condition(not causal_model.get_aggregated_relations(),
+                       "Cases interact through aggregated dependencies, so that they cannot be simulated in shards.")
+    validate_condition(isinstance(shards, int) and shards > 0, "The number of shards must be a positive integer.")
+    simulation_parameters = model.get_simulation_parameters()
+    arrival_seed_sequence, *shard_seed_sequences = numpy.random.SeedSequence(seed).spawn(shards + 1)
+    arrival_times = numpy.fromiter(
+        iter_arrival_times(simulation_parameters, numpy.random.default_rng(arrival_seed_sequence)),
+        dtype=numpy.float64)
+    case_ranges = numpy.array_split(numpy.arange(len(arrival_times)), shards)
+    shard_log_paths = [get_shard_log_path(output_file, i) for i in range(shards)]
+    shard_arguments = [
+        (model,
+         arrival_times[case_range],
+         simulation_parameters.first_case_id + (int(case_range[0]) if len(case_range) else 0),
+         simulation_parameters.first_event_id + i * event_id_block_size,
+         event_id_block_size,
+         shard_seed_sequences[i],
+         shard_log_paths[i],
+         warmup_time)
+        for i, case_range in enumerate(case_ranges)
+    ]
+    if workers is None:
+        workers = shards
+    if workers <= 1 or shards == 1:
+        numbers_of_events = [simulate_shard(*arguments) for arguments in shard_arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            numbers_of_events = list(executor.map(simulate_shard, *zip(*shard_arguments)))
+    header = EVENT_TABLE_COLUMNS + [attr.get_name() for attr in causal_model.get_attributes()]
+    merge_shard_logs(shard_log_paths, output_file, header)
+    for path in shard_log_paths:
+        os.remove(path)
+    return sum(numbers_of_events)
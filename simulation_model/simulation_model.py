@@ -2,8 +2,11 @@ import os
 
 from causal_model.causal_process_model import CausalProcessModel
 from process_model.petri_net import SimplePetriNet
+from simulation_model.control_flow import CaseStateEncoding, EventOutput
 from simulation_model.cpm_cpn_converter import CPM_CPN_Converter
+from simulation_model.functions import get_event_table_file_path, TimestampFormat
 from simulation_model.simulation_parameters import SimulationParameters
+from simulation_model.simulator import merge_event_tables, get_activity_id, Simulator, SimulatedEvent
 from utils.validators import validate_condition
 
 
@@ -35,6 +38,15 @@ class SimulationModel:
         self.__simulationParameters = simulation_parameters
         self.__validate()
 
+    def get_petri_net(self):
+        return self.__petriNet
+
+    def get_causal_model(self):
+        return self.__causalModel
+
+    def get_simulation_parameters(self):
+        return self.__simulationParameters
+
     def to_string(self):
         s = ""
         s += "petri net: \n"
@@ -50,7 +62,29 @@ class SimulationModel:
         ])))
         return s
 
-    def to_CPN(self, output_path, model_name):
+    def to_CPN(self, output_path, model_name,
+               case_state_encoding: CaseStateEncoding = CaseStateEncoding.LAST_OBSERVATION_PLACES,
+               use_subpages: bool = False,
+               event_output: EventOutput = EventOutput.EVENT_TABLES,
+               timestamp_format: TimestampFormat = TimestampFormat.DATETIME,
+               warmup_time: float = 0.0):
+        """
+        Export the simulation model as a Colored Petri net (.cpn) to be executed in CPN Tools.
+
+        :param output_path: The directory to write the model to
+        :param model_name: The name of the model (and of the .csv files the simulation writes)
+        :param case_state_encoding: How observed attribute values of a case are made available to later
+            activities of the case, either in global last-observation places or on the case tokens
+        :param use_subpages: Whether to put the execution of each labeled transition onto a subpage of its own,
+            which keeps pages small for large models
+        :param event_output: Whether the simulation writes event tables, or only collects summary statistics
+            with monitors, which is much cheaper if only those are needed
+        :param timestamp_format: Whether the simulation writes the timestamps of events as dates, or as model time,
+            which is cheaper in CPN Tools
+        :param warmup_time: The end of the warm-up period (see warmup.detect_warmup). The events of cases that
+            arrive before it are not written to the event tables. These cases are still simulated, and still
+            take event ids.
+        """
         cwd = os.getcwd()
         output_path_abs = os.path.join(cwd, output_path)
         model_out_path =  os.path.join(output_path_abs, model_name + ".cpn")
@@ -61,6 +95,92 @@ class SimulationModel:
                                       petriNet=self.__petriNet,
                                       causalModel=self.__causalModel,
                                       simulationParameters=self.__simulationParameters,
-                                      model_name=model_name)
+                                      model_name=model_name,
+                                      case_state_encoding=case_state_encoding,
+                                      use_subpages=use_subpages,
+                                      event_output=event_output,
+                                      timestamp_format=timestamp_format,
+                                      warmup_time=warmup_time)
         converter.convert()
         converter.export(model_out_path)
+
+    def iter_events(self, seed=None, warmup_time: float = 0.0):
+        """
+        Simulate the model in Python, yielding the events as they are generated.
+        Completed cases and their observed attribute values are discarded right away,
+        so that memory only grows with the number of active cases, not with the number of cases.
+
+        :param seed: The seed of the simulation (an int, or None for fresh entropy)
+        :param warmup_time: The end of the warm-up period (see warmup.detect_warmup). The events of cases that
+            arrive before it are not generated.
+        :return: A generator of event table rows, that is, dictionaries from the columns of the event table
+            of the activity (event id, case id, activity, timestamp, attribute names) to the values
+        """
+        # numpy is only needed for simulating in Python
+        import numpy
+        simulator = Simulator(self.__petriNet, self.__causalModel, self.__simulationParameters,
+                              numpy.random.default_rng(seed), keep_completed_cases=False,
+                              warmup_time=warmup_time)
+        attributes_by_activity_name = {
+            activity_name: self.__causalModel.get_attributes_for_activity_id(get_activity_id(activity_name))
+            for activity_name in self.__petriNet.get_activities()
+        }
+        event: SimulatedEvent
+        for event in simulator.iter_events():
+            yield event.to_table_row(attributes_by_activity_name[event.activity_name])
+
+    @staticmethod
+    def get_shard_model_name(model_name: str, shard_index: int):
+        return "{0}_shard{1}".format(model_name, shard_index)
+
+    def to_CPN_shards(self, number_of_shards: int, output_path, model_name, seed: int = None, **kwargs):
+        """
+        Export the simulation model as several Colored Petri nets that can be run side by side in CPN Tools,
+        and that together simulate all cases. Each shard gets its share of the cases, disjoint ranges
+        of case ids and event ids, a random seed of its own, and writes to its own .csv files.
+        The event tables of the shards can be merged with merge_CPN_shard_event_tables.
+
+        The shards are independent sub-runs: each of them starts at the process start with an empty system,
+        and its cases arrive at the full arrival rate of the model. In the merged tables, the cases of k shards
+        therefore arrive within about 1/k of the time span of a single run, at k times the load.
+        Cases must not interact, so that models with aggregated dependencies cannot be sharded.
+
+        :param number_of_shards: The number of shards
+        :param output_path: The directory to write the models to
+        :param model_name: The name of the model. Shard i is named model_name + "_shard" + i.
+        :param seed: The seed from which the random seeds of the shards are derived
+        :param kwargs: Further options of to_CPN
+        :return: The names of the shard models
+        """
+        validate_condition(not self.__causalModel.get_aggregated_relations(),
+                           "Cases interact through aggregated dependencies, so that they cannot be simulated in shards.")
+        validate_condition(isinstance(number_of_shards, int) and number_of_shards > 0,
+                           "The number of shards must be a positive integer.")
+        shard_model_names = []
+        for shard_index in range(number_of_shards):
+            shard_parameters = self.__simulationParameters.get_shard(shard_index, number_of_shards, seed)
+            shard_model = SimulationModel(self.__petriNet, self.__causalModel, shard_parameters)
+            shard_model_name = self.get_shard_model_name(model_name, shard_index)
+            shard_model.to_CPN(output_path, shard_model_name, **kwargs)
+            shard_model_names.append(shard_model_name)
+        return shard_model_names
+
+    def merge_CPN_shard_event_tables(self, number_of_shards: int, output_path, model_name):
+        """
+        Merge the event tables that the shards exported by to_CPN_shards have written into one table
+        per activity, sorted by timestamp. The merged tables hold the k independent sub-runs of the shards side
+        by side, at k times the arrival rate of the model (see to_CPN_shards), not a single run of the model.
+
+        :param number_of_shards: The number of shards
+        :param output_path: The directory that contains the event tables of the shards
+        :param model_name: The name of the model
+        """
+        for activity_name in dict.fromkeys(self.__petriNet.get_activities()):
+            activity_id = get_activity_id(activity_name)
+            shard_table_paths = [
+                os.path.join(output_path, os.path.basename(get_event_table_file_path(
+                    activity_id, self.get_shard_model_name(model_name, shard_index))))
+                for shard_index in range(number_of_shards)
+            ]
+            merge_event_tables(shard_table_paths, os.path.join(
+                output_path, os.path.basename(get_event_table_file_path(activity_id, model_name))))
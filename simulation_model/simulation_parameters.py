@@ -1,9 +1,23 @@
+import random
+
 from simulation_model.timing import ActivityTiming, TimingFunction, TimeDensity, ActivityTimingManager
+from utils.validators import validate_condition
 
 
 class SimulationParameters:
 
     CASE_ID_PREFIX = "CASE"
+    EVENT_ID_PREFIX = "EVENT"
+    # integers in CPN Tools have 31 bits
+    MAX_CPN_INT = 2 ** 30 - 1
+    # the modulus of the Park-Miller generator that seeded simulations use
+    RANDOM_MODULUS = 2 ** 31 - 1
+
+    def __validate(self):
+        validate_condition(self.first_case_id > 0 and self.first_event_id > 0,
+                           "Case and event ids must start at a positive number.")
+        validate_condition(self.random_seed is None or 0 < self.random_seed < self.RANDOM_MODULUS,
+                           "The random seed must be between 1 and {0}.".format(self.RANDOM_MODULUS - 1))
 
     def __init__(self,
                  number_of_cases: int,
@@ -11,6 +25,9 @@ class SimulationParameters:
                  case_arrival_density: TimeDensity,
                  service_time_density: TimeDensity,
                  activity_timings: list[ActivityTiming],
+                 first_case_id: int = 1,
+                 first_event_id: int = 1,
+                 random_seed: int = None
                  ):
         """
         Parameters of the simulation that is passed along with the Petri net and causal model
@@ -21,6 +38,10 @@ class SimulationParameters:
         :param case_arrival_density: At what times cases do arrive.
         :param service_time_density: At what times the process execution proceeds (working hours).
         :param activity_timings: How long executions of specific activities take.
+        :param first_case_id: The id of the first case. Cases are numbered consecutively.
+        :param first_event_id: The id of the first event. Events are numbered consecutively.
+        :param random_seed: The seed of the random numbers drawn by the simulation. If this is None,
+            the random number generator of CPN Tools is used, which cannot be seeded.
         """
         self.number_of_cases = number_of_cases
         self.case_arrival_rate = case_arrival_rate
@@ -31,6 +52,39 @@ class SimulationParameters:
         self.activity_timing_manager = ActivityTimingManager({
             act_timing.activity_name: act_timing for act_timing in activity_timings
         })
+        self.first_case_id = first_case_id
+        self.first_event_id = first_event_id
+        self.random_seed = random_seed
+        self.__validate()
+
+    def get_shard(self, shard_index: int, number_of_shards: int, seed: int = None):
+        """
+        Get the parameters of one of several shards that together simulate the cases of these parameters.
+        Shards get consecutive ranges of case ids, disjoint ranges of event ids, and their own random seeds.
+        Each shard keeps the arrival rate, so that its cases arrive as in an independent run of its own.
+
+        :param shard_index: The index of the shard
+        :param number_of_shards: The number of shards
+        :param seed: The seed from which the random seeds of all shards are derived
+        :return: The simulation parameters of the shard
+        """
+        validate_condition(0 <= shard_index < number_of_shards, "Invalid shard index {0}.".format(shard_index))
+        cases_per_shard, remainder = divmod(self.number_of_cases, number_of_shards)
+        shard_number_of_cases = cases_per_shard + (1 if shard_index < remainder else 0)
+        preceding_cases = shard_index * cases_per_shard + min(shard_index, remainder)
+        event_id_block_size = (self.MAX_CPN_INT - self.first_event_id + 1) // number_of_shards
+        seed_generator = random.Random(seed)
+        shard_seeds = [seed_generator.randrange(1, self.RANDOM_MODULUS) for _ in range(number_of_shards)]
+        return SimulationParameters(
+            number_of_cases=shard_number_of_cases,
+            case_arrival_rate=self.case_arrival_rate,
+            case_arrival_density=self.case_arrival_density,
+            service_time_density=self.service_time_density,
+            activity_timings=self.activity_timings,
+            first_case_id=self.first_case_id + preceding_cases,
+            first_event_id=self.first_event_id + shard_index * event_id_block_size,
+            random_seed=shard_seeds[shard_index]
+        )
 
     def get_activity_names(self):
         return self.__activity_names
@@ -0,0 +1,645 @@
+import copy
+import heapq
+import os
+from datetime import datetime, timezone
+
+from causal_model.causal_process_model import CausalProcessModel
+from causal_model.causal_process_structure import CPM_Activity, CPM_Attribute
+from causal_model.valuation import AttributeValuation, ValuationParameter, BayesianValuation
+from process_model.petri_net import SimplePetriNet, SimplePetriNetTransition
+from simulation_model.aggregation_engine import AggregationEngine
+from simulation_model.functions import PROCESS_START_TIMESTAMP, get_event_table_file_path
+from simulation_model.simulation_parameters import SimulationParameters
+from utils.validators import validate_condition
+
+PROCESS_START_TIME = float(PROCESS_START_TIMESTAMP)
+VALUE_SEPARATOR = ";"
+EVENT_TABLE_COLUMNS = ["event_id", "case_id", "activity", "timestamp"]
+# the optional last column of event tables with the likelihood ratios of importance sampling
+WEIGHT_COLUMN = "weight"
+# the purposes of the draws of a case (see Simulator)
+CHOICE_PURPOSE = "choice"
+DELAY_PURPOSE = "delay"
+VALUATION_PURPOSE = "valuation"
+
+
+def get_activity_id(activity_name: str):
+    return CPM_Activity(activity_name).get_id()
+
+
+def get_timestamp_string(t: float) -> str:
+    """
+    Format a point in model time as the simulation writes it to the event tables
+    (the Python counterpart of the SML function t2s, in UTC).
+
+    :param t: The point in model time, in seconds
+    :return: The timestamp
+    """
+    return datetime.fromtimestamp(t + PROCESS_START_TIME, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def iter_arrival_times(simulation_parameters: SimulationParameters, rng, number_of_cases: int = None):
+    """
+    Sample the arrival times of the cases, as the case generator of the CPN does: the first case arrives at time 0,
+    and each further case after a delay drawn from the arrival rate and stretched by the arrival density.
+
+    :param simulation_parameters: The simulation parameters
+    :param rng: The random generator (a numpy.random.Generator)
+    :param number_of_cases: How many arrivals to sample. If this is None, the number of cases of the
+        simulation parameters is taken.
+    :return: A generator of the arrival times (seconds of model time)
+    """
+    if number_of_cases is None:
+        number_of_cases = simulation_parameters.number_of_cases
+    t = 0.0
+    for case_number in range(number_of_cases):
+        if case_number > 0:
+            duration = simulation_parameters.case_arrival_rate.sample(rng)
+            t += float(round(simulation_parameters.case_arrival_density.get_relative_delay(
+                t + PROCESS_START_TIME, duration)))
+        yield t
+
+
+class SimulatedEvent:
+
+    def __init__(self, event_id: int, case_id: int, activity_id: str, activity_name: str,
+                 timestamp: float, attribute_values: dict[str, str], weight: float = 1.0,
+                 start_time: float = None):
+        """
+        An event of a simulated case. Ids and timestamps are kept numeric,
+        and only formatted when the event is written.
+
+        :param event_id: The running number of the event within the simulation
+        :param case_id: The running number of the case within the simulation
+        :param activity_id: The id of the activity
+        :param activity_name: The name of the activity
+        :param timestamp: The time the activity execution is completed, in seconds of model time
+        :param attribute_values: The values of the attributes that are observed at the activity
+        :param weight: The likelihood ratio of the case up to and including the event, if attributes are
+            valuated by importance sampling (see Simulator)
+        :param start_time: The time the activity execution started, in seconds of model time
+        """
+        self.event_id = event_id
+        self.case_id = case_id
+        self.activity_id = activity_id
+        self.activity_name = activity_name
+        self.timestamp = timestamp
+        self.attribute_values = attribute_values
+        self.weight = weight
+        self.start_time = start_time
+
+    def get_event_id_string(self):
+        return SimulationParameters.EVENT_ID_PREFIX + str(self.event_id)
+
+    def get_case_id_string(self):
+        return SimulationParameters.CASE_ID_PREFIX + str(self.case_id)
+
+    def get_timestamp_string(self):
+        return get_timestamp_string(self.timestamp)
+
+    def to_record(self, attribute_ids: list[str]) -> list[str]:
+        """
+        Get the event as a row of the event table of its activity.
+
+        :param attribute_ids: The attributes of the activity, in the column order of the table
+        :return: The row
+        """
+        return [self.get_event_id_string(), self.get_case_id_string(), self.activity_name,
+                self.get_timestamp_string()] + [self.attribute_values[attr_id] for attr_id in attribute_ids]
+
+    def to_table_row(self, attributes: list[CPM_Attribute]) -> dict[str, str]:
+        """
+        Get the event as a row of the event table of its activity, by column name.
+
+        :param attributes: The attributes of the activity, in the column order of the table
+        :return: The row
+        """
+        return dict(zip(EVENT_TABLE_COLUMNS + [attr.get_name() for attr in attributes],
+                        self.to_record([attr.get_id() for attr in attributes])))
+
+    def to_log_record(self, attribute_ids: list[str]) -> list[str]:
+        """
+        Get the event as a row of an event log over all activities,
+        where the attributes that are not observed at its activity are left empty.
+
+        :param attribute_ids: All attributes of the causal model, in the column order of the log
+        :return: The row
+        """
+        return [self.get_event_id_string(), self.get_case_id_string(), self.activity_name,
+                self.get_timestamp_string()] + [self.attribute_values.get(attr_id, "") for attr_id in attribute_ids]
+
+
+class SimulatedCase:
+
+    def __init__(self, case_id: int, arrival_time: float):
+        """
+        The state of a case during a simulation.
+
+        :param case_id: The running number of the case
+        :param arrival_time: The time the case arrived, in seconds of model time
+        """
+        self.case_id = case_id
+        self.arrival_time = arrival_time
+        self.completion_time = arrival_time
+        # the times at which the tokens of the case in each place become available
+        self.marking: dict[str, list[float]] = dict()
+        # the last observed value of each attribute
+        self.observations: dict[str, str] = dict()
+        # the dedicated random generators of the case, by purpose (see Simulator)
+        self.random_generators: dict[tuple, object] = dict()
+        # the product of the likelihood ratios of the importance sampled valuations of the case so far
+        self.likelihood_ratio = 1.0
+        # whether the case arrived during the warm-up period, so that its events are not passed on
+        self.is_warmup = False
+
+    def get_cycle_time(self):
+        return self.completion_time - self.arrival_time
+
+    def copy(self):
+        """
+        :return: A copy of the case that does not share its marking and observations
+        """
+        case = SimulatedCase(self.case_id, self.arrival_time)
+        case.completion_time = self.completion_time
+        case.marking = {place_id: list(times) for place_id, times in self.marking.items()}
+        case.observations = dict(self.observations)
+        case.likelihood_ratio = self.likelihood_ratio
+        case.is_warmup = self.is_warmup
+        return case
+
+
+class CaseSnapshot:
+
+    def __init__(self, case: SimulatedCase, time: float, wakeup_times: list[float], transition_id, rng,
+                 next_event_id: int, is_completed: bool):
+        """
+        The state of a case that is simulated in isolation, at the point where its simulation stopped:
+        either before a transition fires, or after the case is completed (or cannot continue).
+        The snapshot keeps copies, so that it can be resumed any number of times with the same outcome.
+
+        :param case: The case
+        :param time: The current time
+        :param wakeup_times: The times at which delayed tokens of the case become available, as a heap
+        :param transition_id: The transition that was chosen to fire next, or None if the case cannot continue
+        :param rng: The random generator of the case
+        :param next_event_id: The id of the next event of the case
+        :param is_completed: Whether the case is completed
+        """
+        self.case = case.copy()
+        self.time = time
+        self.wakeup_times = list(wakeup_times)
+        self.transition_id = transition_id
+        self.rng = copy.deepcopy(rng)
+        self.next_event_id = next_event_id
+        self.is_completed = is_completed
+
+
+class Simulator:
+
+    def __validate(self):
+        validate_condition(len(self.__petri_net.get_initial_places()) > 0,
+                           "The Petri net has no initial places.")
+
+    def __validate_interventions(self):
+        attributes = {attr.get_id(): attr for attr in self.__causal_model.get_attributes()}
+        for attr_id, label in self.__interventions.items():
+            validate_condition(attr_id in attributes, 'Cannot intervene on unknown attribute "{0}".'.format(attr_id))
+            validate_condition(label in attributes[attr_id].get_labels(),
+                               'Attribute "{0}" has no label "{1}".'.format(attr_id, label))
+
+    def __validate_proposal_valuations(self):
+        for attr_id, proposal in self.__proposal_valuations.items():
+            valuation = self.__causal_model.get_attribute_valuations().get_attribute_valuation(attr_id)
+            validate_condition(isinstance(valuation, BayesianValuation) and isinstance(proposal, BayesianValuation),
+                               'Attribute "{0}" can only be importance sampled with Bayesian valuations.'.format(
+                                   attr_id))
+            vp: ValuationParameter
+            validate_condition(
+                [vp.get_attribute().get_id() for vp in proposal.valuation_parameters.get_valuation_parameters_list()]
+                == [vp.get_attribute().get_id() for vp in valuation.valuation_parameters.get_valuation_parameters_list()],
+                'The proposal valuation of attribute "{0}" must have the parameters of its valuation.'.format(attr_id))
+            # the proposal must be able to yield every label that the valuation can yield
+            for key in valuation.get_probability_mappings():
+                validate_condition(
+                    all(proposal.get_probability(key, label) > 0
+                        for label in valuation.outcome_attribute.get_labels() if valuation.get_probability(key, label) > 0),
+                    'The proposal valuation of attribute "{0}" cannot yield some labels at {1}.'.format(attr_id, key))
+
+    def __init__(self,
+                 petri_net: SimplePetriNet,
+                 causal_model: CausalProcessModel,
+                 simulation_parameters: SimulationParameters,
+                 rng,
+                 arrival_times=None,
+                 first_case_id: int = 1,
+                 first_event_id: int = 1,
+                 keep_completed_cases: bool = True,
+                 interventions: dict[str, str] = None,
+                 random_streams=None,
+                 proposal_valuations: dict[str, BayesianValuation] = None,
+                 warmup_time: float = 0.0):
+        """
+        A discrete-event simulation of a simulation model in Python, following the semantics of the
+        generated CPN: cases arrive according to the arrival rate and density, labeled transitions valuate
+        the attributes of their activity and delay the tokens of the case according to the service density,
+        and silent transitions fire immediately. Conflicts between the enabled transitions of a case are
+        resolved uniformly at random. All randomness is drawn from rng, so that a simulation is reproducible.
+        As in the generated CPN, calendar densities and timestamps refer to UTC.
+
+        :param petri_net: The Petri net
+        :param causal_model: The causal model
+        :param simulation_parameters: The simulation parameters
+        :param rng: The random generator (a numpy.random.Generator)
+        :param arrival_times: The arrival times of the cases in non-decreasing order (seconds of model time),
+            e.g., a pre-sampled part of an arrival schedule. If this is None, arrivals are sampled during the simulation.
+        :param first_case_id: The id of the first case. Cases are numbered consecutively.
+        :param first_event_id: The id of the first event. Events are numbered consecutively.
+        :param keep_completed_cases: Whether to keep completed cases (e.g., to compute cycle times afterwards).
+            If this is False, memory only grows with the number of active cases.
+        :param interventions: Labels that some attributes are set to instead of being valuated (the do-operator),
+            by attribute id
+        :param random_streams: Dedicated random streams per case and purpose (a variance_reduction.RandomStreams).
+            If this is given, the draws of a case (choices, delays, valuations) come from its streams,
+            and rng is only used for the arrivals.
+        :param proposal_valuations: Valuations to sample some attributes from instead of their valuations in the
+            causal model, by attribute id (importance sampling, e.g., tilted towards rare labels). Each case keeps
+            the product of the ratios of the probabilities of its sampled labels under both valuations, and each
+            event carries the ratio of its case so far as its weight.
+        :param warmup_time: The end of the warm-up period, in seconds of model time (see warmup.detect_warmup).
+            Cases that arrive before it are simulated, so that they load the system, but their events are not
+            generated (and use no event ids), and they do not count as completed cases.
+        """
+        self.__petri_net = petri_net
+        self.__causal_model = causal_model
+        self.__simulation_parameters = simulation_parameters
+        self.__rng = rng
+        self.__validate()
+        self.__labels = petri_net.get_labels()
+        self.__labeled_transition_ids = set(self.__labels.get_keys())
+        t: SimplePetriNetTransition
+        self.__transition_ids = [t.get_id() for t in petri_net.get_transitions()]
+        self.__preset_place_ids = {
+            t_id: [arc.get_source().get_id() for arc in petri_net.get_incoming_arcs(t_id)]
+            for t_id in self.__transition_ids
+        }
+        self.__postset_place_ids = {
+            t_id: [arc.get_target().get_id() for arc in petri_net.get_outgoing_arcs(t_id)]
+            for t_id in self.__transition_ids
+        }
+        self.__initial_place_ids = [p.get_id() for p in petri_net.get_initial_places()]
+        self.__final_place_ids = set(p.get_id() for p in petri_net.get_final_places())
+        self.__aggregation_engine = AggregationEngine(causal_model)
+        if arrival_times is None:
+            arrival_times = iter_arrival_times(simulation_parameters, rng)
+        self.__arrival_times = arrival_times
+        self.__first_case_id = first_case_id
+        self.__event_counter = first_event_id - 1
+        self.__keep_completed_cases = keep_completed_cases
+        self.__completed_cases: list[SimulatedCase] = []
+        self.__number_of_completed_cases = 0
+        self.__active_cases: dict[int, SimulatedCase] = dict()
+        self.__interventions = dict() if interventions is None else dict(interventions)
+        self.__random_streams = random_streams
+        self.__proposal_valuations = dict() if proposal_valuations is None else dict(proposal_valuations)
+        # completed cases that iter_completed_cases has not passed on yet (None if it is not used)
+        self.__newly_completed_cases: list[SimulatedCase] = None
+        self.__warmup_time = warmup_time
+        self.__validate_proposal_valuations()
+        self.__validate_interventions()
+
+    def get_completed_cases(self) -> list[SimulatedCase]:
+        return self.__completed_cases
+
+    def get_number_of_completed_cases(self) -> int:
+        return self.__number_of_completed_cases
+
+    def get_active_cases(self) -> list[SimulatedCase]:
+        return list(self.__active_cases.values())
+
+    def run(self) -> list[SimulatedEvent]:
+        """
+        Simulate all cases.
+
+        :return: The events, in the order they were generated
+        """
+        return list(self.iter_events())
+
+    def iter_events(self):
+        """
+        Simulate all cases, yielding the events as they are generated.
+        Case arrivals are scheduled one at a time, and cases are retired as soon as they are completed.
+
+        :return: A generator of SimulatedEvent
+        """
+        arrival_times = iter(self.__arrival_times)
+        # calendar entries (time, sequence number, case id), where case id None denotes the next arrival
+        calendar = []
+        sequence_number = 0
+        next_case_id = self.__first_case_id
+        next_arrival_time = next(arrival_times, None)
+        if next_arrival_time is not None:
+            heapq.heappush(calendar, (float(next_arrival_time), sequence_number, None))
+            sequence_number += 1
+        while calendar:
+            t, _, case_id = heapq.heappop(calendar)
+            if case_id is None:
+                case = SimulatedCase(next_case_id, t)
+                case.is_warmup = t < self.__warmup_time
+                self.__active_cases[case.case_id] = case
+                for place_id in self.__initial_place_ids:
+                    case.marking.setdefault(place_id, []).append(t)
+                next_arrival_time = next(arrival_times, None)
+                if next_arrival_time is not None:
+                    heapq.heappush(calendar, (float(next_arrival_time), sequence_number, None))
+                    sequence_number += 1
+                next_case_id += 1
+            elif case_id in self.__active_cases:
+                case = self.__active_cases[case_id]
+            else:
+                # the delayed tokens of a case that is already completed
+                continue
+            wakeup_times = []
+            for event in self.__advance(case, t, wakeup_times):
+                if not case.is_warmup:
+                    yield event
+            for wakeup_time in wakeup_times:
+                heapq.heappush(calendar, (wakeup_time, sequence_number, case.case_id))
+                sequence_number += 1
+            if self.__is_completed(case):
+                del self.__active_cases[case.case_id]
+                if case.is_warmup:
+                    continue
+                self.__number_of_completed_cases += 1
+                if self.__keep_completed_cases:
+                    self.__completed_cases.append(case)
+                if self.__newly_completed_cases is not None:
+                    self.__newly_completed_cases.append(case)
+
+    def iter_completed_cases(self):
+        """
+        Simulate all cases, yielding each case with its events soon after it is completed
+        (in the order of completion). Only the events of active cases are kept.
+
+        :return: A generator of (SimulatedCase, list of SimulatedEvent)
+        """
+        self.__newly_completed_cases = []
+        events_by_case_id: dict[int, list[SimulatedEvent]] = dict()
+        try:
+            for event in self.iter_events():
+                events_by_case_id.setdefault(event.case_id, []).append(event)
+                while self.__newly_completed_cases:
+                    case = self.__newly_completed_cases.pop(0)
+                    yield case, events_by_case_id.pop(case.case_id, [])
+            for case in self.__newly_completed_cases:
+                yield case, events_by_case_id.pop(case.case_id, [])
+        finally:
+            self.__newly_completed_cases = None
+
+    def simulate_case(self, case_id: int, arrival_time: float, rng, first_event_id: int,
+                      fork_attribute_ids: set = None) -> tuple[list[SimulatedEvent], CaseSnapshot]:
+        """
+        Simulate one case in isolation, i.e., as if no other case existed, with its own random generator.
+        This is exact if the model has no aggregated dependencies. Cases simulated this way are not
+        counted among the completed or active cases of the simulator.
+
+        :param case_id: The id of the case
+        :param arrival_time: The arrival time of the case
+        :param rng: The random generator of the case (a numpy.random.Generator)
+        :param first_event_id: The id of the first event of the case
+        :param fork_attribute_ids: If this is given, the simulation stops before the first activity
+            that observes one of these attributes
+        :return: The events, and the state of the case where the simulation stopped
+        """
+        case = SimulatedCase(case_id, arrival_time)
+        for place_id in self.__initial_place_ids:
+            case.marking.setdefault(place_id, []).append(arrival_time)
+        return self.__simulate_case(case, arrival_time, [], None, fork_attribute_ids, rng, first_event_id)
+
+    def resume_case(self, snapshot: CaseSnapshot) -> tuple[list[SimulatedEvent], CaseSnapshot]:
+        """
+        Continue the simulation of a case from a snapshot (see simulate_case) until it is completed,
+        with the interventions of this simulator. The snapshot is not changed.
+
+        :param snapshot: The snapshot
+        :return: The events after the snapshot, and the state of the completed case
+        """
+        return self.__simulate_case(snapshot.case.copy(), snapshot.time, list(snapshot.wakeup_times),
+                                    snapshot.transition_id, None, copy.deepcopy(snapshot.rng),
+                                    snapshot.next_event_id)
+
+    def __simulate_case(self, case: SimulatedCase, t: float, wakeup_times: list[float], transition_id,
+                        fork_attribute_ids, rng, first_event_id: int) -> tuple[list[SimulatedEvent], CaseSnapshot]:
+        simulation_rng, simulation_event_counter = self.__rng, self.__event_counter
+        self.__rng, self.__event_counter = rng, first_event_id - 1
+        try:
+            events = []
+            while True:
+                new_wakeup_times = []
+                advance = self.__advance(case, t, new_wakeup_times, transition_id, fork_attribute_ids)
+                transition_id = None
+                try:
+                    while True:
+                        events.append(next(advance))
+                except StopIteration as stop:
+                    stopped_transition_id = stop.value
+                for wakeup_time in new_wakeup_times:
+                    heapq.heappush(wakeup_times, wakeup_time)
+                is_completed = self.__is_completed(case)
+                if stopped_transition_id is not None or is_completed or not wakeup_times:
+                    return events, CaseSnapshot(case, t, wakeup_times, stopped_transition_id, rng,
+                                                self.__event_counter + 1, is_completed)
+                t = heapq.heappop(wakeup_times)
+        finally:
+            self.__rng, self.__event_counter = simulation_rng, simulation_event_counter
+
+    def __get_rng(self, case: SimulatedCase, purpose: str, purpose_id: str = None):
+        if self.__random_streams is None:
+            return self.__rng
+        key = (purpose, purpose_id)
+        if key not in case.random_generators:
+            case.random_generators[key] = self.__random_streams.get_case_generator(case.case_id, purpose, purpose_id)
+        return case.random_generators[key]
+
+    def __is_completed(self, case: SimulatedCase):
+        return all(place_id in self.__final_place_ids for place_id, times in case.marking.items() if times)
+
+    def __get_enabled_transition_ids(self, case: SimulatedCase, t: float) -> list[str]:
+        enabled = []
+        for t_id in self.__transition_ids:
+            preset = self.__preset_place_ids[t_id]
+            if not preset:
+                continue
+            if not all(sum(1 for s in case.marking.get(place_id, []) if s <= t) >= preset.count(place_id)
+                       for place_id in preset):
+                continue
+            if t_id in self.__labeled_transition_ids and not self.__has_preset_observations(case, t_id):
+                continue
+            enabled.append(t_id)
+        return enabled
+
+    def __has_preset_observations(self, case: SimulatedCase, t_id: str):
+        activity_id = get_activity_id(self.__labels.get_label(t_id))
+        return all(relation.get_in().get_id() in case.observations
+                   for attr_id in self.__causal_model.get_attribute_ids_by_activity_id(activity_id)
+                   for relation in self.__causal_model.get_preset(attr_id))
+
+    def __observes_any(self, t_id: str, attribute_ids: set):
+        activity_id = get_activity_id(self.__labels.get_label(t_id))
+        return any(attr_id in attribute_ids
+                   for attr_id in self.__causal_model.get_attribute_ids_by_activity_id(activity_id))
+
+    def __advance(self, case: SimulatedCase, t: float, wakeup_times: list[float], transition_id=None,
+                  fork_attribute_ids: set = None):
+        """
+        Fire enabled transitions of a case at time t until none is enabled anymore.
+
+        :param case: The case
+        :param t: The current time
+        :param wakeup_times: Where to add the times at which delayed tokens of the case become available
+        :param transition_id: A transition that was chosen to fire first, if any
+        :param fork_attribute_ids: If this is given, stop before firing a transition whose activity observes
+            one of these attributes
+        :return: A generator of the events, which returns the transition it stopped before (or None)
+        """
+        enabled = [transition_id] if transition_id is not None else self.__get_enabled_transition_ids(case, t)
+        while enabled:
+            if len(enabled) == 1:
+                t_id = enabled[0]
+            else:
+                t_id = enabled[int(self.__get_rng(case, CHOICE_PURPOSE).integers(len(enabled)))]
+            if fork_attribute_ids and t_id != transition_id and t_id in self.__labeled_transition_ids \
+                    and self.__observes_any(t_id, fork_attribute_ids):
+                return t_id
+            transition_id = None
+            for place_id in self.__preset_place_ids[t_id]:
+                times = case.marking[place_id]
+                times.remove(min(s for s in times if s <= t))
+            delay = 0.0
+            if t_id in self.__labeled_transition_ids:
+                event = self.__execute_activity(case, self.__labels.get_label(t_id), t)
+                delay = float(round(event.timestamp - t))
+                yield event
+            for place_id in self.__postset_place_ids[t_id]:
+                case.marking.setdefault(place_id, []).append(t + delay)
+            if delay > 0:
+                wakeup_times.append(t + delay)
+            enabled = self.__get_enabled_transition_ids(case, t)
+
+    def __valuate(self, case: SimulatedCase, attribute_id: str, t: float) -> str:
+        if attribute_id in self.__interventions:
+            return self.__interventions[attribute_id]
+        valuation: AttributeValuation = self.__causal_model.get_attribute_valuations().get_attribute_valuation(
+            attribute_id)
+        parameter_labels = []
+        vp: ValuationParameter
+        for vp in valuation.valuation_parameters.get_valuation_parameters_list():
+            parameter_id = vp.get_attribute().get_id()
+            if self.__causal_model.has_relation(parameter_id, attribute_id, is_aggregated=True):
+                parameter_labels.append(self.__aggregation_engine.evaluate(parameter_id, attribute_id, t))
+            else:
+                parameter_labels.append(case.observations[parameter_id])
+        rng = self.__get_rng(case, VALUATION_PURPOSE, attribute_id)
+        if attribute_id in self.__proposal_valuations:
+            proposal = self.__proposal_valuations[attribute_id]
+            label = proposal.sample(tuple(parameter_labels), rng)
+            case.likelihood_ratio *= (valuation.get_probability(tuple(parameter_labels), label)
+                                      / proposal.get_probability(tuple(parameter_labels), label))
+            return label
+        return valuation.sample(tuple(parameter_labels), rng)
+
+    def __execute_activity(self, case: SimulatedCase, activity_name: str, t: float) -> SimulatedEvent:
+        activity_id = get_activity_id(activity_name)
+        attribute_ids = [attr.get_id() for attr in self.__causal_model.get_attributes_for_activity_id(activity_id)]
+        # all attributes of an activity are valuated before any of them is observed
+        attribute_values = {attr_id: self.__valuate(case, attr_id, t) for attr_id in attribute_ids}
+        for attr_id, label in attribute_values.items():
+            case.observations[attr_id] = label
+            self.__aggregation_engine.observe(attr_id, label, t)
+        execution_delay = self.__simulation_parameters.activity_timing_manager.get_activity_timing(
+            activity_name).execution_delay
+        duration = execution_delay.sample(self.__get_rng(case, DELAY_PURPOSE, activity_id))
+        relative_delay = self.__simulation_parameters.service_time_density.get_relative_delay(
+            t + PROCESS_START_TIME, duration)
+        case.completion_time = max(case.completion_time, t + relative_delay)
+        if case.is_warmup:
+            # the event is only needed for its timestamp
+            event_id = None
+        else:
+            self.__event_counter += 1
+            event_id = self.__event_counter
+        return SimulatedEvent(event_id, case.case_id, activity_id, activity_name,
+                              t + relative_delay, attribute_values, case.likelihood_ratio, t)
+
+
+def write_event_tables(events: list[SimulatedEvent], petri_net: SimplePetriNet, causal_model: CausalProcessModel,
+                       output_path: str, model_name: str, include_weights: bool = False):
+    """
+    Write simulated events to one .csv file per activity, in the format of the event tables of the CPN.
+    The events are written as given. A simulator with a warm-up time does not generate the events of warm-up cases,
+    so that they are not written either.
+
+    :param events: The events
+    :param petri_net: The Petri net of the simulation model
+    :param causal_model: The causal model of the simulation model
+    :param output_path: The directory to write the tables to
+    :param model_name: The name of the model (prefix of the file names)
+    :param include_weights: Whether to add the weights of the events (see SimulatedEvent) as a last column
+    """
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    events_by_activity_name: dict[str, list[SimulatedEvent]] = {
+        activity_name: [] for activity_name in petri_net.get_activities()
+    }
+    for event in events:
+        events_by_activity_name[event.activity_name].append(event)
+    for activity_name, activity_events in events_by_activity_name.items():
+        activity_id = get_activity_id(activity_name)
+        attributes = causal_model.get_attributes_for_activity_id(activity_id)
+        attribute_ids = [attr.get_id() for attr in attributes]
+        file_name = os.path.basename(get_event_table_file_path(activity_id, model_name))
+        with open(os.path.join(output_path, file_name), "w") as file:
+            header = EVENT_TABLE_COLUMNS + [attr.get_name() for attr in attributes]
+            if include_weights:
+                header.append(WEIGHT_COLUMN)
+            file.write(VALUE_SEPARATOR.join(header) + "\n")
+            for event in activity_events:
+                record = event.to_record(attribute_ids)
+                if include_weights:
+                    record.append(repr(event.weight))
+                file.write(VALUE_SEPARATOR.join(record) + "\n")
+
+
+def get_timestamp_sort_key(timestamp: str):
+    """
+    :param timestamp: A timestamp of an event table, either a date or model time (see functions.TimestampFormat)
+    :return: The key by which the timestamp sorts, the string for a date, and the number for model time
+    """
+    return timestamp if "-" in timestamp else float(timestamp)
+
+
+def merge_event_tables(table_paths: list[str], output_file: str):
+    """
+    Merge event tables with the same columns (e.g., of the same activity in several shards of a simulation)
+    into one table sorted by timestamp.
+
+    :param table_paths: The event tables
+    :param output_file: The merged table
+    """
+    timestamp_index = EVENT_TABLE_COLUMNS.index("timestamp")
+    header = None
+    sorted_tables = []
+    for path in table_paths:
+        with open(path, "r") as file:
+            table_header = file.readline()
+            validate_condition(header is None or table_header == header,
+                               "Event table {0} has other columns than {1}.".format(path, table_paths[0]))
+            header = table_header
+            rows = [line for line in file if line.strip()]
+        rows.sort(key=lambda line: get_timestamp_sort_key(line.split(VALUE_SEPARATOR)[timestamp_index]))
+        sorted_tables.append(rows)
+    with open(output_file, "w") as file:
+        if header is not None:
+            file.write(header)
+        for line in heapq.merge(*sorted_tables,
+                                key=lambda line: get_timestamp_sort_key(line.split(VALUE_SEPARATOR)[timestamp_index])):
+            file.write(line if line.endswith("\n") else line + "\n")
@@ -0,0 +1,280 @@
+import math
+
+import numpy
+
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator, SimulatedCase, SimulatedEvent, PROCESS_START_TIME
+from simulation_model.timing import SECONDS_PER_DAY, get_weekday_index
+from utils.validators import validate_condition
+
+# Monday first, as in WeekdayDensity
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95)
+
+
+class WelfordAccumulator:
+
+    def __init__(self):
+        """
+        The count, mean, variance, minimum and maximum of a stream of numbers, updated in O(1) time and memory
+        per number by Welford's algorithm.
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.__squared_deviations = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.__squared_deviations += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def get_variance(self) -> float:
+        return self.__squared_deviations / (self.count - 1) if self.count > 1 else float("nan")
+
+
+class P2Quantile:
+
+    def __validate(self):
+        validate_condition(0 < self.p < 1, "The probability of a quantile must be in (0, 1).")
+
+    def __init__(self, p: float):
+        """
+        An estimate of a quantile of a stream of numbers in O(1) memory by the P-square algorithm
+        (Jain and Chlamtac, 1985): five markers track the minimum, the p/2-, p- and (1+p)/2-quantiles and the
+        maximum, and are moved by piecewise-parabolic interpolation as numbers arrive.
+
+        :param p: The probability of the quantile, in (0, 1)
+        """
+        self.p = p
+        self.__validate()
+        self.__count = 0
+        self.__heights: list[float] = []
+        self.__positions = [1, 2, 3, 4, 5]
+        self.__desired_positions = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.__increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def __get_parabolic_height(self, i: int, d: int) -> float:
+        q = self.__heights
+        n = self.__positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def add(self, value: float):
+        self.__count += 1
+        q = self.__heights
+        if self.__count <= 5:
+            q.append(value)
+            q.sort()
+            return
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if value < q[i + 1])
+        n = self.__positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.__desired_positions[i] += self.__increments[i]
+        for i in range(1, 4):
+            d = self.__desired_positions[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.__get_parabolic_height(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    # linear interpolation keeps the markers in order
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def get_quantile(self) -> float:
+        if self.__count == 0:
+            return float("nan")
+        if self.__count <= 5:
+            return float(numpy.quantile(self.__heights, self.p))
+        return self.__heights[2]
+
+
+class StreamingDistribution:
+
+    def __init__(self, quantiles=DEFAULT_QUANTILES):
+        """
+        The moments and some quantiles of a stream of numbers, in O(1) memory.
+
+        :param quantiles: The probabilities of the quantiles to estimate
+        """
+        self.__moments = WelfordAccumulator()
+        self.__quantiles = [P2Quantile(p) for p in quantiles]
+
+    def add(self, value: float):
+        self.__moments.add(value)
+        for quantile in self.__quantiles:
+            quantile.add(value)
+
+    def get_count(self) -> int:
+        return self.__moments.count
+
+    def get_summary(self) -> dict[str, float]:
+        """
+        :return: The count, mean, standard deviation, minimum, maximum, and each quantile (by key "q<p>")
+        """
+        moments = self.__moments
+        summary = {
+            "count": float(moments.count),
+            "mean": moments.mean if moments.count else float("nan"),
+            "std": math.sqrt(moments.get_variance()) if moments.count > 1 else float("nan"),
+            "min": moments.minimum if moments.count else float("nan"),
+            "max": moments.maximum if moments.count else float("nan"),
+        }
+        for quantile in self.__quantiles:
+            summary["q{0}".format(quantile.p)] = quantile.get_quantile()
+        return summary
+
+
+def get_number_of_weekdays(first_day: int, last_day: int) -> list[int]:
+    """
+    Count the days of each weekday in a range of days.
+
+    :param first_day: The first day, in days since the epoch
+    :param last_day: The last day (inclusive), in days since the epoch
+    :return: The number of Mondays, Tuesdays, ..., Sundays
+    """
+    number_of_weeks, remainder = divmod(last_day - first_day + 1, 7)
+    counts = [number_of_weeks] * 7
+    first_weekday_index = get_weekday_index(first_day * SECONDS_PER_DAY)
+    for i in range(remainder):
+        counts[(first_weekday_index + i) % 7] += 1
+    return counts
+
+
+class KPISummary:
+
+    def __init__(self, number_of_cases: int, number_of_events: int, cycle_time: dict[str, float],
+                 activity_durations: dict[str, dict[str, float]], activity_counts: dict[str, int],
+                 label_counts: dict[str, dict[str, dict[str, int]]], completions_per_weekday: dict[str, int],
+                 throughput_per_weekday: dict[str, float]):
+        """
+        Summary KPIs of a simulation.
+
+        :param number_of_cases: The number of completed cases
+        :param number_of_events: The number of events
+        :param cycle_time: The summary of the cycle times of the completed cases (see StreamingDistribution)
+        :param activity_durations: The summary of the durations of the events of each activity, by activity name
+        :param activity_counts: The number of events of each activity, by activity name
+        :param label_counts: How often the events of each activity observed each label of each attribute,
+            by activity name and attribute id
+        :param completions_per_weekday: The number of cases completed on each weekday (in UTC, as the calendar)
+        :param throughput_per_weekday: The mean number of cases completed per day, for each weekday
+        """
+        self.number_of_cases = number_of_cases
+        self.number_of_events = number_of_events
+        self.cycle_time = cycle_time
+        self.activity_durations = activity_durations
+        self.activity_counts = activity_counts
+        self.label_counts = label_counts
+        self.completions_per_weekday = completions_per_weekday
+        self.throughput_per_weekday = throughput_per_weekday
+
+    def get_label_frequencies(self, activity_name: str, attribute_id: str) -> dict[str, float]:
+        """
+        :param activity_name: The activity
+        :param attribute_id: An attribute of the activity
+        :return: The relative frequency of each label that the events of the activity observed
+        """
+        counts = self.label_counts.get(activity_name, dict()).get(attribute_id, dict())
+        total = sum(counts.values())
+        return {label: count / total for label, count in counts.items()}
+
+
+class KPIAccumulator:
+
+    def __init__(self, quantiles=DEFAULT_QUANTILES):
+        """
+        A sink for simulated events and completed cases that only keeps summary KPIs (see KPISummary),
+        so that memory does not grow with the number of events.
+
+        :param quantiles: The probabilities of the quantiles of the cycle times and durations to estimate
+        """
+        self.__quantiles = quantiles
+        self.__cycle_times = StreamingDistribution(quantiles)
+        self.__activity_durations: dict[str, StreamingDistribution] = dict()
+        self.__activity_counts: dict[str, int] = dict()
+        self.__label_counts: dict[str, dict[str, dict[str, int]]] = dict()
+        self.__completions_per_weekday = [0] * 7
+        self.__number_of_events = 0
+        self.__first_time = math.inf
+        self.__last_time = -math.inf
+
+    def observe_event(self, event: SimulatedEvent):
+        self.__number_of_events += 1
+        activity_name = event.activity_name
+        self.__activity_counts[activity_name] = self.__activity_counts.get(activity_name, 0) + 1
+        if activity_name not in self.__activity_durations:
+            self.__activity_durations[activity_name] = StreamingDistribution(self.__quantiles)
+        self.__activity_durations[activity_name].add(event.timestamp - event.start_time)
+        activity_label_counts = self.__label_counts.setdefault(activity_name, dict())
+        for attr_id, label in event.attribute_values.items():
+            counts = activity_label_counts.setdefault(attr_id, dict())
+            counts[label] = counts.get(label, 0) + 1
+
+    def observe_completed_case(self, case: SimulatedCase):
+        self.__cycle_times.add(case.get_cycle_time())
+        self.__completions_per_weekday[get_weekday_index(case.completion_time + PROCESS_START_TIME)] += 1
+        self.__first_time = min(self.__first_time, case.arrival_time)
+        self.__last_time = max(self.__last_time, case.completion_time)
+
+    def get_summary(self) -> KPISummary:
+        throughput_per_weekday = {name: float("nan") for name in WEEKDAY_NAMES}
+        if self.__cycle_times.get_count():
+            first_day = int((self.__first_time + PROCESS_START_TIME) // SECONDS_PER_DAY)
+            last_day = int((self.__last_time + PROCESS_START_TIME) // SECONDS_PER_DAY)
+            for name, completions, days in zip(WEEKDAY_NAMES, self.__completions_per_weekday,
+                                               get_number_of_weekdays(first_day, last_day)):
+                if days:
+                    throughput_per_weekday[name] = completions / days
+        return KPISummary(self.__cycle_times.get_count(),
+                          self.__number_of_events,
+                          self.__cycle_times.get_summary(),
+                          {name: durations.get_summary() for name, durations in self.__activity_durations.items()},
+                          dict(self.__activity_counts),
+                          {name: {attr_id: dict(counts) for attr_id, counts in attribute_counts.items()}
+                           for name, attribute_counts in self.__label_counts.items()},
+                          dict(zip(WEEKDAY_NAMES, self.__completions_per_weekday)),
+                          throughput_per_weekday)
+
+
+def summarize_kpis(model: SimulationModel, seed=None, quantiles=DEFAULT_QUANTILES,
+                   warmup_time: float = 0.0) -> KPISummary:
+    """
+    Simulate a model in Python and only keep summary KPIs, without materializing or writing any events.
+    Memory only grows with the number of active cases.
+
+    :param model: The simulation model
+    :param seed: The seed of the simulation (an int, or None for fresh entropy)
+    :param quantiles: The probabilities of the quantiles of the cycle times and durations to estimate
+    :param warmup_time: The end of the warm-up period (see warmup.detect_warmup). Cases that arrive before it
+        are not observed.
+    :return: The summary
+    """
+    simulation_parameters = model.get_simulation_parameters()
+    simulator = Simulator(model.get_petri_net(), model.get_causal_model(), simulation_parameters,
+                          numpy.random.default_rng(seed),
+                          first_case_id=simulation_parameters.first_case_id,
+                          first_event_id=simulation_parameters.first_event_id,
+                          keep_completed_cases=False,
+                          warmup_time=warmup_time)
+    accumulator = KPIAccumulator(quantiles)
+    for case, events in simulator.iter_completed_cases():
+        for event in events:
+            accumulator.observe_event(event)
+        accumulator.observe_completed_case(case)
+    return accumulator.get_summary()
@@ -44,6 +44,19 @@ class TimeInterval:
         return time_total
 
 
+SECONDS_PER_HOUR = TimeInterval(hours=1).get_seconds()
+SECONDS_PER_DAY = TimeInterval(days=1).get_seconds()
+
+
+def get_weekday_index(timestamp: float) -> int:
+    """
+    :param timestamp: A point in time, in seconds since the epoch (UTC)
+    :return: The index of its weekday, where Monday is 0
+    """
+    # the epoch is a Thursday
+    return (int(timestamp // SECONDS_PER_DAY) + 3) % 7
+
+
 class TimingFunction:
 
     def __init__(self, args: list, timing_type: TimingType, function_name: str = None):
@@ -68,7 +81,13 @@ class TimingFunction:
     def get_function_name_SML(self):
         return self.function_name
 
-    def sample(self):
+    def sample(self, rng):
+        """
+        Draw a duration in seconds, as the SML function does in the CPN.
+
+        :param rng: The random generator (a numpy.random.Generator)
+        :return: The duration
+        """
         raise NotImplementedError()
 
 
@@ -81,8 +100,8 @@ class FixedTimingFunction(TimingFunction):
     def get_body_SML(self):
         return "({0})".format(str(float(self.fixed_time.get_seconds())))
 
-    def sample(self):
-        return self.fixed_time.get_seconds()
+    def sample(self, rng=None):
+        return float(self.fixed_time.get_seconds())
 
 
 class ExponentialTimingFunction(TimingFunction):
@@ -105,8 +124,13 @@ class ExponentialTimingFunction(TimingFunction):
             str(float(self.maximal_value.get_seconds()))
         )
 
-    def sample(self):
-        raise NotImplementedError()
+    def sample(self, rng):
+        average_seconds = float(self.average_value.get_seconds())
+        maximal_seconds = float(self.maximal_value.get_seconds())
+        x = rng.exponential(average_seconds)
+        while x > maximal_seconds:
+            x = rng.exponential(average_seconds)
+        return x
 
 
 class ActivityTiming:
@@ -215,6 +239,44 @@ class TimeDensityCalendar:
     def __init__(self, weekday_density: WeekdayDensity, hour_density: HourDensity):
         self.weekday_density = weekday_density
         self.hour_density = hour_density
+        # Monday first, hour 00 first
+        self.__weekday_densities = [float(d) for d in weekday_density.get_as_dict().values()]
+        self.__hour_densities = [float(d) for d in hour_density.get_as_dict().values()]
+
+    def get_density(self, timestamp: float) -> float:
+        """
+        Get the density at some point in time, i.e., the product of its weekday density and its hour density.
+
+        :param timestamp: The point in time, in seconds since the epoch (UTC)
+        :return: The density
+        """
+        weekday_index = get_weekday_index(timestamp)
+        hour_index = int((timestamp % SECONDS_PER_DAY) // SECONDS_PER_HOUR)
+        return self.__weekday_densities[weekday_index] * self.__hour_densities[hour_index]
+
+    def get_relative_delay(self, timestamp: float, duration: float) -> float:
+        """
+        Stretch a duration of work according to the densities, starting at some point in time.
+        In an hour of density d, only d hours of work are done. This is the Python counterpart
+        of the relative delay function in the CPN.
+
+        :param timestamp: The point in time where the work starts, in seconds since the epoch (UTC)
+        :param duration: The duration of the work in seconds
+        :return: The time in seconds until the work is done
+        """
+        validate_condition(any(d > 0 for d in self.__weekday_densities) and any(d > 0 for d in self.__hour_densities),
+                           "The densities of the calendar are zero at all times.")
+        delay = 0.0
+        t = timestamp
+        while duration >= 0.0001:
+            remaining_hour = SECONDS_PER_HOUR - (t % SECONDS_PER_HOUR)
+            density = self.get_density(t)
+            if duration < remaining_hour * density:
+                return delay + duration / density
+            delay += remaining_hour
+            t += remaining_hour
+            duration -= remaining_hour * density
+        return delay
 
     @classmethod
     def StandardDensity(cls):
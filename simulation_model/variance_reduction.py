@@ -0,0 +1,193 @@
+import zlib
+
+import numpy
+
+from simulation_model.replications import get_statistics, summarize_replications, ReplicationResult
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator, VALUATION_PURPOSE
+from utils.validators import validate_condition
+
+# the purposes of the random streams besides those of the draws of a case
+ARRIVAL_PURPOSE = "arrival"
+STRATIFICATION_PURPOSE = "stratification"
+LARGEST_UNIFORM = numpy.nextafter(1.0, 0.0)
+
+
+def get_purpose_key(purpose: str, purpose_id: str = None) -> int:
+    """
+    Get a stable number for the purpose of a random stream, e.g., the delays of one activity.
+
+    :param purpose: The purpose
+    :param purpose_id: The activity or attribute the stream is for, if any
+    :return: The number
+    """
+    name = purpose if purpose_id is None else "{0}:{1}".format(purpose, purpose_id)
+    return zlib.crc32(name.encode())
+
+
+class InverseTransformGenerator:
+
+    def __init__(self, generator, antithetic: bool = False, stratum: int = None, number_of_strata: int = None):
+        """
+        A random generator that derives all draws from uniform numbers by inverse transform sampling,
+        so that a run and its antithetic run (which uses 1 - u for every uniform u) are negatively correlated
+        draw by draw. It offers the draws the simulator needs: random, integers and exponential.
+
+        :param generator: The generator of the uniform numbers (a numpy.random.Generator)
+        :param antithetic: Whether to use 1 - u instead of u
+        :param stratum: If this is given, the first uniform number is taken from the stratum
+            [stratum / number_of_strata, (stratum + 1) / number_of_strata)
+        :param number_of_strata: The number of strata
+        """
+        self.__generator = generator
+        self.__antithetic = antithetic
+        self.__stratum = stratum
+        self.__number_of_strata = number_of_strata
+
+    def __uniform(self) -> float:
+        u = self.__generator.random()
+        if self.__stratum is not None:
+            u = (self.__stratum + u) / self.__number_of_strata
+            self.__stratum = None
+        return 1 - u if self.__antithetic else u
+
+    def random(self) -> float:
+        return self.__uniform()
+
+    def integers(self, high: int) -> int:
+        return min(int(self.__uniform() * high), high - 1)
+
+    def exponential(self, scale: float) -> float:
+        # u < 1, so that the logarithm is finite
+        return -scale * numpy.log1p(-min(self.__uniform(), LARGEST_UNIFORM))
+
+
+class RandomStreams:
+
+    def __validate(self):
+        validate_condition(not self.__stratified_attribute_ids or self.__number_of_cases is not None,
+                           "Stratified sampling needs the number of cases.")
+
+    def __init__(self, seed, antithetic: bool = False, stratified_attribute_ids: list[str] = None,
+                 number_of_cases: int = None, first_case_id: int = 1):
+        """
+        Dedicated random streams for each case and purpose: the arrivals, the choices between enabled transitions,
+        the delays of each activity, and the valuation of each attribute. Two simulations with the same seed thus
+        use the same random numbers for the same purpose in the same case (common random numbers), even if they
+        differ in parameters that change how many numbers are drawn elsewhere.
+
+        :param seed: The root seed (an int)
+        :param antithetic: Whether to use antithetic uniform numbers (see InverseTransformGenerator)
+        :param stratified_attribute_ids: Attributes (without parameters) whose valuations are stratified over the
+            cases: the uniform numbers of the cases are spread evenly over [0, 1), in a random order
+        :param number_of_cases: The number of cases, which is needed for stratification
+        :param first_case_id: The id of the first case, which is needed for stratification
+        """
+        self.__seed_sequence = numpy.random.SeedSequence(seed)
+        self.__antithetic = antithetic
+        self.__stratified_attribute_ids = list(stratified_attribute_ids or [])
+        self.__number_of_cases = number_of_cases
+        self.__first_case_id = first_case_id
+        self.__validate()
+        self.__strata = {
+            attr_id: self.__get_numpy_generator(get_purpose_key(STRATIFICATION_PURPOSE, attr_id)).permutation(
+                number_of_cases)
+            for attr_id in self.__stratified_attribute_ids
+        }
+
+    def __get_numpy_generator(self, *spawn_key: int):
+        return numpy.random.default_rng(numpy.random.SeedSequence(
+            self.__seed_sequence.entropy, spawn_key=spawn_key))
+
+    def is_antithetic(self) -> bool:
+        return self.__antithetic
+
+    def get_arrival_generator(self) -> InverseTransformGenerator:
+        """
+        :return: The generator of the arrival times of all cases
+        """
+        return InverseTransformGenerator(self.__get_numpy_generator(get_purpose_key(ARRIVAL_PURPOSE)),
+                                         self.__antithetic)
+
+    def get_case_generator(self, case_id: int, purpose: str, purpose_id: str = None) -> InverseTransformGenerator:
+        """
+        Get the generator of a case for a purpose.
+
+        :param case_id: The case
+        :param purpose: CHOICE_PURPOSE, DELAY_PURPOSE or VALUATION_PURPOSE
+        :param purpose_id: The activity (of a delay) or attribute (of a valuation)
+        :return: The generator
+        """
+        stratum = None
+        if purpose == VALUATION_PURPOSE and purpose_id in self.__strata:
+            case_index = case_id - self.__first_case_id
+            if 0 <= case_index < self.__number_of_cases:
+                stratum = int(self.__strata[purpose_id][case_index])
+        return InverseTransformGenerator(self.__get_numpy_generator(get_purpose_key(purpose, purpose_id), case_id),
+                                         self.__antithetic, stratum, self.__number_of_cases)
+
+    def get_antithetic(self):
+        """
+        :return: The antithetic counterpart of these streams
+        """
+        return RandomStreams(self.__seed_sequence.entropy, not self.__antithetic, self.__stratified_attribute_ids,
+                             self.__number_of_cases, self.__first_case_id)
+
+
+def run_with_streams(model: SimulationModel, random_streams: RandomStreams, replication_index: int = 0) \
+        -> ReplicationResult:
+    """
+    Simulate a model with dedicated random streams.
+
+    :param model: The simulation model
+    :param random_streams: The streams
+    :param replication_index: The index of the run
+    :return: The result
+    """
+    simulation_parameters = model.get_simulation_parameters()
+    simulator = Simulator(model.get_petri_net(),
+                          model.get_causal_model(),
+                          simulation_parameters,
+                          random_streams.get_arrival_generator(),
+                          first_case_id=simulation_parameters.first_case_id,
+                          first_event_id=simulation_parameters.first_event_id,
+                          random_streams=random_streams)
+    events = simulator.run()
+    return ReplicationResult(replication_index, events, get_statistics(simulator.get_completed_cases(), events))
+
+
+def compare_models(model: SimulationModel, other_model: SimulationModel, n: int, seed=None,
+                   antithetic: bool = False, stratified_attribute_ids: list[str] = None) -> dict[str, dict[str, float]]:
+    """
+    Compare two variants of a model (e.g., with other simulation parameters or valuations) by paired runs:
+    run i of both variants uses the same random streams, so that the noise they share cancels out in the
+    differences of their statistics. With antithetic variates, the runs come in pairs whose second run uses
+    the antithetic streams of the first, and the differences of a pair are averaged into one observation.
+
+    :param model: The first variant
+    :param other_model: The second variant
+    :param n: The number of runs of each variant (even, with antithetic variates)
+    :param seed: The root seed (an int, or None for fresh entropy)
+    :param antithetic: Whether to use antithetic pairs of runs
+    :param stratified_attribute_ids: Attributes (without parameters) whose valuations are stratified over the cases
+    :return: For each statistic, the mean, standard deviation and standard error of the differences
+        (other_model minus model), as summarize_replications computes them
+    """
+    validate_condition(not antithetic or n % 2 == 0, "Antithetic runs come in pairs, so n must be even.")
+    simulation_parameters = model.get_simulation_parameters()
+    number_of_streams = n // 2 if antithetic else n
+    seeds = [int(s.generate_state(1)[0]) for s in numpy.random.SeedSequence(seed).spawn(number_of_streams)]
+    differences = []
+    for i, stream_seed in enumerate(seeds):
+        random_streams = RandomStreams(stream_seed, False, stratified_attribute_ids,
+                                       simulation_parameters.number_of_cases, simulation_parameters.first_case_id)
+        stream_variants = [random_streams, random_streams.get_antithetic()] if antithetic else [random_streams]
+        statistics = []
+        for streams in stream_variants:
+            result = run_with_streams(model, streams, i).statistics
+            other_result = run_with_streams(other_model, streams, i).statistics
+            names = list(result) + [name for name in other_result if name not in result]
+            statistics.append({name: other_result.get(name, 0.0) - result.get(name, 0.0) for name in names})
+        differences.append(ReplicationResult(
+            i, [], {name: float(numpy.mean([s.get(name, 0.0) for s in statistics])) for name in statistics[0]}))
+    return summarize_replications(differences)
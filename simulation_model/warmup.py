@@ -0,0 +1,85 @@
+import numpy
+
+from simulation_model.sequential import CycleTimeKPI
+from simulation_model.simulation_model import SimulationModel
+from simulation_model.simulator import Simulator
+from utils.validators import validate_condition
+
+MSER_BATCH_SIZE = 5
+
+
+def get_mser_truncation_point(values, batch_size: int = MSER_BATCH_SIZE) -> int:
+    """
+    Find the number of initial observations of an output stream to discard as warm-up by the MSER rule
+    (MSER-5 for batches of 5): the observations are averaged in batches, and the truncation point d minimizes
+    the squared standard error of the mean of the remaining batch means, sum((z_i - mean)^2) / (k - d)^2.
+    Only truncation points in the first half of the stream are considered, since a minimum in the second half
+    means that the stream is too short to reach a steady state.
+
+    :param values: The observations, in the order they were produced
+    :param batch_size: The number of observations per batch
+    :return: The number of observations to discard (a multiple of the batch size)
+    """
+    validate_condition(batch_size >= 1, "The batch size must be positive.")
+    values = numpy.asarray(values, dtype=float)
+    k = len(values) // batch_size
+    validate_condition(k >= 2, "At least two batches of observations are needed.")
+    batch_means = values[:k * batch_size].reshape(k, batch_size).mean(axis=1)
+    # the sums over the batch means from each truncation point to the end
+    tail_sums = numpy.cumsum(batch_means[::-1])[::-1]
+    tail_square_sums = numpy.cumsum((batch_means ** 2)[::-1])[::-1]
+    remaining = numpy.arange(k, 0, -1, dtype=float)
+    statistics = (tail_square_sums - tail_sums ** 2 / remaining) / remaining ** 2
+    # the sums of squares can come out slightly negative by cancellation
+    statistics = numpy.maximum(statistics, 0.0)
+    return int(numpy.argmin(statistics[:k // 2 + 1])) * batch_size
+
+
+class WarmupResult:
+
+    def __init__(self, truncation_point: int, warmup_time: float, number_of_observations: int):
+        """
+        The warm-up period of a simulation, as detected in a pilot run.
+
+        :param truncation_point: The number of completed cases (in the order of completion) to discard
+        :param warmup_time: The time at which the last discarded case completed, in seconds of model time.
+            Cases that arrive later are considered to be in the steady state.
+        :param number_of_observations: The number of completed cases of the pilot run
+        """
+        self.truncation_point = truncation_point
+        self.warmup_time = warmup_time
+        self.number_of_observations = number_of_observations
+
+
+def detect_warmup(model: SimulationModel, kpi=None, seed=None, batch_size: int = MSER_BATCH_SIZE) -> WarmupResult:
+    """
+    Detect the warm-up period of a model by a pilot run: since every simulation starts with an empty system,
+    the first cases are not representative for the steady state. The KPI of each completed case of the pilot run
+    is observed in the order of completion, and the truncation point is found by the MSER rule
+    (see get_mser_truncation_point). The warm-up time can be passed to a Simulator (or to run_replications,
+    run_sharded, and SimulationModel.to_CPN), so that the events of cases that arrive during the warm-up period
+    are not written at all.
+
+    :param model: The simulation model
+    :param kpi: The KPI of a case to observe (see sequential). If this is None, the cycle time is observed.
+    :param seed: The seed of the pilot run (an int, or None for fresh entropy)
+    :param batch_size: The number of observations per batch
+    :return: The warm-up period
+    """
+    kpi = CycleTimeKPI() if kpi is None else kpi
+    simulation_parameters = model.get_simulation_parameters()
+    simulator = Simulator(model.get_petri_net(), model.get_causal_model(), simulation_parameters,
+                          numpy.random.default_rng(seed),
+                          first_case_id=simulation_parameters.first_case_id,
+                          first_event_id=simulation_parameters.first_event_id,
+                          keep_completed_cases=False)
+    values = []
+    completion_times = []
+    for case, events in simulator.iter_completed_cases():
+        value = kpi.get_value(case, events)
+        if value is not None:
+            values.append(value)
+            completion_times.append(case.completion_time)
+    truncation_point = get_mser_truncation_point(values, batch_size)
+    warmup_time = max(completion_times[:truncation_point], default=0.0)
+    return WarmupResult(truncation_point, warmup_time, len(values))
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from event_log.trace_index import TraceIndex
+from simulation_model.functions import get_event_table_file_path
+from simulation_model.simulator import VALUE_SEPARATOR, EVENT_TABLE_COLUMNS, merge_event_tables
+
+
+def write_event_table(path: str, rows: list[list[str]]):
+    with open(path, "w") as file:
+        file.write(VALUE_SEPARATOR.join(EVENT_TABLE_COLUMNS) + "\n")
+        for row in rows:
+            file.write(VALUE_SEPARATOR.join(row) + "\n")
+
+
+class TraceIndexTest(unittest.TestCase):
+
+    def test_merged_shard_tables_are_indexed_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shard_table_paths = [
+                os.path.join(directory, os.path.basename(get_event_table_file_path("a", "m_shard{0}".format(i))))
+                for i in range(2)
+            ]
+            write_event_table(shard_table_paths[0], [["EVENT1", "CASE1", "a", "2024-01-01 08:00:00"]])
+            write_event_table(shard_table_paths[1], [["EVENT1000001", "CASE2", "a", "2024-01-01 09:00:00"]])
+            merged_table_path = os.path.join(directory, os.path.basename(get_event_table_file_path("a", "m")))
+            merge_event_tables(shard_table_paths, merged_table_path)
+            index = TraceIndex.build(directory, "m")
+            self.assertEqual(index.get_number_of_cases(), 2)
+            self.assertEqual(index.get_variants(), [(["a"], 2, [1, 2])])
+            self.assertEqual([path for path, _ in index.get_case_locations(1)], [merged_table_path])
+            self.assertEqual(index.read_case(2), [["EVENT1000001", "CASE2", "a", "2024-01-01 09:00:00"]])
+
+    def test_shard_tables_are_replaced_by_merged_tables(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shard_table_path = os.path.join(directory, os.path.basename(get_event_table_file_path("a", "m_shard0")))
+            write_event_table(shard_table_path, [["EVENT1", "CASE1", "a", "2024-01-01 08:00:00"]])
+            index = TraceIndex.build(directory, "m")
+            self.assertEqual(index.get_variants(), [(["a"], 1, [1])])
+            self.assertEqual([path for path, _ in index.get_case_locations(1)], [shard_table_path])
+            merged_table_path = os.path.join(directory, os.path.basename(get_event_table_file_path("a", "m")))
+            merge_event_tables([shard_table_path], merged_table_path)
+            index = TraceIndex.build(directory, "m")
+            self.assertEqual(index.get_variants(), [(["a"], 1, [1])])
+            self.assertEqual([path for path, _ in index.get_case_locations(1)], [merged_table_path])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,6 @@
+import math
+
+
 def cumulative_distribution(prob_dist: dict[str, float]):
     """
     Takes a discrete probability distribution as a dictionary, and
@@ -13,3 +16,105 @@ def cumulative_distribution(prob_dist: dict[str, float]):
         cumulative += prob
         cum_dist[key] = cumulative
     return cum_dist
+
+
+def regularized_upper_gamma(a: float, x: float) -> float:
+    """
+    The regularized upper incomplete gamma function Q(a, x), by its series for x < a + 1
+    and by its continued fraction otherwise (see Numerical Recipes, 6.2).
+
+    :param a: The shape (positive)
+    :param x: The lower limit of integration (non-negative)
+    :return: Q(a, x)
+    """
+    if x <= 0:
+        return 1.0
+    log_prefactor = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = 1 / a
+        total = term
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_prefactor))
+    # modified Lentz's method
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    i = 0
+    while True:
+        i += 1
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15 or i > 10000:
+            break
+    return math.exp(log_prefactor) * h
+
+
+def chi2_survival(statistic: float, degrees_of_freedom: float) -> float:
+    """
+    The probability that a chi-square distributed variable exceeds a statistic, i.e., the p-value of a
+    chi-square or G-test.
+
+    :param statistic: The statistic
+    :param degrees_of_freedom: The degrees of freedom (positive)
+    :return: The probability
+    """
+    return regularized_upper_gamma(degrees_of_freedom / 2, statistic / 2)
+
+
+def normal_quantile(p: float) -> float:
+    """
+    The quantile function of the standard normal distribution, by Acklam's rational approximation
+    (relative error below 1.2e-9).
+
+    :param p: The probability, in (0, 1)
+    :return: The quantile
+    """
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+    p_low = 0.02425
+    if p < p_low:
+        q = math.sqrt(-2 * math.log(p))
+        return (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+            ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    if p > 1 - p_low:
+        return -normal_quantile(1 - p)
+    q = p - 0.5
+    r = q * q
+    return (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+        (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+
+
+def student_t_quantile(p: float, degrees_of_freedom: int) -> float:
+    """
+    The quantile function of Student's t-distribution, by the Cornish-Fisher expansion around the normal quantile
+    (Abramowitz and Stegun, 26.7.5), which is accurate to about 1e-3 from 3 degrees of freedom on.
+
+    :param p: The probability, in (0, 1)
+    :param degrees_of_freedom: The degrees of freedom (positive)
+    :return: The quantile
+    """
+    z = normal_quantile(p)
+    n = degrees_of_freedom
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / n + g2 / n ** 2 + g3 / n ** 3 + g4 / n ** 4